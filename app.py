@@ -9,11 +9,35 @@ from datetime import datetime
 from gtts import gTTS
 import os
 import base64
-from math import log
 import uuid
 from fpdf import FPDF
-import math
 import time
+import threading
+import json
+import hashlib
+import html
+import logging
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, TimeoutError, wait
+from sense.calibration import (THRESHOLDS, BIOMARKER_KEYS, DEFAULT_CALIBRATION_CURVES, CALIBRATION_PARITY_TOLERANCE,
+                               calibrate, benchmark_calibration)
+from sense.scoring import crs_indices, crs_score, crs_scores, get_risk_label, risk_cutoffs
+from sense.vision import (ROI_FIRST_EXTRACTION, ROI_PARITY_TOLERANCE, STRIP_REGISTRATION, DECODE_TARGET_LONG_SIDE,
+                          TRAY_DECODE_TARGET, capture_device_id, strip_template_key, render_preview, decode_scale_report,
+                          compare_extraction_paths)
+from sense.intake import pid_from_filename, iter_strip_uploads
+from sense.archive import ARCHIVE_ROOT, StripArchive
+from sense.quality import QUALITY_GATE
+from sense.capture import (CAPTURE_STABLE_FRAMES, CAPTURE_STABLE_TOLERANCE, CapturedFrame, LatestFrameGrabber,
+                           capture_until_stable)
+from sense import db as sense_db
+from sense.db import DB_PATH, load_calibration_lut, patient_names, insert_reading
+from sense.connections import ConnectionManager, ConnectionPoolTimeout, GroupCommitWriter
+from sense import queries
+from sense.backfill import rescore_readings
+from sense.workers import (POOL_WORKERS, POOL_QUEUE_DEPTH, POOL_JOB_TIMEOUT_S, ScanPool, PoolSaturatedError,
+                           analyze_job, extract_job, tray_job)
 
 def login_page():
   
@@ -95,8 +119,8 @@ def login_page():
         
 
         if st.button("INITIALIZE AUTHENTICATION", use_container_width=True):
-            c.execute("SELECT * FROM users WHERE username=? AND password=?", (user, pw))
-            result = c.fetchone()
+            with db_read() as db:
+                result = queries.fetch_one(db, 'user_login', (user, pw))
             if result:
                 st.session_state['logged_in'] = True
                 st.session_state['user_role'] = result[2]
@@ -514,81 +538,46 @@ def speak(text):
 import sqlite3
 
 # --- DATABASE ARCHITECTURE ---
-def init_db():
+# Schema and shared clinical queries live in sense.db (also used by `python -m sense`).
+# Sessions borrow a pooled connection per request instead of sharing one cursor.
+@st.cache_resource
+def db_manager():
+    """Process-wide connection manager: pooled read-only connections plus one serialised writer."""
+    return ConnectionManager(DB_PATH)
+
+def db_read():
+    return db_manager().read()
+
+def db_write():
+    """One write transaction: commits on exit, rolls back if the block raises."""
+    return db_manager().write()
+
+@st.cache_resource
+def db_writer():
+    """Process-wide group-commit queue for scan and care-plan writes; flushed at interpreter exit."""
+    return GroupCommitWriter(db_manager())
+
+def db_submit(fn, *args):
     """
-    Initializes a resilient relational schema.
-    Enhancements: Added timeout and isolation levels for concurrent clinical access.
+    Queues fn(db_conn, *args) for the next group commit and waits for it to be
+    committed. Returns fn's result, or re-raises its exception after its writes
+    have been rolled back.
     """
-    db_conn = sqlite3.connect('sense_health.db', check_same_thread=False, timeout=10)
-    db_conn.row_factory = sqlite3.Row
-    db_cursor = db_conn.cursor()
-
-    # --- 1. USER AUTHENTICATION TABLE ---
-    db_cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT,
-            role TEXT
-        )
-    ''')
-    
-    # Default Credentials Check
-    db_cursor.execute("SELECT * FROM users")
-    if not db_cursor.fetchone():
-        db_cursor.execute("INSERT INTO users VALUES (?, ?, ?)", ("admin", "admin123", "Doctor"))
-    
-    # --- 2. PATIENT REGISTRY (MASTER DATA) ---
-    db_cursor.execute('''
-        CREATE TABLE IF NOT EXISTS patients (
-            pid TEXT PRIMARY KEY, 
-            name TEXT, 
-            phone TEXT,
-            address TEXT,
-            join_date TEXT, 
-            streak INTEGER DEFAULT 0
-        )
-    ''')
-
-    # --- AUTO-MIGRATION LOGIC---
-    db_cursor.execute("PRAGMA table_info(patients)")
-    columns = [column[1] for column in db_cursor.fetchall()]
-    if 'phone' not in columns:
-        db_cursor.execute('ALTER TABLE patients ADD COLUMN phone TEXT')
-    if 'address' not in columns:
-        db_cursor.execute('ALTER TABLE patients ADD COLUMN address TEXT')
-    
-    # --- 3. 5-PLEX DIAGNOSTIC REPOSITORY (READINGS) ---
-    db_cursor.execute('''
-        CREATE TABLE IF NOT EXISTS readings (
-            pid TEXT, 
-            name TEXT, 
-            glucose REAL, 
-            hb REAL, 
-            ntprobnp REAL, 
-            lpa REAL, 
-            troponin REAL, 
-            score REAL, 
-            timestamp DATETIME,
-            FOREIGN KEY (pid) REFERENCES patients(pid)
-        )
-    ''')
-
-    # --- 4. CARE PLAN REPOSITORY (PHYSICIAN NOTES) ---
-    db_cursor.execute('''
-        CREATE TABLE IF NOT EXISTS care_plans (
-            pid TEXT PRIMARY KEY,
-            nutrition TEXT,
-            activity TEXT,
-            supplements TEXT,
-            last_updated DATETIME,
-            FOREIGN KEY (pid) REFERENCES patients(pid)
-        )
-    ''')
+    return db_writer().write(fn, *args)
 
-    db_conn.commit()
-    return db_conn, db_cursor
+REGISTRY_COUNTERS_TTL_S = 30
+ROLLUP_LABELS = {'day': "daily", 'week': "weekly", 'month': "monthly"}
 
-conn, c = init_db()
+@st.cache_data(ttl=REGISTRY_COUNTERS_TTL_S, show_spinner=False)
+def registry_counters():
+    """
+    Sidebar figures (sense.db.registry_counters), shared by every session for
+    REGISTRY_COUNTERS_TTL_S. Local registrations, scan commits and model
+    switches clear it so their own figures show up at once.
+    """
+    model_key, _, model = active_scoring_model()
+    with db_read() as db:
+        return sense_db.registry_counters(db.cursor(), model_key, risk_cutoffs(model)[0])
 
 # --- LOGIN SYSTEM LOGIC ---
 
@@ -658,8 +647,8 @@ def login_page():
             submit = st.form_submit_button("🚀 INITIALIZE SYSTEM ACCESS", use_container_width=True)
             
             if submit:
-                c.execute("SELECT * FROM users WHERE username=? AND password=?", (u_name, u_pass))
-                user_record = c.fetchone()
+                with db_read() as db:
+                    user_record = queries.fetch_one(db, 'user_login', (u_name, u_pass))
                 
                 if user_record:
                     st.session_state['logged_in'] = True
@@ -698,77 +687,190 @@ if st.sidebar.button("🚪 TERMINATE SESSION", use_container_width=True):
     
 # --- ANALYTICS & BIOMARKER INTELLIGENCE ENGINE ---
 
-# Clinical Reference Ranges (Architectural Constants - Do Not Modify)
-THRESHOLDS = {
-    'glucose':  {'normal': 100,  'high': 140,  'label': 'Blood Glucose', 'unit': 'mg/dL'},  # Abnormal > 140
-    'hb':       {'normal': 14,   'high': 12,   'label': 'Hemoglobin',    'unit': 'g/dL'},   # Abnormal < 12
-    'ntprobnp': {'normal': 100,  'high': 125,  'label': 'NT-proBNP',     'unit': 'pg/mL'},  # Abnormal > 125
-    'lpa':      {'normal': 190,  'high': 200,  'label': 'Total Serum Cholesterol',  'unit': 'mg/dL'},  # High Risk > 200
-    'troponin': {'normal': 0.01, 'high': 0.04, 'label': 'Troponin I',    'unit': 'ng/mL'}   # Abnormal > 0.04
-}
+def active_scoring_model():
+    """(model_key, model_id, spec) the pages score and label with: one pointer lookup per rerun."""
+    with db_read() as db:
+        return sense_db.active_scoring_model(db.cursor())
 
-def color_to_value(hsv_mean: list, biomarker: str) -> float:
-    """
-    Advanced Colorimetric Mapping Engine.
-    Converts ROI pixel intensity (HSV Space) into clinically calibrated values.
-    
-    Safety Enhancements: 
-    - Type hinting for IDE optimization.
-    - Bound-clipping to prevent non-physiological results.
-    - Floating-point precision rounding.
-    """
+def calculate_crs(vals, model=None):
+    """CRS of one reading under `model` (default: the active one). Bulk paths call crs_scores() instead."""
     try:
-        saturation_intensity = np.clip(hsv_mean[1] / 255.0, 0, 1)
-        
-        t = THRESHOLDS[biomarker]
-
-        if biomarker == 'hb':
-            result = t['normal'] - (saturation_intensity * (t['normal'] - t['high']))
-        else:
-            result = t['normal'] + (saturation_intensity * (t['high'] - t['normal']))
-            
-        return round(float(result), 3)
-        
-    except KeyError:
-        return 0.0
-    except Exception:
-        return 0.0
-@st.cache_data(show_spinner=False)
-def calculate_crs(vals):
-    try:
-        v = [float(x) for x in vals]
-        
-        normalized_vectors = [
-            (v[0] - 70) / 150,               # Glucose
-            (14 - v[1]) / 6,                 # Hemoglobin
-            math.log(max(v[2], 0) + 1) / 6,  # NT-proBNP
-            v[3] / 200,                      # Total Serum Cholesterol
-            v[4] / 0.04                      # Troponin
-        ]
-        
-        s = [np.clip(x, 0, 1) for x in normalized_vectors]
-        
-        final_score = (0.3 * s[0]) + (0.25 * s[1]) + (0.2 * s[2]) + (0.15 * s[3]) + (0.1 * s[4])
-        
-        import logging
-        logging.info(f"CRS Engine - PID: {st.session_state.get('active_pid', 'Unknown')}")
-        logging.info(f"Indices: G:{s[0]:.3f} H:{s[1]:.3f} N:{s[2]:.3f} L:{s[3]:.3f} T:{s[4]:.3f}")
-        
-        return round(float(final_score), 5)
+        model = model or active_scoring_model()[2]
+        final_score = crs_score(vals, model)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            s = crs_indices(vals, model)
+            logging.debug("CRS Engine - PID: %s", st.session_state.get('active_pid', 'Unknown'))
+            logging.debug("Indices: G:%.3f H:%.3f N:%.3f L:%.3f T:%.3f", *s)
+        return final_score
 
     except Exception as e:
         st.error(f"SENSE-CRS Engine Error: {e}")
         return 0.0
 
-def get_risk_label(score):
+# --- STRIP COLORIMETRY PIPELINE ---
+# The pure CV / calibration / scoring code lives in the `sense` package so the
+# analysis worker processes can import it without Streamlit. This section only
+# holds the parts that need the database or process-wide caches.
+CALIBRATION_LRU_SIZE = 16
+STRIP_TEMPLATE_CACHE_SIZE = 64
+ANALYSIS_CACHE_ENTRIES = 256
+
+@lru_cache(maxsize=CALIBRATION_LRU_SIZE)
+def load_profile_lut(profile_id):
+    """Profile curves compiled to a LUT. Profiles are append-only, so the cache never goes stale."""
+    with db_read() as db:
+        return load_calibration_lut(db.cursor(), profile_id)
+
+def resolve_calibration_profile(device, strip_lot):
+    with db_read() as db:
+        return sense_db.resolve_calibration_profile(db.cursor(), device, strip_lot)
+
+def save_calibration_profile(device, strip_lot, curves):
+    with db_write() as db:
+        return sense_db.save_calibration_profile(db.cursor(), device, strip_lot, curves)
+
+@st.cache_resource
+def scan_pool():
+    """Process-wide analysis worker pool shared by every session."""
+    return ScanPool(POOL_WORKERS, POOL_QUEUE_DEPTH)
+
+@st.cache_resource
+def strip_archive():
+    """Content-addressed raw strip image store (SENSE_ARCHIVE_DIR); readings link to it via image_hash."""
+    return StripArchive(ARCHIVE_ROOT)
+
+@st.cache_resource
+def strip_template_cache():
+    """Process-wide LRU of registration quads keyed by (device, encoded frame size, decode scale)."""
+    return OrderedDict(), threading.Lock()
+
+@st.cache_resource
+def analysis_cache():
+    """
+    Process-wide LRU of finished scans keyed by (content hash, calibration profile, engine settings),
+    so reruns reuse the values and encoded preview instead of going back to the pool.
+    """
+    return OrderedDict(), threading.Lock()
+
+def lru_get(store, key):
+    cache, lock = store
+    with lock:
+        if key in cache:
+            cache.move_to_end(key)
+        return cache.get(key)
+
+def lru_put(store, key, value, maxsize):
+    cache, lock = store
+    with lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+def wait_for_analysis(fut, pool, timeout=POOL_JOB_TIMEOUT_S):
+    """
+    Polls a pool future, driving a progress bar from the pool's median latency
+    so the page stays responsive. Raises TimeoutError (the concurrent.futures
+    one, which is not the builtin before Python 3.11) past `timeout` seconds.
+    """
+    expected = (pool.expected_latency_ms() or 1000) / 1000
+    bar = st.progress(0.0, text="📡 Queued for colorimetry...")
+    t0 = time.perf_counter()
+    try:
+        while True:
+            try:
+                return fut.result(timeout=0.1)
+            except TimeoutError:
+                elapsed = time.perf_counter() - t0
+                if elapsed > timeout:
+                    fut.cancel()
+                    raise TimeoutError(f"Strip analysis exceeded {timeout:.0f}s")
+                bar.progress(min(elapsed / expected, 0.95), text=f"🔬 Analyzing strip... {elapsed:.1f}s")
+    finally:
+        bar.empty()
+
+def quality_caption(quality):
+    m, t = quality['metrics'], quality['timings_ms']
+    checks = " · ".join(f"{k} {v:.1f} ms" for k, v in t.items() if k != 'total')
+    return (f"🔎 QUALITY GATE: {t['total']:.1f} ms ({checks}) | sharpness {m.get('focus', 0):.0f} · "
+            f"brightness {m.get('brightness', 0):.0f} · pad glare {m.get('glare', 0):.0%}")
+
+def patient_card_html(row):
+    """Directory card for one patient row (a namedtuple); values are HTML-escaped so cards can be batched into one element."""
+    name, pid, join_date, phone, address = (html.escape(str(v if v is not None else ""))
+                                            for v in (str(row.name or "").upper(), row.pid, row.join_date, row.phone, row.address))
+    return f"""<div class="patient-card">
+    <div style="display: flex; justify-content: space-between; align-items: start;">
+        <div>
+            <span class="status-badge">Verified Entry</span>
+            <div style="font-size: 1.6em; font-weight: 800; color: #f5f5f5; margin-top: 10px;">{name}</div>
+            <code style="color: #4db6ac; background: none; font-size: 1.1em;">UID: {pid}</code>
+        </div>
+        <div style="text-align: right;">
+            <small style="color: #455a64; font-weight: 900;">ENTRY DATE</small><br>
+            <span style="color: #90a4ae; font-family: monospace;">{join_date}</span>
+        </div>
+    </div>
+    <div style="margin-top: 20px; display: grid; grid-template-columns: 1fr 1fr; gap: 30px; border-top: 1px solid #2d2f39; padding-top: 15px;">
+        <div>
+            <small style="color: #546e7a; font-weight: bold; text-transform: uppercase; font-size: 0.8em;">Secure Contact</small><br>
+            <span style="color: #cfd8dc; font-size: 1.1em;">📞 {phone}</span>
+        </div>
+        <div>
+            <small style="color: #546e7a; font-weight: bold; text-transform: uppercase; font-size: 0.8em;">Verified Address</small><br>
+            <span style="color: #cfd8dc; font-size: 1.1em;">📍 {address}</span>
+        </div>
+    </div>
+</div>
+"""
 
-    if score >= 0.75: 
-        return "CRITICAL ALERT", "#FF3131"  # High-intensity red
-    if score >= 0.50: 
-        return "ELEVATED RISK", "#FF9100"  # Clinical orange
-    if score >= 0.25: 
-        return "INCIPIENT", "#00D1FF"      # Warning/Early detection blue
-    return "STABLE / OPTIMAL", "#00FF80"   # Healthy green
+def run_batch_scan(jobs, strip_lot=None, on_progress=None):
+    """
+    Fans strip images out across the analysis pool, keeping at most half the
+    queue depth in flight so interactive single scans are never starved, then
+    calibrates the strips of each resolved profile in one vectorised call and
+    scores them. Returns one result dict per (name, pid, pname, bytes, image_hash) job.
+    """
+    pool, templates = scan_pool(), strip_template_cache()
+    window = max(1, pool.queue_depth // 2)
+    pending, results = {}, []
+
+    def collect(fut):
+        name, pid, pname, image_hash, device, tkey = pending.pop(fut)
+        try:
+            r = fut.result()
+            if r['rejected']:
+                raise ValueError("🚫 " + " ".join(r['quality']['reasons']))
+            if r['quad'] is not None and not r['reused']:
+                lru_put(templates, tkey, r['quad'], STRIP_TEMPLATE_CACHE_SIZE)
+            results.append({'file': name, 'pid': pid, 'name': pname, 'image_hash': image_hash, 'hsv': r['hsv'],
+                            'profile_id': resolve_calibration_profile(device, strip_lot),
+                            'vals': None, 'score': None, 'ms': r['worker_ms'], 'error': None})
+        except Exception as e:
+            results.append({'file': name, 'pid': pid, 'name': pname, 'image_hash': image_hash,
+                            'vals': None, 'score': None, 'ms': None, 'error': str(e)})
+        if on_progress:
+            on_progress(len(results), len(jobs))
+
+    for name, pid, pname, data, image_hash in jobs:
+        while len(pending) >= window:
+            for fut in wait(pending, return_when=FIRST_COMPLETED).done:
+                collect(fut)
+        device = capture_device_id(data)
+        tkey = strip_template_key(device, data)
+        fut = pool.submit(extract_job, data, DECODE_TARGET_LONG_SIDE, lru_get(templates, tkey), block=True)
+        pending[fut] = (name, pid, pname, image_hash, device, tkey)
+    while pending:
+        for fut in wait(pending, return_when=FIRST_COMPLETED).done:
+            collect(fut)
+
+    ok, model = [r for r in results if r['error'] is None], active_scoring_model()[2]
+    for profile_id in {r['profile_id'] for r in ok}:
+        group = [r for r in ok if r['profile_id'] == profile_id]
+        values = calibrate(np.stack([r['hsv'] for r in group]), load_profile_lut(profile_id))
+        for r, vals, score in zip(group, values.tolist(), crs_scores(values, model).tolist()):
+            r['vals'], r['score'] = vals, score
+    return results
 
 add_logo()
 
@@ -817,12 +919,15 @@ page = st.sidebar.selectbox("🧭 OPERATIONAL VIEW", [
 
 st.sidebar.write("---")
 
-c.execute("SELECT COUNT(*) FROM patients")
-total_p = c.fetchone()[0]
+counters = registry_counters()
 
 with st.sidebar.container():
     st.markdown('<div class="sidebar-stat-card">', unsafe_allow_html=True)
-    st.metric("Total Registry", f"{total_p} Patients", delta=f"{total_p} Active", delta_color="normal")
+    st.metric("Total Registry", f"{counters['patients']} Patients",
+              delta=f"{counters['active']} Active ({counters['active_days']}d)", delta_color="normal")
+    s1, s2 = st.columns(2)
+    s1.metric("Scans Today", counters['scans_today'])
+    s2.metric("Open Critical", counters['critical'], delta_color="inverse")
     
     st.markdown(f"""
         <hr style="margin: 10px 0; border: 0.1px solid rgba(255,255,255,0.1);">
@@ -918,9 +1023,9 @@ if page == "👤 Patient Registration":
                     new_id = f"SENSE-{uuid.uuid4().hex[:6].upper()}"
                     join_date = datetime.now().strftime('%Y-%m-%d')
                     
-                    c.execute("INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES (?,?,?,?,?,?)", 
-                              (new_id, u_name, u_phone, u_address, join_date, 0))
-                    conn.commit()
+                    with db_write() as db:
+                        queries.execute(db, 'insert_patient', (new_id, u_name, u_phone, u_address, join_date))
+                    registry_counters.clear()
                     
                     speak(f"Registration successful for {u_name}. System ID generated.")
                     
@@ -1012,54 +1117,47 @@ elif page == "📁 Master Patient Directory":
             </div>
         """, unsafe_allow_html=True)
 
-        search_query = st.text_input("", placeholder="🔍 Search by Name, UID, or Address...", label_visibility="collapsed")
+        search_query = st.text_input("", placeholder="🔍 Search by Name, UID, Phone or Address...", label_visibility="collapsed")
 
         if search_query:
-            query = "SELECT * FROM patients WHERE name LIKE ? OR pid LIKE ? OR address LIKE ?"
-            params = (f'%{search_query}%', f'%{search_query}%', f'%{search_query}%')
-            df_p = pd.read_sql(query, conn, params=params)
+            with db_read() as db:
+                df_p = queries.search_patients(db, search_query)
+            if not df_p.empty:
+                lead = f"No exact match for '{search_query}'. Closest" if (df_p['match'] == 'fuzzy').all() else "Top"
+                st.caption(f"{lead} {len(df_p)} matches, ranked by relevance (at most {queries.PATIENT_SEARCH_LIMIT}).")
         else:
-            query = "SELECT * FROM patients ORDER BY join_date DESC"
-            df_p = pd.read_sql(query, conn)
+            # Keyset pagination: the session keeps the stack of page-start cursors, so Next / Prev
+            # are one indexed range read each, however deep into the registry the page is.
+            page_sizes = sorted({10, 25, 50, 100, queries.DIRECTORY_PAGE_SIZE})
+            if st.session_state.get('dir_page_size') not in page_sizes:
+                st.session_state['dir_page_size'] = queries.DIRECTORY_PAGE_SIZE
+            cursors = st.session_state.setdefault('dir_cursors', [None])
+            with db_read() as db:
+                df_p, next_cursor = queries.directory_page(db, cursors[-1], st.session_state['dir_page_size'])
+                registry_size = queries.fetch_value(db, 'patient_count')
+
+            def _directory_next():
+                st.session_state['dir_cursors'].append(next_cursor)
+
+            def _directory_prev():
+                st.session_state['dir_cursors'].pop()
+
+            first = (len(cursors) - 1) * st.session_state['dir_page_size'] + 1
+            n1, n2, n3, n4 = st.columns([1, 2, 1, 1])
+            n1.button("◀ PREV", disabled=len(cursors) == 1, on_click=_directory_prev, use_container_width=True)
+            n2.caption(f"Patients {first}–{first + len(df_p) - 1} of {registry_size}" if not df_p.empty else "")
+            n3.selectbox("Page Size", page_sizes, key='dir_page_size', label_visibility="collapsed",
+                         on_change=lambda: st.session_state.update(dir_cursors=[None]))
+            n4.button("NEXT ▶", disabled=next_cursor is None, on_click=_directory_next, use_container_width=True)
 
         if not df_p.empty:
-            for i, row in df_p.iterrows():
-                st.markdown(f"""
-                    <div class="patient-card">
-                        <div style="display: flex; justify-content: space-between; align-items: start;">
-                            <div>
-                                <span class="status-badge">Verified Entry</span>
-                                <div style="font-size: 1.6em; font-weight: 800; color: #f5f5f5; margin-top: 10px;">{row['name'].upper()}</div> 
-                                <code style="color: #4db6ac; background: none; font-size: 1.1em;">UID: {row['pid']}</code>
-                            </div>
-                            <div style="text-align: right;">
-                                <small style="color: #455a64; font-weight: 900;">ENTRY DATE</small><br>
-                                <span style="color: #90a4ae; font-family: monospace;">{row['join_date']}</span>
-                            </div>
-                        </div>
-                        <div style="
-                            margin-top: 20px; 
-                            display: grid; 
-                            grid-template-columns: 1fr 1fr; 
-                            gap: 30px; 
-                            border-top: 1px solid #2d2f39; 
-                            padding-top: 15px;
-                        ">
-                            <div>
-                                <small style="color: #546e7a; font-weight: bold; text-transform: uppercase; font-size: 0.8em;">Secure Contact</small><br>
-                                <span style="color: #cfd8dc; font-size: 1.1em;">📞 {row['phone']}</span>
-                            </div>
-                            <div>
-                                <small style="color: #546e7a; font-weight: bold; text-transform: uppercase; font-size: 0.8em;">Verified Address</small><br>
-                                <span style="color: #cfd8dc; font-size: 1.1em;">📍 {row['address']}</span>
-                            </div>
-                        </div>
-                    </div>
-                """, unsafe_allow_html=True)
-                
-                if st.button(f"OPEN CLINICAL DOSSIER: {row['pid']}", key=f"btn_{row['pid']}", use_container_width=True):
-                    st.session_state['active_id'] = row['pid']
-                    st.toast(f"Dossier {row['pid']} synchronized.")
+            # One markdown element for the whole page instead of a card element + button per patient.
+            st.markdown("".join(patient_card_html(row) for row in df_p.itertuples(index=False)), unsafe_allow_html=True)
+            d1, d2 = st.columns([3, 1])
+            dossier_pid = d1.selectbox("Clinical Dossier", df_p['pid'], label_visibility="collapsed")
+            if d2.button("OPEN CLINICAL DOSSIER", use_container_width=True):
+                st.session_state['active_id'] = dossier_pid
+                st.toast(f"Dossier {dossier_pid} synchronized.")
         else:
             st.info("No records found in the clinical database.")
 
@@ -1122,59 +1220,370 @@ elif page == "🔬 New Diagnostic Scan":
 
     st.markdown("<h1 style='letter-spacing:-1px;'>🔬 SENSE 5-Plex Diagnostic Engine</h1>", unsafe_allow_html=True)
     
-    input_col1, input_col2 = st.columns([1, 1])
-    with input_col1:
-        p_id = st.text_input("📋 Patient Access ID", placeholder="Enter SENSE-XXXX")
-    with input_col2:
-        file = st.file_uploader("📸 Upload Diagnostic Strip", type=['jpg', 'png', 'jpeg'])
+    scan_mode = st.radio("Acquisition Mode", ["🧪 Single Strip", "🎥 Live Capture", "🧫 Tray Scan", "📦 Batch Camp Upload"], horizontal=True, label_visibility="collapsed")
+
+    if scan_mode == "📦 Batch Camp Upload":
+        file, p_id = None, None
+        batch_files = st.file_uploader("📦 Upload Camp Strip Photos or a .zip Archive", type=['jpg', 'png', 'jpeg', 'zip'],
+                                       accept_multiple_files=True)
+        st.caption("PIDs are read from file names (e.g. `SENSE-84A5FB.jpg`, `SENSE-84A5FB_visit2.png`) and can be corrected below.")
+        batch_lot = st.text_input("🧫 Strip Lot", placeholder="Reagent lot printed on the pouch (optional)", key="batch_lot")
+
+        if batch_files:
+            uploads = list(iter_strip_uploads(batch_files))
+            df_map = pd.DataFrame({'File': [n for n, _ in uploads], 'PID': [pid_from_filename(n) for n, _ in uploads]})
+            df_map = st.data_editor(df_map, disabled=['File'], hide_index=True, use_container_width=True, key="batch_pid_map")
+
+            if st.button(f"🚀 ANALYZE {len(uploads)} STRIPS", use_container_width=True):
+                hashes = [hashlib.sha256(data).hexdigest() for _, data in uploads]
+                with db_read() as db:
+                    registry = patient_names(db.cursor(), df_map['PID'].dropna())
+                    on_file = {(r[0], r[1]) for r in queries.fetch_all(db, 'readings_on_file', (queries.json_list(hashes),))}
+
+                jobs, skipped = [], []
+                for (name, data), pid, image_hash in zip(uploads, df_map['PID'], hashes):
+                    reason = ("PID not registered" if pid not in registry else
+                              "♻️ Already on file" if (pid, image_hash) in on_file else None)
+                    if reason:
+                        skipped.append({'file': name, 'pid': pid, 'name': registry.get(pid), 'vals': None, 'score': None, 'ms': None,
+                                        'error': reason})
+                    else:
+                        on_file.add((pid, image_hash))
+                        jobs.append((name, pid, registry[pid], data, image_hash))
+
+                progress = st.progress(0.0, text="Dispatching strips to the colorimetry pool...")
+                t0 = time.perf_counter()
+                results = run_batch_scan(jobs, batch_lot, lambda done, total: progress.progress(done / total, text=f"Analyzed {done}/{total} strips"))
+
+                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                rows = []
+                committed = True
+                archive, upload_bytes = strip_archive(), {h: d for (_, d), h in zip(uploads, hashes)}
+                try:
+                    # Archive outside the write transaction so the writer is held only for the inserts.
+                    for r in results:
+                        if r['error'] is None:
+                            archive.put(upload_bytes[r['image_hash']], r['image_hash'])
+                    pending = [r for r in results if r['error'] is None]
+
+                    def commit_batch(db):
+                        cur = db.cursor()
+                        return [insert_reading(cur, r['pid'], r['name'], r['vals'], r['score'], ts, r['profile_id'], r['image_hash'])
+                                for r in pending]
+
+                    for r, is_new in zip(pending, db_submit(commit_batch)):
+                        if is_new:
+                            rows.append(r)
+                        else:
+                            r['error'] = "♻️ Already on file"
+                except (sqlite3.Error, OSError, ConnectionPoolTimeout) as e:
+                    st.error(f"❌ Batch commit rolled back, no readings were saved: {e}")
+                    committed, rows = False, []
+                if rows:
+                    registry_counters.clear()
+                elapsed = time.perf_counter() - t0
+                progress.empty()
+
+                b1, b2, b3 = st.columns(3)
+                b1.metric("Readings Committed", len(rows))
+                b2.metric("Throughput", f"{len(jobs) / elapsed if elapsed else 0:.1f} img/s")
+                b3.metric("Skipped / Rejected", len(results) - len(rows) + len(skipped), delta_color="inverse")
+
+                table = []
+                for r in results + skipped:
+                    row = {'File': r['file'], 'PID': r['pid'], 'Patient': r['name'], 'CRS': r['score'],
+                           'Latency (ms)': round(r['ms'], 1) if r['ms'] is not None else None,
+                           'Status': r['error'] or ("✅ COMMITTED" if committed else "ROLLED BACK")}
+                    for i, k in enumerate(BIOMARKER_KEYS):
+                        row[THRESHOLDS[k]['label']] = r['vals'][i] if r['vals'] else None
+                    table.append(row)
+                st.dataframe(pd.DataFrame(table), use_container_width=True, hide_index=True)
+    elif scan_mode == "🧫 Tray Scan":
+        file, p_id = None, None
+        tray_col1, tray_col2 = st.columns([1, 1])
+        with tray_col1:
+            tray_file = st.file_uploader("🧫 Upload Tray Photograph", type=['jpg', 'png', 'jpeg'], key="tray_upload")
+            tray_lot = st.text_input("🧫 Strip Lot", placeholder="Reagent lot printed on the pouch (optional)", key="tray_lot")
+        with tray_col2:
+            assign_mode = st.radio("Patient Assignment", ["By Position", "By QR Label"], horizontal=True, key="tray_assign")
+            tray_pids = st.text_area("PIDs in tray order", placeholder="SENSE-XXXX (one per line)", key="tray_pids",
+                                     disabled=assign_mode != "By Position",
+                                     help="Slots are numbered row by row, left to right. QR labels are read from codes printed on or beside each strip.")
+
+        if tray_file:
+            data = tray_file.getvalue()
+            image_hash = hashlib.sha256(data).hexdigest()
+            read_labels = assign_mode == "By QR Label"
+            tray_key = ('tray', image_hash, read_labels)
+            tray = lru_get(analysis_cache(), tray_key)
+            if tray is None:
+                pool = scan_pool()
+                try:
+                    tray = wait_for_analysis(pool.submit(tray_job, data, TRAY_DECODE_TARGET, read_labels), pool)
+                except PoolSaturatedError:
+                    st.warning("⏳ Colorimetry queue is full, please retry the scan in a moment.")
+                    st.stop()
+                except (TimeoutError, ValueError) as e:
+                    st.error(f"❌ {e}")
+                    st.stop()
+                if not tray['rejected']:
+                    lru_put(analysis_cache(), tray_key, tray, ANALYSIS_CACHE_ENTRIES)
+
+            if tray['rejected']:
+                st.error("🚫 Tray photo rejected before colorimetry. Please retake it:")
+                for reason in tray['quality']['reasons']:
+                    st.markdown(f"- {reason}")
+                st.stop()
+
+            n_slots = len(tray['quads'])
+            st.image(tray['preview'], use_container_width=True)
+            st.caption(f"🧫 {n_slots} strips detected · {tray['worker_ms']:.0f} ms in the pool (1/{tray['decode_scale']} decode)"
+                       + (f" | {quality_caption(tray['quality'])}" if tray['quality'] else ""))
+
+            typed = [p.strip().upper() for p in tray_pids.splitlines() if p.strip()]
+            slot_pids = tray['labels'] if read_labels else (typed + [None] * n_slots)[:n_slots]
+            if not read_labels and len(typed) != n_slots:
+                st.warning(f"⚠️ {len(typed)} PIDs entered for {n_slots} strips; check the slot assignment below.")
+            df_tray = pd.DataFrame({'Slot': range(1, n_slots + 1), 'PID': slot_pids,
+                                    'Image Check': [("🚫 " + r) if r else "✅" for r in tray['slot_reasons']]})
+            df_tray = st.data_editor(df_tray, disabled=['Slot', 'Image Check'], hide_index=True, use_container_width=True,
+                                     key=f"tray_map_{image_hash[:12]}_{assign_mode}")
+
+            if st.button(f"🚀 COMMIT {n_slots} STRIPS", use_container_width=True):
+                slot_pids = [p.strip().upper() if isinstance(p, str) and p.strip() else None for p in df_tray['PID']]
+                with db_read() as db:
+                    registry = patient_names(db.cursor(), [p for p in slot_pids if p])
+                profile_id = resolve_calibration_profile(capture_device_id(data), tray_lot)
+                tray_values, model = calibrate(tray['hsv'], load_profile_lut(profile_id)), active_scoring_model()[2]
+                slot_vals, slot_scores = tray_values.tolist(), crs_scores(tray_values, model).tolist()
+                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+                slots = list(enumerate(zip(slot_pids, slot_vals, slot_scores, tray['slot_reasons']), start=1))
+                statuses = ["🚫 " + reason if reason else "No PID assigned" if not pid else
+                            "PID not registered" if pid not in registry else None for _, (pid, _, _, reason) in slots]
+
+                def commit_tray(db):
+                    cur = db.cursor()
+                    return {slot: insert_reading(cur, pid, registry[pid], vals, score, ts, profile_id, image_hash, slot)
+                            for (slot, (pid, vals, score, _)), status in zip(slots, statuses) if status is None}
+
+                try:
+                    strip_archive().put(data, image_hash)
+                    is_new = db_submit(commit_tray)
+                except (sqlite3.Error, OSError, ConnectionPoolTimeout) as e:
+                    st.error(f"❌ Tray commit rolled back, no readings were saved: {e}")
+                    is_new = None
+                table, committed = [], sum(is_new.values()) if is_new else 0
+                for (slot, (pid, vals, score, _)), status in zip(slots, statuses):
+                    if status is None:
+                        status = "ROLLED BACK" if is_new is None else "✅ COMMITTED" if is_new[slot] else "♻️ Already on file"
+                    row = {'Slot': slot, 'PID': pid, 'Patient': registry.get(pid), 'CRS': score,
+                           'Risk': get_risk_label(score, model)[0], 'Status': status}
+                    for i, k in enumerate(BIOMARKER_KEYS):
+                        row[THRESHOLDS[k]['label']] = vals[i]
+                    table.append(row)
+                if committed:
+                    registry_counters.clear()
+
+                m1, m2 = st.columns(2)
+                m1.metric("Readings Committed", committed)
+                m2.metric("Skipped / Rejected", n_slots - committed, delta_color="inverse")
+                st.dataframe(pd.DataFrame(table), use_container_width=True, hide_index=True)
+    elif scan_mode == "🎥 Live Capture":
+        roi_first, registration, decode_target, quality_gate = ROI_FIRST_EXTRACTION, STRIP_REGISTRATION, DECODE_TARGET_LONG_SIDE, QUALITY_GATE
+        input_col1, input_col2 = st.columns([1, 1])
+        with input_col1:
+            p_id = st.text_input("📋 Patient Access ID", placeholder="Enter SENSE-XXXX", key="live_pid")
+            strip_lot = st.text_input("🧫 Strip Lot", placeholder="Reagent lot printed on the pouch (optional)", key="live_lot")
+        with input_col2:
+            live_source = st.text_input("🎥 Camera", value="0", help="Camera index (0 = default webcam) or a video file path.")
+            lc1, lc2 = st.columns(2)
+            stable_k = lc1.slider("Stable Frames (k)", 3, 15, CAPTURE_STABLE_FRAMES)
+            stable_tol = lc2.slider("Pad Tolerance (sat.)", 1.0, 15.0, CAPTURE_STABLE_TOLERANCE, 0.5)
+
+        if st.button("🎥 START CAPTURE", use_container_width=True):
+            st.session_state.pop('live_capture', None)
+            live_view, live_status = st.empty(), st.empty()
+
+            def show_frame(small, scan, stats):
+                if stats['frames_analyzed'] % 3 == 1:
+                    live_view.image(render_preview(small, scan, max_side=480), use_container_width=True)
+                spread = f"{stats['spread']:.1f}" if stats['spread'] not in (None, float('inf')) else "—"
+                live_status.caption(f"📡 Frame {stats['frames_analyzed']} · pad spread {spread} / {stable_tol:g} · "
+                                    f"{stats['frame_p50_ms']} ms per frame (interval {stats['frame_interval_ms']} ms) · dropped {stats['frames_dropped']}")
+
+            try:
+                with LatestFrameGrabber(live_source) as grabber:
+                    capture = capture_until_stable(grabber, stable_k, stable_tol, on_frame=show_frame)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                st.stop()
+            live_view.empty()
+
+            if capture['stable']:
+                _, png = cv2.imencode('.png', capture['frame'])
+                st.session_state['live_capture'] = CapturedFrame(f"live-{capture['frames_captured']}.png", png.tobytes())
+                live_status.success(f"🔒 Pads locked after {capture['frames_analyzed']} frames in {capture['elapsed_s']}s "
+                                    f"({capture['frame_p50_ms']} ms/frame vs {capture['frame_interval_ms']} ms interval, {capture['frames_dropped']} dropped)")
+            else:
+                live_status.warning(f"⚠️ No stable lock after {capture['frames_analyzed']} frames ({capture['elapsed_s']}s). "
+                                    "Hold the strip steady under even light and retry.")
+        file = st.session_state.get('live_capture')
+    else:
+        input_col1, input_col2 = st.columns([1, 1])
+        with input_col1:
+            p_id = st.text_input("📋 Patient Access ID", placeholder="Enter SENSE-XXXX")
+            strip_lot = st.text_input("🧫 Strip Lot", placeholder="Reagent lot printed on the pouch (optional)")
+        with input_col2:
+            file = st.file_uploader("📸 Upload Diagnostic Strip", type=['jpg', 'png', 'jpeg'])
+
+        with st.expander("🧪 Extraction Path Cross-Check"):
+            roi_first = st.toggle("ROI-First Colorimetry", value=ROI_FIRST_EXTRACTION,
+                                  help="Off = legacy path that blurs and HSV-converts the entire photo.")
+            registration = st.toggle("Strip Registration", value=STRIP_REGISTRATION,
+                                     help="Locate and de-skew the strip before reading pads. Off = fixed frame geometry.")
+            decode_target = st.select_slider("Decode Target (long side, px)", options=[400, 800, 1600, 3200, None],
+                                             value=DECODE_TARGET_LONG_SIDE, format_func=lambda v: "Full" if v is None else f"{v}px",
+                                             help="Oversized photos are decoded at 1/2, 1/4 or 1/8 scale down to this size.")
+            quality_gate = st.toggle("Image Quality Gate", value=QUALITY_GATE,
+                                     help="Reject blurry, glare-washed or badly exposed photos before colorimetry.")
+            st.caption(f"Both paths must agree to within {ROI_PARITY_TOLERANCE:g} on every HSV channel mean.")
+            if st.button("▶ RUN ON REFERENCE STRIPS", use_container_width=True):
+                st.dataframe(compare_extraction_paths(), use_container_width=True, hide_index=True)
+            if st.button("▶ BENCHMARK CALIBRATION ENGINE", use_container_width=True):
+                st.dataframe(pd.DataFrame([benchmark_calibration()]), use_container_width=True, hide_index=True)
+                st.caption(f"Vectorised LUT engine must match color_to_value() to within {CALIBRATION_PARITY_TOLERANCE:g}.")
+
+        with st.expander("🎛️ Calibration Profile Registry"):
+            with db_read() as db:
+                profiles = queries.fetch_frame(db, 'calibration_profiles')
+            st.dataframe(profiles, use_container_width=True, hide_index=True)
+            with st.form("calibration_profile_form", clear_on_submit=False):
+                cp1, cp2 = st.columns(2)
+                cal_device = cp1.text_input("Capture Device (EXIF make/model, * = any)", value="*")
+                cal_lot = cp2.text_input("Strip Lot (* = any)", value="*")
+                cal_curves = st.text_area("Fitted Curves — {biomarker: [[saturation 0-255, value], ...]}",
+                                          value=json.dumps(DEFAULT_CALIBRATION_CURVES, indent=2), height=220)
+                if st.form_submit_button("💾 REGISTER CALIBRATION PROFILE", use_container_width=True):
+                    try:
+                        new_profile = save_calibration_profile(cal_device.strip(), cal_lot.strip(), json.loads(cal_curves))
+                        st.success(f"Profile #{new_profile} registered for {cal_device} / {cal_lot}.")
+                    except (ValueError, TypeError) as e:
+                        st.error(f"❌ Invalid calibration curves: {e}")
+
+    with st.expander("⚙️ Analysis Pool Telemetry"):
+        pool_stats = scan_pool().stats()
+        t1, t2, t3, t4 = st.columns(4)
+        t1.metric("Workers", pool_stats['workers'])
+        t2.metric("In Flight", f"{pool_stats['in_flight']} / {pool_stats['queue_depth']}")
+        t3.metric("p50 Latency", f"{pool_stats['p50_ms']} ms" if pool_stats['p50_ms'] is not None else "—")
+        t4.metric("p95 Latency", f"{pool_stats['p95_ms']} ms" if pool_stats['p95_ms'] is not None else "—")
+        st.caption(f"Completed {pool_stats['completed']} · Failed {pool_stats['failed']} · Rejected (queue full) {pool_stats['rejected']} · "
+                   f"Job timeout {POOL_JOB_TIMEOUT_S:g}s. Tune with SENSE_POOL_WORKERS / SENSE_POOL_QUEUE_DEPTH / SENSE_POOL_JOB_TIMEOUT_S.")
+        db_stats = db_manager().stats()
+        d1, d2, d3, d4 = st.columns(4)
+        d1.metric("DB Readers In Use", f"{db_stats['readers_in_use']} / {db_stats['readers']}")
+        d2.metric("Writer Busy", "Yes" if db_stats['writer_in_use'] else "No")
+        d3.metric("p95 Read Wait", f"{db_stats['read_wait_p95_ms']} ms" if db_stats['read_wait_p95_ms'] is not None else "—")
+        d4.metric("p95 Write Wait", f"{db_stats['write_wait_p95_ms']} ms" if db_stats['write_wait_p95_ms'] is not None else "—")
+        st.caption(f"Reads {db_stats['reads']} · Writes {db_stats['writes']} · Rolled back {db_stats['rollbacks']} · "
+                   f"Pool timeouts {db_stats['timeouts']}. Tune with SENSE_DB_READERS / SENSE_DB_ACQUIRE_TIMEOUT_S.")
+        writer = db_writer()
+        wq_stats = writer.stats()
+        w1, w2, w3, w4 = st.columns(4)
+        w1.metric("Write Queue", f"{wq_stats['queue_depth']} / {wq_stats['queue_capacity']}")
+        w2.metric("p50 Batch", wq_stats['batch_size_p50'] if wq_stats['batch_size_p50'] is not None else "—")
+        w3.metric("p95 Commit", f"{wq_stats['commit_ms_p95']} ms" if wq_stats['commit_ms_p95'] is not None else "—")
+        w4.metric("p95 Ack", f"{wq_stats['ack_ms_p95']} ms" if wq_stats['ack_ms_p95'] is not None else "—")
+        histograms = writer.histograms()
+        if histograms['commit_ms'] is not None:
+            h1, h2, h3 = st.columns(3)
+            for col, (key, label) in zip((h1, h2, h3), (('queue_depth', "Queue Depth"), ('batch_size', "Batch Size"), ('commit_ms', "Commit ms"))):
+                counts, edges = histograms[key]
+                col.caption(label)
+                col.bar_chart(pd.DataFrame({'batches': counts}, index=[f"{e:.3g}" for e in edges[:-1]]), height=140)
+        st.caption(f"Group commits {wq_stats['batches']} · Jobs committed {wq_stats['committed']} · Failed {wq_stats['failed']} · "
+                   f"Rejected (queue full) {wq_stats['rejected']}. Tune with SENSE_WRITE_QUEUE_DEPTH / SENSE_WRITE_BATCH_SIZE / SENSE_WRITE_MAX_DELAY_MS.")
 
     if file and p_id:
-        c.execute("SELECT name FROM patients WHERE pid=?", (p_id,))
-        p_res = c.fetchone()
+        with db_read() as db:
+            p_res = queries.fetch_one(db, 'patient_name', (p_id,))
         
         if p_res:
             p_name = p_res[0]
-            img = cv2.imdecode(np.frombuffer(file.read(), np.uint8), 1)
-            h, w, _ = img.shape
-
-            img_blur = cv2.GaussianBlur(img, (5, 5), 0)
-            hsv = cv2.cvtColor(img_blur, cv2.COLOR_BGR2HSV)
-            biomarker_keys = ['glucose', 'hb', 'ntprobnp', 'lpa', 'troponin']
-            vals = []
-            
-            start_x, spacing, pad_w, pad_h, y_pos = int(w*0.05), int(w*0.18), int(w*0.12), int(h*0.40), int(h*0.30)
-            img_disp = img.copy()
-            for i, k in enumerate(biomarker_keys):
-                x = start_x + (i * spacing)
-                x2, y2 = min(x + pad_w, w), min(y_pos + pad_h, h)
-                roi = hsv[y_pos:y2, x:x2]
-                if roi.size > 0:
-                    val = color_to_value(np.mean(roi, axis=(0,1)), k)
-                    vals.append(val)
-                    cv2.rectangle(img_disp, (x, y_pos), (x2, y2), (0, 255, 0), 3)
-                else:
-                    vals.append(THRESHOLDS[k]['normal'])
-
-            vals = (vals + [THRESHOLDS[k]['normal'] for k in biomarker_keys[len(vals):]])[:5]
-            score = calculate_crs(vals)
+            data = file.getvalue()
+            image_hash = hashlib.sha256(data).hexdigest()
+            device = capture_device_id(data)
+            profile_id = resolve_calibration_profile(device, strip_lot)
+            cache_key = (image_hash, profile_id, device, decode_target, roi_first, registration, quality_gate)
+            result = lru_get(analysis_cache(), cache_key)
+            if result is None:
+                pool, templates = scan_pool(), strip_template_cache()
+                tkey = strip_template_key(device, data, decode_target)
+                try:
+                    fut = pool.submit(analyze_job, data, decode_target, roi_first, registration,
+                                      lru_get(templates, tkey), load_profile_lut(profile_id), quality_gate)
+                    result = wait_for_analysis(fut, pool)
+                except PoolSaturatedError:
+                    st.warning("⏳ Colorimetry queue is full, please retry the scan in a moment.")
+                    st.stop()
+                except TimeoutError as e:
+                    st.error(f"❌ {e}. The strip was not saved.")
+                    st.stop()
+                if result is not None:
+                    if result.get('quad') is not None and not result['reused']:
+                        lru_put(templates, tkey, result['quad'], STRIP_TEMPLATE_CACHE_SIZE)
+                    lru_put(analysis_cache(), cache_key, result, ANALYSIS_CACHE_ENTRIES)
+            if result is None:
+                st.error("❌ Unreadable image: the upload could not be decoded as a strip photo.")
+                st.stop()
+            if result['rejected']:
+                st.error("🚫 Image rejected by the quality gate. No reading was saved, please retake the photo.")
+                for reason in result['quality']['reasons']:
+                    st.markdown(f"- {reason}")
+                st.caption(quality_caption(result['quality']))
+                st.stop()
+
+            biomarker_keys = BIOMARKER_KEYS
+            _, scoring_model_id, scoring_model = active_scoring_model()
+            vals, decode_scale = result['vals'], result['decode_scale']
+            score, (critical_cutoff, elevated_cutoff) = calculate_crs(vals, scoring_model), risk_cutoffs(scoring_model)
             ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            c.execute("INSERT INTO readings VALUES (?,?,?,?,?,?,?,?,?)", 
-                      (p_id, p_name, vals[0], vals[1], vals[2], vals[3], vals[4], score, ts))
-            conn.commit()
-
-            st.success(f"✅ Telemetry Lock: Results synchronized for {p_name}")
+            # The raw photo is archived under its hash first, so every reading can be re-scored later.
+            strip_archive().put(data, image_hash)
+            # One physical strip = one reading: reruns hit the (pid, image_hash) unique index and are ignored.
+            is_new = db_submit(lambda db: insert_reading(db.cursor(), p_id, p_name, vals, score, ts, profile_id, image_hash))
+
+            if is_new:
+                registry_counters.clear()
+                st.success(f"✅ Telemetry Lock: Results synchronized for {p_name}")
+            else:
+                st.info(f"♻️ Strip already on file for {p_name}: stored result shown, no duplicate reading written.")
             
             res_col1, res_col2 = st.columns([1.3, 1])
             
             with res_col1:
                 st.markdown('<div class="scan-wrapper"><div class="scan-line"></div>', unsafe_allow_html=True)
-                st.image(cv2.cvtColor(img_disp, cv2.COLOR_BGR2RGB), use_container_width=True)
+                st.image(result['preview'], use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
+                if st.toggle("🔍 View full resolution", key=f"full_res_{image_hash}"):
+                    st.image(data, caption="Original upload (unannotated)", use_container_width=True)
+                if not result['registered']:
+                    st.caption(f"📐 DEVICE: {device} | No strip outline found, fixed frame geometry applied")
+                else:
+                    st.caption(f"📐 DEVICE: {device} | Strip registered via {'cached device template' if result['reused'] else 'full contour search'}")
+                st.caption(f"🎛️ CALIBRATION PROFILE: #{profile_id} | IMAGE: {image_hash[:12]} | PREVIEW: {len(result['preview']) / 1024:.0f} KB")
+                if result['quality']:
+                    st.caption(quality_caption(result['quality']))
+
+                with st.expander(f"📐 Decode Scale Accuracy (scored at 1/{decode_scale})"):
+                    if st.button("▶ COMPARE AGAINST FULL DECODE", use_container_width=True):
+                        st.dataframe(decode_scale_report(data, roi_first), use_container_width=True, hide_index=True)
                 
             with res_col2:
                 st.markdown(f"""
                     <div style="text-align:center; padding:10px; border-radius:10px; background:rgba(255,255,255,0.05);">
-                        <small style="color:#888;">COMPOSITE RISK SCORE</small>
+                        <small style="color:#888;">COMPOSITE RISK SCORE · {scoring_model_id.upper()}</small>
                         <h1 style="color:#00FF00; margin:0;">{score:.3f}</h1>
                     </div>
                 """, unsafe_allow_html=True)
@@ -1193,9 +1602,10 @@ elif page == "🔬 New Diagnostic Scan":
                         </div>
                     """, unsafe_allow_html=True)
 
-            if score > 0.7 or vals[4] > 0.04:
-                alert_sound = '<audio autoplay><source src="https://assets.mixkit.co/active_storage/sfx/2869/2869-preview.mp3" type="audio/mp3"></audio>'
-                st.markdown(alert_sound, unsafe_allow_html=True)
+            if score >= critical_cutoff or vals[4] > 0.04:
+                if is_new:
+                    alert_sound = '<audio autoplay><source src="https://assets.mixkit.co/active_storage/sfx/2869/2869-preview.mp3" type="audio/mp3"></audio>'
+                    st.markdown(alert_sound, unsafe_allow_html=True)
                 
                 alert_placeholder = st.empty()
                 with alert_placeholder.container():
@@ -1209,13 +1619,15 @@ elif page == "🔬 New Diagnostic Scan":
                         </div>
                     """, unsafe_allow_html=True)
                     
-                    with st.status("📡 Establishing Emergency Handshake...", state="running") as status:
-                        for i in range(5, 0, -1):
-                            time.sleep(1)
-                            st.write(f"Broadcasting vital signs to Dispatch Unit... {i}s")
-                        status.update(label="🚑 108 DISPATCH CONFIRMED - INTERCEPTION IN PROGRESS", state="complete")
+                    if is_new:
+                        with st.status("📡 Establishing Emergency Handshake...", state="running") as status:
+                            for i in range(5, 0, -1):
+                                time.sleep(1)
+                                st.write(f"Broadcasting vital signs to Dispatch Unit... {i}s")
+                            status.update(label="🚑 108 DISPATCH CONFIRMED - INTERCEPTION IN PROGRESS", state="complete")
                 
-                speak(f"Emergency. Ambulance 108 dispatched for {p_name}. Life support protocols initiated.")
+                if is_new:
+                    speak(f"Emergency. Ambulance 108 dispatched for {p_name}. Life support protocols initiated.")
                 
                 st.subheader("🚑 Real-Time Interception Map")
                 fig = go.Figure(go.Scatter(x=[0, 1.2, 2], y=[0, 0.8, 2], mode='lines+markers+text', 
@@ -1227,9 +1639,10 @@ elif page == "🔬 New Diagnostic Scan":
                                  yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
                 st.plotly_chart(fig, use_container_width=True)
 
-            elif score > 0.4:
+            elif score >= elevated_cutoff:
                 st.warning("⚠️ PROVISIONAL ALERT: Physician intervention recommended.")
-                speak(f"High risk detected. Results shared with medical hub.")
+                if is_new:
+                    speak(f"High risk detected. Results shared with medical hub.")
         else:
             st.error("❌ Patient ID not found. Please register the patient first.")
 # --- PAGE: CLINICAL HISTORY & TRENDS ---
@@ -1284,22 +1697,24 @@ elif page == "📉 Clinical History & Trends":
             st.markdown('<div style="background:rgba(255,75,75,0.1); padding:10px; border-radius:10px; text-align:center;"><span class="pulse-icon">❤️</span> <b style="color:#FF4B4B;">MONITORING LIVE</b></div>', unsafe_allow_html=True)
 
     if pid:
-        df = pd.read_sql(f"SELECT * FROM readings WHERE pid='{pid}' ORDER BY timestamp ASC", conn)
+        scoring_key, scoring_model_id, scoring_model = active_scoring_model()
+        critical_cutoff, elevated_cutoff = risk_cutoffs(scoring_model)
+        # Metric row from the running per-patient statistics: one keyed lookup, no history scan.
+        with db_read() as db:
+            trend = sense_db.patient_trend(db.cursor(), pid, scoring_key)
         
-        if not df.empty:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            
-            last_score = df['score'].iloc[-1]
-            prev_score = df['score'].iloc[-2] if len(df) > 1 else last_score
+        if trend and trend['last_score'] is not None:
+            last_score = trend['last_score']
+            prev_score = trend['prev_score'] if trend['prev_score'] is not None else last_score
             delta = last_score - prev_score
 
             m1, m2, m3 = st.columns(3)
             with m1:
-                st.metric("Current CRS Index", f"{last_score:.3f}", delta=f"{delta:.3f}", delta_color="inverse")
+                st.metric(f"Current CRS Index ({scoring_model_id})", f"{last_score:.3f}", delta=f"{delta:.3f}", delta_color="inverse")
             with m2:
-                st.metric("Analyzed Sessions", len(df), delta="Total Logs", delta_color="off")
+                st.metric("Analyzed Sessions", trend['readings'], delta="Total Logs", delta_color="off")
             with m3:
-                risk_status, risk_color = get_risk_label(last_score) # Using your custom label logic
+                risk_status, risk_color = get_risk_label(last_score, scoring_model)
                 st.markdown(f"""
                     <div style="background:{risk_color}22; border:1px solid {risk_color}; padding:8px; border-radius:10px; text-align:center;">
                         <small style="color:{risk_color}; font-weight:bold;">RISK PROFILE</small><br>
@@ -1309,69 +1724,103 @@ elif page == "📉 Clinical History & Trends":
 
             st.write("##")
 
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-            colors = ['#FFA500', '#FF4B4B', '#00D1FF', '#7000FF', '#00FF00']
+            if st.toggle(f"📈 Load trend history ({trend['readings']} readings)", key=f"history_{pid}"):
+                with db_read() as db:
+                    span = queries.fetch_one(db, 'patient_history_span', (pid,))
+                first_day, last_day = (datetime.strptime(d, '%Y-%m-%d').date() if d else datetime.now().date() for d in span)
+                window = st.date_input("🗓️ Time Window", value=(first_day, last_day), min_value=first_day, max_value=last_day,
+                                       key=f"history_window_{pid}")
+                start, end = (window[0], window[-1]) if window else (first_day, last_day)
+                # Long windows plot day / week / month rollups; raw readings only once the window is zoomed in.
+                with db_read() as db:
+                    df, resolution, window_readings = queries.history_window(db, pid, scoring_key, start, end)
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                st.caption(f"🗂️ {window_readings} readings from {start} to {end}: "
+                           + ("every reading plotted" if resolution == 'raw' else
+                              f"{len(df)} {ROLLUP_LABELS[resolution]} means plotted, the CRS band shows each {resolution}'s min–max. "
+                              "Narrow the window for raw readings."))
+
+                fig = make_subplots(specs=[[{"secondary_y": True}]])
+                colors = ['#FFA500', '#FF4B4B', '#00D1FF', '#7000FF', '#00FF00']
             
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['glucose'], name="Glucose", 
-                                     line=dict(color=colors[0], width=3), mode='lines+markers'), secondary_y=False)
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['ntprobnp'], name="NT-proBNP", 
-                                     line=dict(color=colors[1], width=3), mode='lines+markers'), secondary_y=False)
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['lpa'], name="Lp(a)", 
-                                     line=dict(color=colors[3], width=3), mode='lines+markers'), secondary_y=False)
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['glucose'], name="Glucose", 
+                                         line=dict(color=colors[0], width=3), mode='lines+markers'), secondary_y=False)
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['ntprobnp'], name="NT-proBNP", 
+                                         line=dict(color=colors[1], width=3), mode='lines+markers'), secondary_y=False)
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['lpa'], name="Lp(a)", 
+                                         line=dict(color=colors[3], width=3), mode='lines+markers'), secondary_y=False)
             
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['hb'], name="Hemoglobin", 
-                                     line=dict(color=colors[2], dash='dot', width=2)), secondary_y=True)
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df['troponin'], name="Troponin", 
-                                     line=dict(color=colors[4], dash='dash', width=2)), secondary_y=True)
-
-            fig.add_hrect(y0=0.7, y1=1.0, fillcolor="red", opacity=0.07, line_width=0, annotation_text="CRITICAL PATH", secondary_y=False)
-            fig.add_hrect(y0=0.4, y1=0.7, fillcolor="yellow", opacity=0.07, line_width=0, annotation_text="ELEVATED RISK", secondary_y=False)
-
-            fig.update_layout(
-                title="<b>Comprehensive 5-Plex Bio-Trend Mapping</b>",
-                template="plotly_dark",
-                hovermode="x unified",
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                xaxis=dict(showgrid=False, title="Timeline of Diagnostics"),
-                yaxis=dict(title="Metabolic/Cardiac Concentration", gridcolor='rgba(255,255,255,0.05)'),
-                legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="center", x=0.5)
-            )
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['hb'], name="Hemoglobin", 
+                                         line=dict(color=colors[2], dash='dot', width=2)), secondary_y=True)
+                fig.add_trace(go.Scatter(x=df['timestamp'], y=df['troponin'], name="Troponin", 
+                                         line=dict(color=colors[4], dash='dash', width=2)), secondary_y=True)
+
+                fig.add_hrect(y0=critical_cutoff, y1=1.0, fillcolor="red", opacity=0.07, line_width=0, annotation_text="CRITICAL PATH", secondary_y=False)
+                fig.add_hrect(y0=elevated_cutoff, y1=critical_cutoff, fillcolor="yellow", opacity=0.07, line_width=0, annotation_text="ELEVATED RISK", secondary_y=False)
+
+                fig.update_layout(
+                    title="<b>Comprehensive 5-Plex Bio-Trend Mapping</b>",
+                    template="plotly_dark",
+                    hovermode="x unified",
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    xaxis=dict(showgrid=False, title="Timeline of Diagnostics"),
+                    yaxis=dict(title="Metabolic/Cardiac Concentration", gridcolor='rgba(255,255,255,0.05)'),
+                    legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="center", x=0.5)
+                )
             
-            st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(fig, use_container_width=True)
 
-            st.write("##")
-            st.subheader("🛡️ Risk Velocity Progression")
+                st.write("##")
+                st.subheader("🛡️ Risk Velocity Progression")
             
-            fig_area = go.Figure()
-            fig_area.add_trace(go.Scatter(x=df['timestamp'], y=df['score'], fill='tozeroy', 
-                                         line=dict(color='#00FF00', width=4), 
-                                         fillcolor='rgba(0, 255, 0, 0.1)', name="CRS Index"))
+                fig_area = go.Figure()
+                if resolution != 'raw':
+                    fig_area.add_trace(go.Scatter(x=df['timestamp'], y=df['score_max'], line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                    fig_area.add_trace(go.Scatter(x=df['timestamp'], y=df['score_min'], fill='tonexty', line=dict(width=0),
+                                                  fillcolor='rgba(255, 75, 75, 0.15)', name="CRS Min–Max"))
+                fig_area.add_trace(go.Scatter(x=df['timestamp'], y=df['score'], fill='tozeroy', 
+                                             line=dict(color='#00FF00', width=4), 
+                                             fillcolor='rgba(0, 255, 0, 0.1)', name="CRS Index"))
             
-            fig_area.update_layout(
-                template="plotly_dark", 
-                height=350, 
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                margin=dict(l=0,r=0,t=20,b=0),
-                xaxis=dict(showgrid=False),
-                yaxis=dict(range=[0, 1], title="CRS Index Value", gridcolor='rgba(255,255,255,0.05)')
-            )
-            st.plotly_chart(fig_area, use_container_width=True)
+                fig_area.update_layout(
+                    template="plotly_dark", 
+                    height=350, 
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    margin=dict(l=0,r=0,t=20,b=0),
+                    xaxis=dict(showgrid=False),
+                    yaxis=dict(range=[0, 1], title="CRS Index Value", gridcolor='rgba(255,255,255,0.05)')
+                )
+                st.plotly_chart(fig_area, use_container_width=True)
 
-            col_logs, col_obs = st.columns([1.5, 1])
-            
-            with col_logs:
                 with st.expander("📄 Raw Clinical Telemetry Data", expanded=False):
                     st.dataframe(df.style.background_gradient(subset=['score'], cmap='RdYlGn_r'), use_container_width=True)
-            
+
+            col_logs, col_obs = st.columns([1.5, 1])
+
+            with col_logs:
+                st.markdown(f"""
+                    <div class="report-card">
+                        <h4 style="margin:0;">📐 Running Trend ({trend['readings']} sessions)</h4>
+                        <p style="font-size:0.9em; color:#CCC;">
+                            EWMA CRS <b>{trend['ewma']:.3f}</b> · slope <b>{trend['slope_per_day'] * 30:+.3f}</b> per 30 days<br>
+                            First scan {trend['first_ts']} · latest {trend['last_ts']}
+                        </p>
+                    </div>
+                """, unsafe_allow_html=True)
+                st.dataframe(pd.DataFrame({'Biomarker': [THRESHOLDS[k]['label'] for k in BIOMARKER_KEYS],
+                                           'Min': [trend[f'{k}_min'] for k in BIOMARKER_KEYS],
+                                           'Max': [trend[f'{k}_max'] for k in BIOMARKER_KEYS]}),
+                             use_container_width=True, hide_index=True)
+
             with col_obs:
-                if last_score > 0.6:
+                if last_score >= elevated_cutoff:
                     st.markdown(f"""
                         <div class="report-card" style="border-left-color:#FF4B4B;">
                             <h4 style="color:#FF4B4B; margin:0;">⚕️ AI Clinical Observation</h4>
                             <p style="font-size:0.9em; color:#CCC;">
-                                <b>Warning:</b> Current CRS Index ({last_score:.3f}) exceeds the 0.6 stability threshold. 
+                                <b>Warning:</b> Current CRS Index ({last_score:.3f}) is at or above the {elevated_cutoff:g} elevated-risk threshold of {scoring_model_id}. 
                                 Longitudinal trajectory indicates a <b>{'+' if delta > 0 else ''}{delta*100:.1f}% shift</b> 
                                 since last scan. Immediate triage advised.
                             </p>
@@ -1435,13 +1884,14 @@ elif page == "💊 Personalized Care Plan":
     pid = search_col1.text_input("🔍 Access Patient Strategy Hub", placeholder="Enter Patient ID (e.g. SENSE-001)")
 
     if pid:
-        df_l = pd.read_sql(f"SELECT * FROM readings WHERE pid='{pid}' ORDER BY timestamp DESC LIMIT 1", conn)
+        critical_cutoff, elevated_cutoff = risk_cutoffs(active_scoring_model()[2])
+        with db_read() as db:
+            data = queries.fetch_one(db, 'latest_reading', (pid,))
         
-        if not df_l.empty:
-            data = df_l.iloc[0]
+        if data is not None:
             
-            aura_color = "#FF4B4B" if data['score'] > 0.7 else "#FFA500" if data['score'] > 0.4 else "#00FF00"
-            status_text = '🔴 CRITICAL INTERVENTION' if data['score'] > 0.7 else '🟢 MAINTENANCE MODE'
+            aura_color = "#FF4B4B" if data['score'] >= critical_cutoff else "#FFA500" if data['score'] >= elevated_cutoff else "#00FF00"
+            status_text = '🔴 CRITICAL INTERVENTION' if data['score'] >= critical_cutoff else '🟢 MAINTENANCE MODE'
             
             st.markdown(f"""
                 <div class="care-header">
@@ -1541,7 +1991,7 @@ elif page == "💊 Personalized Care Plan":
                 st.markdown('<div class="strategy-card">', unsafe_allow_html=True)
                 st.markdown("### 🫀 Cardiac")
                 st.markdown(f"<small>SCORE: {data['score']:.2f}</small>", unsafe_allow_html=True)
-                if data['score'] > 0.5:
+                if data['score'] >= elevated_cutoff:
                     st.error("STRESS DETECTED")
                     st.markdown("""
                         <div class="action-point">Physician review required</div>
@@ -1555,14 +2005,15 @@ elif page == "💊 Personalized Care Plan":
 
             st.write("##")
             with st.expander("🛠️ Clinical Lifestyle Prescription Editor", expanded=True):
-                plan_db = pd.read_sql(f"SELECT * FROM care_plans WHERE pid='{pid}'", conn)
+                with db_read() as db:
+                    plan = queries.fetch_one(db, 'care_plan', (pid,))
                 
                 d_nut = "Foods: Walnuts, Greens. Restrict: Sugars."
-                d_act = f"Goal: {10000 if data['score'] < 0.4 else 5000} steps per day."
+                d_act = f"Goal: {10000 if data['score'] < elevated_cutoff else 5000} steps per day."
                 d_sup = "Focus: Hydration & Targeted Multivitamins."
 
-                if not plan_db.empty:
-                    d_nut, d_act, d_sup = plan_db.iloc[0]['nutrition'], plan_db.iloc[0]['activity'], plan_db.iloc[0]['supplements']
+                if plan is not None:
+                    d_nut, d_act, d_sup = plan['nutrition'], plan['activity'], plan['supplements']
 
                 with st.form(key=f"phys_form_{pid}"):
                     t1, t2, t3 = st.tabs(["🥗 Personalized Nutrition", "🏃 Activity Protocol", "💊 Clinical Supplementation"])
@@ -1571,9 +2022,7 @@ elif page == "💊 Personalized Care Plan":
                     with t3: new_sup = st.text_area("Supplement Protocol", value=d_sup, height=100)
                     
                     if st.form_submit_button("💾 SYNCHRONIZE CARE PLAN", use_container_width=True):
-                        c.execute("INSERT OR REPLACE INTO care_plans VALUES (?,?,?,?,?)", 
-                                 (pid, new_nut, new_act, new_sup, datetime.now()))
-                        conn.commit()
+                        db_submit(queries.execute, 'save_care_plan', (pid, new_nut, new_act, new_sup, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
                         st.toast("Clinical Plan Updated Successfully!")
                         st.rerun()
 
@@ -1634,10 +2083,56 @@ elif page == "🚨 Doctor's Triage Dashboard":
 
     st.markdown("<h1 style='letter-spacing:-1.5px;'>👨‍⚕️ SENSE Triage Command</h1>", unsafe_allow_html=True)
     
-    df_all = pd.read_sql("SELECT * FROM readings WHERE score > 0.4 ORDER BY timestamp DESC", conn)
+    active_key, active_model_id, scoring_model = active_scoring_model()
+    with st.expander(f"🧮 Scoring Model Registry (active: {active_model_id})"):
+        with db_read() as db:
+            models, coverage = sense_db.load_scoring_models(db.cursor()), sense_db.scoring_model_coverage(db.cursor())
+        st.dataframe(pd.DataFrame([{'Model': mid, 'Active': key == active_key, 'Scored Readings': coverage.get(key, 0),
+                                    'Weights': ", ".join(f"{w:g}" for w in spec['weights']),
+                                    'Bands': " / ".join(f"{b[0]:g}" for b in spec['bands'][:-1])}
+                                   for key, (mid, spec) in models.items()]), use_container_width=True, hide_index=True)
+        model_ids = {mid: key for key, (mid, _) in models.items()}
+        mr1, mr2, mr3 = st.columns([2, 1, 1])
+        chosen_model = mr1.selectbox("Model Version", list(model_ids), label_visibility="collapsed")
+        if mr2.button("⚙️ PRECOMPUTE", use_container_width=True):
+            bar = st.progress(0.0, text=f"Scoring readings under {chosen_model}...")
+            # A dedicated connection: the job commits chunk by chunk, so the pooled writer is never held for the whole run.
+            job_conn = sense_db.connect(DB_PATH)
+            try:
+                for prog in rescore_readings(job_conn, chosen_model):
+                    done = prog['processed'] / max(prog['processed'] + prog['remaining'], 1)
+                    bar.progress(done, text=f"{prog['processed']} readings scored, {prog['changed']} written ({prog['rows_per_s']} rows/s)")
+            finally:
+                job_conn.close()
+            bar.empty()
+            st.success(f"All readings scored under {chosen_model}.")
+        if mr3.button("✅ ACTIVATE", use_container_width=True):
+            try:
+                with db_write() as db:
+                    sense_db.set_active_scoring_model(db.cursor(), model_ids[chosen_model])
+                registry_counters.clear()
+                st.rerun()
+            except ValueError as e:
+                st.error(f"❌ {e}")
+        with st.form("scoring_model_form"):
+            new_model_id = st.text_input("New Model ID", placeholder="e.g. crs-v2")
+            new_model_spec = st.text_area("Model Spec — weights, normalizers ['linear'|'log1p', offset, scale], bands [lower, label, colour]",
+                                          value=json.dumps(models[active_key][1], indent=2), height=260)
+            if st.form_submit_button("💾 REGISTER MODEL VERSION", use_container_width=True):
+                try:
+                    with db_write() as db:
+                        sense_db.register_scoring_model(db.cursor(), new_model_id.strip(), json.loads(new_model_spec))
+                    st.toast(f"{new_model_id} registered. Precompute its scores, then activate it.")
+                    st.rerun()
+                except (ValueError, TypeError, sqlite3.IntegrityError) as e:
+                    st.error(f"❌ Invalid or duplicate model: {e}")
+
+    critical_cutoff, elevated_cutoff = risk_cutoffs(scoring_model)
+    with db_read() as db:
+        df_all = queries.fetch_frame(db, 'triage_readings', (elevated_cutoff,))
     
     m1, m2, m3, m4 = st.columns([1, 1, 1, 1])
-    critical_count = len(df_all[df_all['score'] > 0.7])
+    critical_count = len(df_all[df_all['score'] >= critical_cutoff])
     moderate_count = len(df_all) - critical_count
     
     with m1:
@@ -1685,7 +2180,7 @@ elif page == "🚨 Doctor's Triage Dashboard":
     
     if not df_all.empty:
         for i, row in df_all.iterrows():
-            is_critical = row['score'] > 0.7
+            is_critical = row['score'] >= critical_cutoff
             severity_label = "RED ALERT" if is_critical else "STABLE RISK"
             color = "#ff4b4b" if is_critical else "#ffa500"
             bg_class = "critical-pulse" if is_critical else ""
@@ -0,0 +1,151 @@
+"""
+Query latency of the dashboard's hot SQL before and after the schema migrations.
+
+Builds a throwaway database at schema version 1 (no reading primary key, no
+query indexes), fills it with synthetic readings, times the pages' queries,
+applies the remaining migrations and times them again. Nothing touches
+sense_health.db.
+
+    python benchmarks/db_queries.py                 # 10^6 readings
+    python benchmarks/db_queries.py --rows 100000 --repeat 50
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sense.db import (SCHEMA_MIGRATIONS, active_scoring_model, connect, insert_reading, load_scoring_models, migrate,
+                      record_patient_stats, schema_version)
+from sense.scoring import crs_scores, risk_cutoffs
+
+READINGS_PER_PATIENT = 20
+INSERT_SAMPLE = 200
+
+def populate(db_conn, rows, seed=7):
+    """`rows` synthetic readings over rows / READINGS_PER_PATIENT patients, scored under the active model."""
+    rng = np.random.default_rng(seed)
+    n_patients = max(rows // READINGS_PER_PATIENT, 1)
+    pids = [f"SENSE-{i:06X}" for i in range(n_patients)]
+    cursor = db_conn.cursor()
+    key, _, model = active_scoring_model(cursor)
+    cursor.executemany("INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES (?,?,?,?,?,0)",
+                       ((pid, f"Patient {i}", "", "", "2024-01-01") for i, pid in enumerate(pids)))
+
+    # Screening-population spread: roughly 4% of readings land at ELEVATED or above.
+    vals = np.column_stack([rng.normal(95, 15, rows), rng.normal(14.2, 1.1, rows), rng.lognormal(3.0, 0.8, rows),
+                            rng.normal(150, 30, rows), np.abs(rng.normal(0.008, 0.008, rows))]).round(3)
+    scores = crs_scores(vals, model)
+    start = datetime(2024, 1, 1)
+    offsets = np.sort(rng.integers(0, 2 * 365 * 86400, rows))  # written in time order, like real scans
+    owners = rng.integers(0, n_patients, rows)
+    cursor.executemany("INSERT INTO readings (pid, name, glucose, hb, ntprobnp, lpa, troponin, score, timestamp, profile_id, image_hash) "
+                       "VALUES (?,?,?,?,?,?,?,?,?,1,?)",
+                       ((pids[o], f"Patient {o}", *v, s, (start + timedelta(seconds=int(t))).strftime('%Y-%m-%d %H:%M:%S'),
+                         hashlib.sha256(i.to_bytes(8, 'little')).hexdigest())
+                        for i, (o, v, s, t) in enumerate(zip(owners.tolist(), vals.tolist(), scores.tolist(), offsets.tolist()))))
+    cursor.execute("INSERT INTO reading_scores (model_key, reading_id, score) SELECT ?, rowid, score FROM readings", (key,))
+    db_conn.commit()
+    return pids
+
+def page_queries(cursor, pids, rng):
+    """(name, sql, params factory) for the queries the pages run on every visit."""
+    _, elevated = risk_cutoffs(active_scoring_model(cursor)[2])
+    cursor.execute("SELECT image_hash FROM readings ORDER BY random() LIMIT 20")
+    hashes = [r[0] for r in cursor.fetchall()]
+    return [
+        ("history: one patient, time order", "SELECT * FROM active_readings WHERE pid=? ORDER BY timestamp ASC",
+         lambda: (pids[rng.integers(len(pids))],)),
+        ("care plan: latest reading", "SELECT * FROM active_readings WHERE pid=? ORDER BY timestamp DESC LIMIT 1",
+         lambda: (pids[rng.integers(len(pids))],)),
+        ("triage: score >= elevated", "SELECT * FROM active_readings WHERE score >= ? ORDER BY timestamp DESC",
+         lambda: (elevated,)),
+        ("batch: duplicate check (20 hashes)", f"SELECT pid, image_hash FROM readings WHERE image_hash IN ({','.join('?' * 20)})",
+         lambda: hashes),
+        ("sidebar: patient count", "SELECT COUNT(*) FROM patients", lambda: ()),
+    ]
+
+def time_queries(db_conn, queries, repeat):
+    """{name: (median ms, rows returned, query plan)}."""
+    results = {}
+    for name, sql, params in queries:
+        times, n = [], 0
+        for _ in range(repeat):
+            p = params()
+            t0 = time.perf_counter()
+            n = len(db_conn.execute(sql, p).fetchall())
+            times.append((time.perf_counter() - t0) * 1000)
+        plan = " / ".join(r[3] for r in db_conn.execute("EXPLAIN QUERY PLAN " + sql, params()))
+        results[name] = (float(np.median(times)), n, plan)
+    return results
+
+def insert_indexed_reading(cursor, pid, name, vals, score, ts, profile_id, image_hash):
+    """
+    insert_reading without the rollup upserts, which need schema v7. This is the
+    write that exists at every schema version, so timing it before and after
+    migrating isolates what the indexes cost.
+    """
+    cursor.execute("INSERT OR IGNORE INTO readings (pid, name, glucose, hb, ntprobnp, lpa, troponin, score, timestamp, profile_id, image_hash) "
+                   "VALUES (?,?,?,?,?,?,?,?,?,?,?)", (pid, name, *vals, score, ts, profile_id, image_hash))
+    reading_id = cursor.lastrowid
+    scores = {key: float(crs_scores(vals, spec)[0]) for key, (_, spec) in load_scoring_models(cursor).items()}
+    cursor.executemany("INSERT OR REPLACE INTO reading_scores (model_key, reading_id, score) VALUES (?,?,?)",
+                       [(key, reading_id, s) for key, s in scores.items()])
+    record_patient_stats(cursor, pid, reading_id, vals, ts, scores)
+
+def time_inserts(db_conn, pids, rng, write):
+    """Median ms per `write` of one reading (one transaction each)."""
+    times = []
+    for i in range(INSERT_SAMPLE):
+        cursor = db_conn.cursor()
+        t0 = time.perf_counter()
+        write(cursor, pids[rng.integers(len(pids))], "bench", [100.0, 14.0, 90.0, 180.0, 0.01], 0.3,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 1, f"bench-{time.perf_counter_ns()}-{i}")
+        db_conn.commit()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help="synthetic readings (default 10^6)")
+    parser.add_argument('--repeat', type=int, default=20, help="runs per query; the median is reported")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_conn = connect(os.path.join(tmp, 'bench.db'))
+        migrate(db_conn, target=1)
+        t0 = time.perf_counter()
+        pids = populate(db_conn, args.rows)
+        print(f"populated {args.rows:,} readings / {len(pids):,} patients in {time.perf_counter() - t0:.1f}s (schema v1)")
+
+        rng = np.random.default_rng(11)
+        queries = page_queries(db_conn.cursor(), pids, rng)
+        before = time_queries(db_conn, queries, args.repeat)
+        insert_before = time_inserts(db_conn, pids, rng, insert_indexed_reading)
+
+        t0 = time.perf_counter()
+        applied = migrate(db_conn)
+        print(f"migrated v1 -> v{schema_version(db_conn.cursor())} (steps {applied}) in {time.perf_counter() - t0:.1f}s")
+        after = time_queries(db_conn, queries, args.repeat)
+        insert_after = time_inserts(db_conn, pids, rng, insert_indexed_reading)
+        insert_full = time_inserts(db_conn, pids, rng, insert_reading)
+        db_conn.close()
+
+    print(f"\n{'query':38} {'rows':>8} {'v1 ms':>10} {f'v{SCHEMA_MIGRATIONS[-1][0]} ms':>10} {'speedup':>9}")
+    for name, (ms_before, n, _) in before.items():
+        ms_after = after[name][0]
+        print(f"{name:38} {n:>8,} {ms_before:>10.2f} {ms_after:>10.2f} {ms_before / max(ms_after, 1e-6):>8.1f}x")
+    print(f"{'insert (readings, scores, stats)':38} {'':>8} {insert_before:>10.2f} {insert_after:>10.2f}")
+    print(f"{'insert_reading (incl. rollups)':38} {'':>8} {'-':>10} {insert_full:>10.2f}")
+    print("\nquery plans after migration:")
+    for name, (_, _, plan) in after.items():
+        print(f"  {name}: {plan}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Scan-commit throughput under a burst: one transaction per reading through
+ConnectionManager.write() against the GroupCommitWriter queue.
+
+Each of --sessions threads stands in for one dashboard session and writes
+--readings scans, waiting for each commit before the next (as the scan page
+does). Runs against throwaway databases with --synchronous set, so the fsync
+cost a camp laptop pays can be seen with FULL. Nothing touches sense_health.db.
+
+    python benchmarks/group_commit.py                          # 8 sessions x 200 readings
+    python benchmarks/group_commit.py --sessions 32 --synchronous FULL
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sense.connections import ConnectionManager, GroupCommitWriter
+from sense.db import insert_reading
+
+def run(path, sessions, readings, synchronous, grouped):
+    manager = ConnectionManager(path)
+    manager._writer.execute(f"PRAGMA synchronous={synchronous}")
+    pids = [f"SENSE-{i:06X}" for i in range(sessions)]
+    with manager.write() as db_conn:
+        db_conn.executemany("INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES (?,?,?,?,?,0)",
+                            ((pid, f"Patient {i}", "", "", "2025-01-01") for i, pid in enumerate(pids)))
+    writer = GroupCommitWriter(manager) if grouped else None
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ack_ms = []
+
+    def session(i):
+        rng, pid = np.random.default_rng(i), pids[i]
+        for n in range(readings):
+            vals = [float(rng.normal(95, 15)), float(rng.normal(14.2, 1.1)), float(rng.lognormal(3.0, 0.8)),
+                    float(rng.normal(150, 30)), 0.008]
+            image_hash = hashlib.sha256(f"{i}:{n}".encode()).hexdigest()
+            t0 = time.perf_counter()
+            if grouped:
+                writer.write(lambda db: insert_reading(db.cursor(), pid, pid, vals, 0.3, ts, 1, image_hash))
+            else:
+                with manager.write() as db_conn:
+                    insert_reading(db_conn.cursor(), pid, pid, vals, 0.3, ts, 1, image_hash)
+            ack_ms.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stats = writer.stats() if grouped else None
+    if grouped:
+        writer.close()
+    manager.close()
+    return elapsed, np.array(ack_ms), stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8, help="concurrent writing sessions")
+    parser.add_argument('--readings', type=int, default=200, help="readings written by each session")
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'], help="writer PRAGMA synchronous")
+    args = parser.parse_args(argv)
+
+    total = args.sessions * args.readings
+    print(f"{args.sessions} sessions x {args.readings} readings, synchronous={args.synchronous}")
+    print(f"{'mode':14} {'readings/s':>11} {'ack p50 ms':>11} {'ack p95 ms':>11} {'commits':>8}")
+    for grouped in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, ack, stats = run(os.path.join(tmp, 'bench.db'), args.sessions, args.readings, args.synchronous, grouped)
+        commits = stats['batches'] if grouped else total
+        print(f"{'group commit' if grouped else 'per reading':14} {total / elapsed:>11,.0f} {np.percentile(ack, 50):>11.2f} "
+              f"{np.percentile(ack, 95):>11.2f} {commits:>8,}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+History page data for one long-monitored patient: every raw reading (the old
+page) against sense.queries.history_window over the day / week / month rollups.
+
+Builds a throwaway database holding one patient with --readings home-monitoring
+readings spread over --years, then times the history fetch for the full span,
+the last year, the last quarter and the last week, plus the extra cost the
+rollup upserts add to each insert_reading. Nothing touches sense_health.db.
+
+    python benchmarks/history_rollups.py                     # 200,000 readings over 5 years
+    python benchmarks/history_rollups.py --readings 50000 --years 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sense.db import (active_scoring_model, init_db, insert_reading, rebuild_patient_stats, rebuild_reading_rollups,
+                      record_reading_rollups)
+from sense.queries import history_window
+
+INSERT_SAMPLE = 500
+RAW_HISTORY = "SELECT * FROM active_readings WHERE pid=? ORDER BY timestamp ASC"
+
+def populate(db_conn, readings, years, seed=11):
+    rng = np.random.default_rng(seed)
+    cursor = db_conn.cursor()
+    key = active_scoring_model(cursor)[0]
+    cursor.execute("INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES ('SENSE-000001', 'Home Monitor', '', '', ?, 0)",
+                   ((date.today() - timedelta(days=365 * years)).isoformat(),))
+    start = datetime.now() - timedelta(days=365 * years)
+    offsets = np.sort(rng.integers(0, 365 * years * 86400, readings))
+    vals = np.column_stack([rng.normal(95, 15, readings), rng.normal(14.2, 1.1, readings), rng.lognormal(3.0, 0.8, readings),
+                            rng.normal(150, 30, readings), np.abs(rng.normal(0.008, 0.008, readings))]).round(3)
+    cursor.executemany("INSERT INTO readings (pid, name, glucose, hb, ntprobnp, lpa, troponin, score, timestamp, profile_id) "
+                       "VALUES ('SENSE-000001', 'Home Monitor', ?, ?, ?, ?, ?, 0.3, ?, 1)",
+                       ((*v, (start + timedelta(seconds=int(t))).strftime('%Y-%m-%d %H:%M:%S'))
+                        for v, t in zip(vals.tolist(), offsets.tolist())))
+    cursor.execute("INSERT INTO reading_scores (model_key, reading_id, score) SELECT ?, rowid, score FROM readings", (key,))
+    t0 = time.perf_counter()
+    rebuild_patient_stats(cursor, ['SENSE-000001'])
+    rebuild_reading_rollups(cursor, ['SENSE-000001'])
+    db_conn.commit()
+    return key, time.perf_counter() - t0
+
+def raw_history(db_conn, pid):
+    """What the page fetched before rollups: every reading, as a DataFrame."""
+    cursor = db_conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(RAW_HISTORY, (pid,))
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description], coerce_float=True)
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times)), result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readings', type=int, default=200_000, help="readings on the patient's history")
+    parser.add_argument('--years', type=int, default=5, help="years the readings are spread over")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per fetch; the median is reported")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_conn, _ = init_db(os.path.join(tmp, 'bench.db'))
+        key, rebuild_s = populate(db_conn, args.readings, args.years)
+        print(f"{args.readings:,} readings over {args.years} years (rollups rebuilt in {rebuild_s:.1f}s)")
+        today = date.today()
+        raw_ms, raw = timed(lambda: raw_history(db_conn, 'SENSE-000001'), args.repeat)
+        print(f"{'window':14} {'readings':>9} {'resolution':>10} {'points':>7} {'ms':>8}")
+        print(f"{'old page':14} {len(raw):>9,} {'raw':>10} {len(raw):>7,} {raw_ms:>8.1f}")
+        for label, days in (("full span", 365 * args.years), ("last year", 365), ("last quarter", 91), ("last week", 7)):
+            ms, (df, resolution, n) = timed(lambda: history_window(db_conn, 'SENSE-000001', key, today - timedelta(days=days - 1), today),
+                                            args.repeat)
+            print(f"{label:14} {n:>9,} {resolution:>10} {len(df):>7,} {ms:>8.1f}")
+
+        cursor = db_conn.cursor()
+        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        vals, scores = [95.0, 14.2, 20.0, 150.0, 0.008], {key: 0.3}
+        with_ms, _ = timed(lambda: [insert_reading(cursor, 'SENSE-000001', 'Home Monitor', vals, 0.3, ts, 1, f"bench-{i}")
+                                    for i in range(INSERT_SAMPLE)], 1)
+        rollup_ms, _ = timed(lambda: [record_reading_rollups(cursor, 'SENSE-000001', 1, vals, ts, scores) for _ in range(INSERT_SAMPLE)], 1)
+        db_conn.rollback()
+        print(f"insert_reading {with_ms / INSERT_SAMPLE:.3f} ms, of which rollup upserts {rollup_ms / INSERT_SAMPLE:.3f} ms")
+        db_conn.close()
+
+if __name__ == '__main__':
+    main()
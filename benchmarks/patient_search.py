@@ -0,0 +1,84 @@
+"""
+Master Patient Directory search latency: the old three-column LIKE scan
+against the patients_fts trigram search (sense.queries.search_patients).
+
+Builds throwaway databases of synthetic patients at each --sizes entry and
+times a fixed set of searches (full name, surname, PID fragment, phone
+fragment, prefix, typo). Nothing touches sense_health.db.
+
+    python benchmarks/patient_search.py                      # 10^5 and 10^6 patients
+    python benchmarks/patient_search.py --sizes 100000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sense.db import init_db
+from sense.queries import search_patients
+
+FIRST = ["Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Meera", "Arjun", "Kavya", "Rohan", "Isha", "Karthik", "Divya",
+         "Suresh", "Lakshmi", "Nikhil", "Pooja", "John", "Maria", "David", "Fatima", "Omar", "Grace", "Samuel", "Aisha"]
+LAST = ["Sharma", "Iyer", "Reddy", "Nair", "Patel", "Gupta", "Menon", "Rao", "Khan", "Das", "Joshi", "Kulkarni",
+        "Fernandes", "Pillai", "Bose", "Chatterjee", "Singh", "Verma", "Mathew", "Thomas", "Hegde", "Shetty"]
+STREETS = ["MG Road", "Brigade Road", "Church Street", "Residency Road", "Hosur Road", "Bellary Road", "Old Airport Road",
+           "Sarjapur Road", "Bannerghatta Road", "Tumkur Road", "Mysore Road", "Kanakapura Road"]
+AREAS = ["Koramangala", "Indiranagar", "Jayanagar", "Whitefield", "Malleshwaram", "Basavanagudi", "Hebbal", "Yelahanka",
+         "Banashankari", "Rajajinagar", "Marathahalli", "HSR Layout"]
+LEGACY_SEARCH = "SELECT * FROM patients WHERE name LIKE ? OR pid LIKE ? OR address LIKE ?"
+
+def populate(db_conn, n, seed=3):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        name = f"{FIRST[rng.integers(len(FIRST))]} {LAST[rng.integers(len(LAST))]}"
+        address = f"{rng.integers(1, 999)} {STREETS[rng.integers(len(STREETS))]}, {AREAS[rng.integers(len(AREAS))]}"
+        rows.append((f"SENSE-{i:06X}", name, f"9{rng.integers(10**8, 10**9)}", address, f"2025-{rng.integers(1, 13):02d}-01"))
+    db_conn.executemany("INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES (?,?,?,?,?,0)", rows)
+    db_conn.commit()
+    return rows
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times)), result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000], help="patient counts to test")
+    parser.add_argument('--repeat', type=int, default=10, help="runs per search; the median is reported")
+    args = parser.parse_args(argv)
+
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_conn, _ = init_db(os.path.join(tmp, 'bench.db'))
+            t0 = time.perf_counter()
+            rows = populate(db_conn, n)
+            print(f"\n{n:,} patients (inserted with the FTS triggers in {time.perf_counter() - t0:.1f}s)")
+            sample = rows[n // 2]
+            searches = [
+                ("full name", sample[1]),
+                ("surname", sample[1].split()[1]),
+                ("PID fragment", sample[0][-4:]),
+                ("phone fragment", sample[2][3:8]),
+                ("prefix", sample[1][:4]),
+                ("typo", sample[1][:2] + sample[1][3] + sample[1][2] + sample[1][4:]),
+            ]
+            print(f"{'search':16} {'text':22} {'LIKE ms':>9} {'LIKE rows':>10} {'FTS ms':>9} {'FTS rows':>9} {'match':>6}")
+            for label, text in searches:
+                like_ms, like_rows = timed(lambda: db_conn.execute(LEGACY_SEARCH, (f'%{text}%',) * 3).fetchall(), args.repeat)
+                fts_ms, df = timed(lambda: search_patients(db_conn, text), args.repeat)
+                match = df['match'].iloc[0] if not df.empty else "-"
+                print(f"{label:16} {text:22} {like_ms:>9.2f} {len(like_rows):>10,} {fts_ms:>9.2f} {len(df):>9,} {match:>6}")
+            db_conn.close()
+
+if __name__ == '__main__':
+    main()
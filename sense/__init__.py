@@ -0,0 +1,6 @@
+"""
+SENSE AI analysis core: strip colorimetry, calibration and CRS scoring.
+
+Importable without Streamlit, so analysis worker processes (and anything else
+running headless) can use the exact same pipeline as the dashboard.
+"""
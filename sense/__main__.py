@@ -0,0 +1,319 @@
+"""
+Headless batch analyzer for strip folders and manifests.
+
+    python -m sense analyze <folder | manifest.csv> [--db sense_health.db] [--lot LOT]
+    python -m sense reanalyze [--db sense_health.db] [--profile ID]
+    python -m sense rescore [--db sense_health.db] [--model crs-v2] [--restart]
+    python -m sense models [--register crs-v2 spec.json] [--activate crs-v2]
+
+`analyze` streams strip photos through the same decode / registration /
+calibration / CRS pipeline as the dashboard, archives the raw images, writes
+readings in bulk (one transaction per chunk) and prints one JSON line per image
+on stdout. `reanalyze` re-scores archived readings in place; `rescore` fills a
+scoring model's per-reading scores from the stored biomarkers, resumably.
+Never imports Streamlit.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from sense.archive import ARCHIVE_ROOT, StripArchive
+from sense.backfill import BACKFILL_CHUNK_SIZE, rescore_readings
+from sense.calibration import BIOMARKER_KEYS, calibrate
+from sense.db import (DB_PATH, active_scoring_model, init_db, insert_reading, iter_archived_readings, load_calibration_lut,
+                      load_scoring_models, patient_names, register_scoring_model, resolve_calibration_profile,
+                      scoring_model_coverage, set_active_scoring_model, update_reading_values)
+from sense.quality import QUALITY_GATE
+from sense.intake import iter_strip_folder, iter_strip_manifest
+from sense.scoring import crs_scores, get_risk_label
+from sense.vision import DECODE_TARGET_LONG_SIDE, capture_device_id, strip_template_key
+from sense.workers import POOL_WORKERS, ScanPool, extract_job, rescan_job
+
+CLI_CHUNK_SIZE = 64
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def analyze_chunk(pool, conn, chunk, default_lot=None, decode_target=DECODE_TARGET_LONG_SIDE,
+                  templates=None, luts=None, dry_run=False, archive=None, quality_gate=QUALITY_GATE):
+    """
+    Scores one chunk of (path, pid, strip_lot) items and writes its readings in a
+    single transaction, archiving each scored image first when `archive` is set.
+    Returns one result dict per item, in input order.
+    """
+    cursor = conn.cursor()
+    templates = {} if templates is None else templates
+    luts = {} if luts is None else luts
+    registry = patient_names(cursor, [pid for _, pid, _ in chunk])
+    results, pending = [], []
+
+    for path, pid, lot in chunk:
+        r = {'file': path, 'pid': pid, 'status': None, 'score': None, 'risk': None, 'values': None,
+             'profile_id': None, 'image_hash': None, 'ms': None, 'error': None}
+        results.append(r)
+        if pid not in registry:
+            r['status'], r['error'] = 'skipped', 'PID not registered'
+            continue
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except OSError as e:
+            r['status'], r['error'] = 'error', str(e)
+            continue
+        device = capture_device_id(data)
+        tkey = strip_template_key(device, data, decode_target)
+        r['image_hash'] = hashlib.sha256(data).hexdigest()
+        r['profile_id'] = resolve_calibration_profile(cursor, device, lot or default_lot)
+        pending.append((r, tkey, data, pool.submit(extract_job, data, decode_target, templates.get(tkey), quality_gate, block=True)))
+
+    scanned = []
+    for r, tkey, data, fut in pending:
+        try:
+            out = fut.result()
+        except Exception as e:
+            r['status'], r['error'] = 'error', str(e)
+            continue
+        if out['rejected']:
+            r['status'], r['error'] = 'rejected', ' '.join(out['quality']['reasons'])
+            continue
+        if out['quad'] is not None and not out['reused']:
+            templates[tkey] = out['quad']
+        r['ms'] = round(out['worker_ms'], 1)
+        scanned.append((r, out['hsv'], data))
+
+    model = active_scoring_model(cursor)[2]
+    calibrate_groups(cursor, [(r, hsv) for r, hsv, _ in scanned], luts, model)
+    for r, _, _ in scanned:
+        r['risk'] = get_risk_label(r['score'], model)[0]
+
+    if dry_run:
+        for r, _, _ in scanned:
+            r['status'] = 'analyzed'
+        return results
+
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    scored = [r for r, _, _ in scanned]
+    try:
+        for r, _, data in scanned:
+            if archive is not None:
+                archive.put(data, r['image_hash'])
+            new = insert_reading(cursor, r['pid'], registry[r['pid']], list(r['values'].values()), r['score'], ts,
+                                 r['profile_id'], r['image_hash'])
+            r['status'] = 'committed' if new else 'duplicate'
+        conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        conn.rollback()
+        for r in scored:
+            r['status'], r['error'] = 'error', f"chunk rolled back: {e}"
+    return results
+
+def calibrate_groups(cursor, scanned, luts, model):
+    """Fills 'values' and 'score' (under `model`) on each (result, hsv) pair, one vectorised calibrate() call per profile."""
+    for profile_id in {r['profile_id'] for r, _ in scanned}:
+        group = [(r, hsv) for r, hsv in scanned if r['profile_id'] == profile_id]
+        if profile_id not in luts:
+            luts[profile_id] = load_calibration_lut(cursor, profile_id)
+        values = calibrate(np.stack([hsv for _, hsv in group]), luts[profile_id])
+        for (r, _), vals, score in zip(group, values.tolist(), crs_scores(values, model).tolist()):
+            r['values'], r['score'] = dict(zip(BIOMARKER_KEYS, vals)), score
+
+def reanalyze_chunk(pool, conn, rows, archive, profile_id=None, decode_target=DECODE_TARGET_LONG_SIDE,
+                    luts=None, dry_run=False):
+    """
+    Re-scores one page of iter_archived_readings rows from their archived images and
+    updates them in a single transaction. The reading's own profile is kept unless
+    `profile_id` overrides it. A reading is rewritten when its re-extracted biomarker
+    values or its profile differ from the stored ones, even if the score does not.
+    """
+    cursor = conn.cursor()
+    luts = {} if luts is None else luts
+    results, pending = [], []
+    old_profiles = {row[0]: row[3] for row in rows}
+    old_values = {row[0]: list(row[6:]) for row in rows}
+    for rowid, pid, image_hash, old_profile, old_score, tray_slot, *_ in rows:
+        r = {'rowid': rowid, 'pid': pid, 'image_hash': image_hash, 'tray_slot': tray_slot, 'status': None, 'old_score': old_score,
+             'score': None, 'values': None, 'profile_id': profile_id or old_profile, 'ms': None, 'error': None}
+        results.append(r)
+        if image_hash not in archive:
+            r['status'], r['error'] = 'missing', 'image not archived'
+            continue
+        pending.append((r, pool.submit(rescan_job, archive.root, image_hash, decode_target, tray_slot, block=True)))
+
+    scanned = []
+    for r, fut in pending:
+        try:
+            out = fut.result()
+        except Exception as e:
+            r['status'], r['error'] = 'error', str(e)
+            continue
+        r['ms'] = round(out['worker_ms'], 1)
+        scanned.append((r, out['hsv']))
+    calibrate_groups(cursor, scanned, luts, active_scoring_model(cursor)[2])
+
+    for r, _ in scanned:
+        unchanged = list(r['values'].values()) == old_values[r['rowid']] and r['profile_id'] == old_profiles[r['rowid']]
+        r['status'] = 'unchanged' if unchanged else 'rescored'
+    changed = [r for r, _ in scanned if r['status'] == 'rescored']
+    if dry_run or not changed:
+        return results
+    try:
+        for r in changed:
+            update_reading_values(cursor, r['rowid'], list(r['values'].values()), r['profile_id'])
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        for r in changed:
+            r['status'], r['error'] = 'error', f"chunk rolled back: {e}"
+    return results
+
+def cmd_analyze(args):
+    items = iter_strip_manifest(args.source) if os.path.isfile(args.source) else iter_strip_folder(args.source)
+    conn, _ = init_db(args.db)
+    pool = ScanPool(args.workers, max(2, 2 * args.workers))
+    templates, luts, counts = {}, {}, {}
+    t0 = time.perf_counter()
+    try:
+        for chunk in iter_chunks(items, args.chunk_size):
+            for r in analyze_chunk(pool, conn, chunk, args.lot, args.decode_target or None, templates, luts, args.dry_run,
+                                   None if args.no_archive else StripArchive(args.archive), not args.no_quality_gate):
+                counts[r['status']] = counts.get(r['status'], 0) + 1
+                print(json.dumps(r), flush=True)
+    finally:
+        pool.shutdown()
+        conn.close()
+    return report(counts, time.perf_counter() - t0)
+
+def cmd_reanalyze(args):
+    conn, cursor = init_db(args.db)
+    pool = ScanPool(args.workers, max(2, 2 * args.workers))
+    archive, luts, counts = StripArchive(args.archive), {}, {}
+    t0 = time.perf_counter()
+    after = 0
+    try:
+        while True:
+            rows = iter_archived_readings(cursor, after, args.chunk_size)
+            if not rows:
+                break
+            after = rows[-1][0]
+            for r in reanalyze_chunk(pool, conn, rows, archive, args.profile, args.decode_target or None, luts, args.dry_run):
+                counts[r['status']] = counts.get(r['status'], 0) + 1
+                print(json.dumps(r), flush=True)
+    finally:
+        pool.shutdown()
+        conn.close()
+    return report(counts, time.perf_counter() - t0)
+
+def cmd_rescore(args):
+    conn, _ = init_db(args.db)
+    t0, progress = time.perf_counter(), None
+    try:
+        for progress in rescore_readings(conn, args.model, args.chunk_size, args.restart, args.dry_run):
+            print(json.dumps(progress), flush=True)
+            print(f"rescore {progress['model_id']}: {progress['processed']} readings ({progress['remaining']} left, "
+                  f"{progress['rows_per_s']} rows/s), {progress['changed']} changed", file=sys.stderr, flush=True)
+    except ValueError as e:
+        print(f"rescore: {e}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - t0
+    if progress is None:
+        print("rescore: nothing to do (checkpoint is at the newest reading; --restart to rescore everything)", file=sys.stderr)
+    else:
+        print(f"rescore {'dry run ' if args.dry_run else ''}finished in {elapsed:.1f}s", file=sys.stderr)
+    return 0
+
+def cmd_models(args):
+    conn, cursor = init_db(args.db)
+    try:
+        if args.register:
+            model_id, spec_path = args.register
+            with open(spec_path) as fh:
+                register_scoring_model(cursor, model_id, json.load(fh))
+            conn.commit()
+            print(f"registered {model_id}; run 'python -m sense rescore --model {model_id}' before activating it", file=sys.stderr)
+        if args.activate:
+            keys = {mid: key for key, (mid, _) in load_scoring_models(cursor).items()}
+            if args.activate not in keys:
+                raise ValueError(f"Unknown scoring model {args.activate!r}")
+            set_active_scoring_model(cursor, keys[args.activate])
+            conn.commit()
+        active_key, coverage = active_scoring_model(cursor)[0], scoring_model_coverage(cursor)
+        for key, (model_id, spec) in load_scoring_models(cursor).items():
+            print(json.dumps({'model_id': model_id, 'active': key == active_key, 'scored_readings': coverage.get(key, 0),
+                              'weights': spec['weights'], 'bands': [b[0] for b in spec['bands']]}))
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"models: {e}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+    return 0
+
+def report(counts, elapsed):
+    total = sum(counts.values())
+    summary = ', '.join(f"{k} {v}" for k, v in sorted(counts.items())) or 'no strip images found'
+    print(f"{total} images in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} img/s): {summary}", file=sys.stderr)
+    return 1 if counts.get('error') else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sense', description="SENSE AI headless strip analysis")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('analyze', help="Score a folder of strip photos or a CSV manifest (path[,pid][,strip_lot])")
+    p.add_argument('source', help="Folder of strip images, or a CSV manifest")
+    p.add_argument('--db', default=DB_PATH, help=f"SQLite database to write readings to (default: {DB_PATH})")
+    p.add_argument('--lot', default=None, help="Strip lot for images whose manifest row has none")
+    p.add_argument('--workers', type=int, default=POOL_WORKERS, help="Analysis worker processes")
+    p.add_argument('--chunk-size', type=int, default=CLI_CHUNK_SIZE, help="Images per database transaction")
+    p.add_argument('--decode-target', type=int, default=DECODE_TARGET_LONG_SIDE,
+                   help="Reduced-decode target long side in px (0 = always full resolution)")
+    p.add_argument('--dry-run', action='store_true', help="Score and print results without writing readings")
+    p.add_argument('--archive', default=ARCHIVE_ROOT, help=f"Raw strip image archive (default: {ARCHIVE_ROOT})")
+    p.add_argument('--no-archive', action='store_true', help="Do not keep the raw images")
+    p.add_argument('--no-quality-gate', action='store_true', help="Score blurry / glare / badly exposed photos anyway")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser('reanalyze', help="Re-score archived readings in place (e.g. after a calibration or pipeline fix)")
+    p.add_argument('--db', default=DB_PATH, help=f"SQLite database whose readings are re-scored (default: {DB_PATH})")
+    p.add_argument('--archive', default=ARCHIVE_ROOT, help=f"Raw strip image archive (default: {ARCHIVE_ROOT})")
+    p.add_argument('--profile', type=int, default=None, help="Calibration profile to apply instead of each reading's own")
+    p.add_argument('--workers', type=int, default=POOL_WORKERS, help="Analysis worker processes")
+    p.add_argument('--chunk-size', type=int, default=CLI_CHUNK_SIZE, help="Readings per database transaction")
+    p.add_argument('--decode-target', type=int, default=DECODE_TARGET_LONG_SIDE,
+                   help="Reduced-decode target long side in px (0 = always full resolution)")
+    p.add_argument('--dry-run', action='store_true', help="Score and print results without updating readings")
+    p.set_defaults(func=cmd_reanalyze)
+
+    p = sub.add_parser('rescore', help="Precompute a scoring model's CRS for every reading (resumable)")
+    p.add_argument('--db', default=DB_PATH, help=f"SQLite database whose scores are recomputed (default: {DB_PATH})")
+    p.add_argument('--model', default=None, help="Scoring model id (default: the active model)")
+    p.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE, help="Readings per database transaction")
+    p.add_argument('--restart', action='store_true', help="Ignore the checkpoint and rescore every reading")
+    p.add_argument('--dry-run', action='store_true', help="Count stale scores without updating them")
+    p.set_defaults(func=cmd_rescore)
+
+    p = sub.add_parser('models', help="List, register or activate CRS scoring model versions")
+    p.add_argument('--db', default=DB_PATH, help=f"SQLite database holding the model registry (default: {DB_PATH})")
+    p.add_argument('--register', nargs=2, metavar=('MODEL_ID', 'SPEC_JSON'), help="Register a model spec from a JSON file")
+    p.add_argument('--activate', metavar='MODEL_ID', help="Point the dashboard at a fully precomputed model")
+    p.set_defaults(func=cmd_models)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Content-addressed archive of raw strip images.
+
+Every scanned photo is kept exactly as uploaded, under its SHA-256, so history
+can be re-scored after a calibration or pipeline fix. `readings.image_hash` is
+the link. Files are sharded two levels deep by hash prefix
+(ab/cd/abcd...) to keep directories small. Uploads are already JPEG/PNG
+compressed, so the encoded bytes are stored as-is: they are the smallest form
+on disk and can be memory-mapped straight into cv2.imdecode with no copy.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+
+from sense.vision import DECODE_TARGET_LONG_SIDE, decode_strip
+
+ARCHIVE_ROOT = os.environ.get('SENSE_ARCHIVE_DIR', 'strip_archive')
+ARCHIVE_SHARD_DEPTH = 2
+ARCHIVE_SHARD_WIDTH = 2
+
+class StripArchive:
+    def __init__(self, root=ARCHIVE_ROOT):
+        self.root = root
+
+    def path_for(self, image_hash):
+        shards = [image_hash[i * ARCHIVE_SHARD_WIDTH:(i + 1) * ARCHIVE_SHARD_WIDTH] for i in range(ARCHIVE_SHARD_DEPTH)]
+        return os.path.join(self.root, *shards, image_hash)
+
+    def __contains__(self, image_hash):
+        return os.path.exists(self.path_for(image_hash))
+
+    def put(self, data, image_hash=None):
+        """
+        Stores `data` under its content hash (no-op if already archived) and returns the hash.
+        Writes go to a temp file in the shard directory and are renamed into place, so
+        readers never see a partial image.
+        """
+        image_hash = image_hash or hashlib.sha256(data).hexdigest()
+        path = self.path_for(image_hash)
+        if os.path.exists(path):
+            return image_hash
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return image_hash
+
+    def read(self, image_hash):
+        """Original encoded bytes (e.g. for a full-resolution download), or None if not archived."""
+        try:
+            with open(self.path_for(image_hash), 'rb') as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def buffer(self, image_hash):
+        """Read-only memory map of an archived image. Views into it must not outlive the block."""
+        with open(self.path_for(image_hash), 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mm
+            finally:
+                mm.close()
+
+    def decode(self, image_hash, target=DECODE_TARGET_LONG_SIDE):
+        """Decodes an archived image straight from its memory map. Returns (BGR image or None, scale)."""
+        with self.buffer(image_hash) as mm:
+            return decode_strip(mm, target)
+
+    def __iter__(self):
+        """Streams archived image hashes shard by shard without listing the whole archive into memory."""
+        yield from self._walk(self.root, ARCHIVE_SHARD_DEPTH)
+
+    def _walk(self, path, depth):
+        try:
+            entries = sorted(e.name for e in os.scandir(path) if not e.name.startswith('.'))
+        except FileNotFoundError:
+            return
+        for name in entries:
+            if depth:
+                yield from self._walk(os.path.join(path, name), depth - 1)
+            else:
+                yield name
@@ -0,0 +1,79 @@
+"""
+Resumable bulk re-scoring of stored readings.
+
+A newly registered scoring model has no scores yet, and a stored score goes
+stale if a reading's values change outside the normal write paths. The backfill
+streams readings in rowid order (keyset, so memory is bounded by the chunk
+size), scores each chunk under one model with the vectorised scorer and writes
+only missing or changed scores, the affected patients' trend statistics and a
+checkpoint in one transaction per chunk.
+An interrupted run picks up after the last committed chunk.
+"""
+import time
+
+import numpy as np
+
+from sense.db import (active_scoring_model, iter_reading_values, load_backfill_state, load_scoring_models,
+                      reading_pids, rebuild_patient_stats, rebuild_reading_rollups, reset_backfill_state, save_backfill_state,
+                      store_reading_scores)
+from sense.scoring import crs_scores
+
+RESCORE_JOB = 'crs_rescore'
+BACKFILL_CHUNK_SIZE = 5000
+
+def count_readings(cursor, after_rowid=0):
+    cursor.execute("SELECT COUNT(*) FROM readings WHERE rowid > ?", (after_rowid,))
+    return cursor.fetchone()[0]
+
+def rescore_readings(conn, model_id=None, chunk_size=BACKFILL_CHUNK_SIZE, restart=False, dry_run=False):
+    """
+    Scores readings under `model_id` (default: the active model) chunk by chunk,
+    yielding a progress dict after each one. Each model has its own checkpoint.
+    Resumes from the job's checkpoint unless `restart`; a dry run neither
+    updates scores nor moves the checkpoint. Readings with a missing biomarker
+    value are left untouched.
+    """
+    cursor = conn.cursor()
+    models = {mid: (key, spec) for key, (mid, spec) in load_scoring_models(cursor).items()}
+    if model_id is None:
+        model_id = active_scoring_model(cursor)[1]
+    if model_id not in models:
+        raise ValueError(f"Unknown scoring model {model_id!r}")
+    model_key, spec = models[model_id]
+    job = f"{RESCORE_JOB}:{model_id}"
+    if restart and not dry_run:
+        reset_backfill_state(cursor, job)
+        conn.commit()
+    state = (None if restart else load_backfill_state(cursor, job)) or {'last_rowid': 0, 'processed': 0, 'changed': 0}
+    after, processed, changed = state['last_rowid'], state['processed'], state['changed']
+    remaining = count_readings(cursor, after)
+    done, t0 = 0, time.perf_counter()
+
+    while True:
+        rows = iter_reading_values(cursor, model_key, after, chunk_size)
+        if not rows:
+            break
+        a = np.array([tuple(r) for r in rows], dtype=np.float64)  # NULL -> nan
+        rowids, values, old = a[:, 0].astype(np.int64), a[:, 1:6], a[:, 6]
+        scorable = np.isfinite(values).all(axis=1)
+        new = np.full(len(rows), np.nan)
+        new[scorable] = crs_scores(values[scorable], spec)
+        stale = scorable & ~(new == old)
+        after = int(rowids[-1])
+        processed, changed, done = processed + len(rows), changed + int(stale.sum()), done + len(rows)
+
+        if not dry_run:
+            try:
+                store_reading_scores(cursor, model_key, zip(new[stale].tolist(), rowids[stale].tolist()))
+                pids = reading_pids(cursor, rowids[stale].tolist())
+                rebuild_patient_stats(cursor, pids, model_key)
+                rebuild_reading_rollups(cursor, pids, model_key)
+                save_backfill_state(cursor, job, after, processed, changed)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        elapsed = time.perf_counter() - t0
+        yield {'job': job, 'model_id': model_id, 'last_rowid': after, 'chunk_rows': len(rows), 'chunk_changed': int(stale.sum()),
+               'skipped': int((~scorable).sum()), 'processed': processed, 'changed': changed,
+               'remaining': max(remaining - done, 0), 'rows_per_s': round(done / elapsed, 1) if elapsed else None}
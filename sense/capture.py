@@ -0,0 +1,159 @@
+"""
+Live strip capture from a camera (or a video file standing in for one).
+
+A background thread keeps only the newest frame, so when analysis falls behind
+the stale frames are dropped instead of queued. Each analysed frame gets the
+cheap path: a downscaled copy, registration that re-verifies the previous
+frame's quad first, and ROI-first pad extraction. Capture stops as soon as
+every pad's saturation has held steady over k consecutive frames.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from sense.vision import scan_strip
+
+CAPTURE_STABLE_FRAMES = 5
+CAPTURE_STABLE_TOLERANCE = 4.0  # max per-pad saturation spread (0-255) across the window
+CAPTURE_ANALYSIS_LONG_SIDE = 640
+CAPTURE_TIMEOUT_S = 20
+CAPTURE_DEFAULT_FPS = 30.0
+
+class CapturedFrame:
+    """Locked frame handed to the still-image scan flow (same interface as an upload)."""
+
+    def __init__(self, name, data):
+        self.name, self.data = name, data
+
+    def getvalue(self):
+        return self.data
+
+class LatestFrameGrabber:
+    """
+    Reads `source` (camera index or video path) on a daemon thread and keeps only
+    the newest frame. Video files are paced at their native frame rate so they
+    behave like a live camera.
+    """
+
+    def __init__(self, source):
+        src = int(source) if str(source).strip().isdigit() else source
+        self._cap = cv2.VideoCapture(src)
+        if not self._cap.isOpened():
+            raise ValueError(f"Cannot open video source {source!r}")
+        fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else CAPTURE_DEFAULT_FPS
+        self._paced = not isinstance(src, int)
+        self._cond = threading.Condition()
+        self._frame, self._seq, self._taken = None, 0, 0
+        self.dropped, self.eof = 0, False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval, next_t = 1.0 / self.fps, time.perf_counter()
+        while not self._stop.is_set():
+            ok, frame = self._cap.read()
+            if not ok:
+                break
+            with self._cond:
+                if self._seq > self._taken:
+                    self.dropped += 1
+                self._frame, self._seq = frame, self._seq + 1
+                self._cond.notify_all()
+            if self._paced:
+                next_t += interval
+                time.sleep(max(0.0, next_t - time.perf_counter()))
+        self._cap.release()
+        with self._cond:
+            self.eof = True
+            self._cond.notify_all()
+
+    @property
+    def captured(self):
+        return self._seq
+
+    def read(self, timeout=1.0):
+        """Newest frame not returned before, waiting up to `timeout`. Returns (seq, frame) or (None, None) once the stream ends."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > self._taken or self.eof, timeout)
+            if self._seq > self._taken:
+                self._taken = self._seq
+                return self._seq, self._frame
+            return None, None
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PadStabilizer:
+    """Sliding window of per-frame pad HSV means; stable once every pad's saturation spread is within tolerance."""
+
+    def __init__(self, k=CAPTURE_STABLE_FRAMES, tolerance=CAPTURE_STABLE_TOLERANCE):
+        self.tolerance = tolerance
+        self.window = deque(maxlen=k)
+
+    def update(self, hsv):
+        self.window.append(hsv)
+        return len(self.window) == self.window.maxlen and self.spread() <= self.tolerance
+
+    def spread(self):
+        """Largest per-pad saturation range across the window (inf until a pad has been seen in every frame)."""
+        sat = np.stack(self.window)[:, :, 1]
+        return float(np.max(np.ptp(sat, axis=0))) if not np.isnan(sat).any() else float('inf')
+
+    def mean_hsv(self):
+        return np.mean(np.stack(self.window), axis=0)
+
+def analyze_frame(frame, template=None, long_side=CAPTURE_ANALYSIS_LONG_SIDE):
+    """Cheap per-frame scan on a downscaled copy. Returns (analysed image, scan)."""
+    h, w = frame.shape[:2]
+    f = min(1.0, long_side / max(h, w))
+    small = cv2.resize(frame, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA) if f < 1 else frame
+    return small, scan_strip(small, template)
+
+def capture_until_stable(grabber, k=CAPTURE_STABLE_FRAMES, tolerance=CAPTURE_STABLE_TOLERANCE,
+                         timeout=CAPTURE_TIMEOUT_S, on_frame=None):
+    """
+    Analyses the newest frame until the pads are stable over `k` frames, the
+    stream ends or `timeout` seconds pass. `on_frame(image, scan, stats)` is
+    called after every analysed frame. Returns the locked full-resolution
+    frame, the window's mean pad HSV and timing stats.
+    """
+    stabilizer, template, frame_ms = PadStabilizer(k, tolerance), None, []
+    frame, stable = None, False
+    t_start = time.perf_counter()
+
+    def stats():
+        return {'frames_captured': grabber.captured, 'frames_analyzed': len(frame_ms), 'frames_dropped': grabber.dropped,
+                'frame_interval_ms': round(1000 / grabber.fps, 1),
+                'frame_p50_ms': round(float(np.median(frame_ms)), 1) if frame_ms else None,
+                'frame_max_ms': round(max(frame_ms), 1) if frame_ms else None,
+                'spread': stabilizer.spread() if stabilizer.window else None,
+                'elapsed_s': round(time.perf_counter() - t_start, 2)}
+
+    while not stable and time.perf_counter() - t_start < timeout:
+        _, next_frame = grabber.read()
+        if next_frame is None:
+            if grabber.eof:
+                break
+            continue
+        frame = next_frame
+        t0 = time.perf_counter()
+        small, scan = analyze_frame(frame, template)
+        template = scan['quad']
+        stable = stabilizer.update(scan['hsv'])
+        frame_ms.append((time.perf_counter() - t0) * 1000)
+        if on_frame:
+            on_frame(small, scan, stats())
+
+    return {'stable': stable, 'frame': frame, 'hsv': stabilizer.mean_hsv() if stabilizer.window else None, **stats()}
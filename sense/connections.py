@@ -0,0 +1,292 @@
+"""
+Pooled SQLite access for the dashboard.
+
+Every Streamlit session runs on its own thread, so one shared connection and
+cursor would serialise all users and could interleave fetch results. Instead a
+ConnectionManager hands out short-lived connections per request: a bounded pool
+of read-only connections (WAL, so reads never wait for a write) and a single
+writer connection behind a lock, so write transactions are serialised in
+process rather than fighting over SQLite's file lock. Waits and usage are
+recorded for the telemetry panel.
+
+Scan and care-plan writes go through a GroupCommitWriter on top of that writer.
+One thread drains a bounded queue and commits everything pending in a single
+transaction, so a burst of readings pays for one commit instead of one each.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+
+from sense.db import DB_PATH, connect, init_db
+
+DB_READERS = int(os.environ.get('SENSE_DB_READERS', 4))
+DB_ACQUIRE_TIMEOUT_S = float(os.environ.get('SENSE_DB_ACQUIRE_TIMEOUT_S', 10))
+DB_WAIT_WINDOW = 1024
+WRITE_QUEUE_DEPTH = int(os.environ.get('SENSE_WRITE_QUEUE_DEPTH', 1024))
+WRITE_BATCH_SIZE = int(os.environ.get('SENSE_WRITE_BATCH_SIZE', 64))
+WRITE_MAX_DELAY_MS = float(os.environ.get('SENSE_WRITE_MAX_DELAY_MS', 0))  # linger for more jobs; 0 = commit what has queued
+WRITE_HISTOGRAM_BINS = 10
+WRITE_CLOSE_TIMEOUT_S = float(os.environ.get('SENSE_WRITE_CLOSE_TIMEOUT_S', 10))  # close() gives up on a wedged queue after this
+WRITE_STOP_POLL_S = 0.25
+
+class ConnectionPoolTimeout(RuntimeError):
+    """Raised when no connection frees up within the acquire timeout."""
+
+class WriteQueueFull(ConnectionPoolTimeout):
+    """Raised when the group-commit queue stays full for the whole acquire timeout."""
+
+class ConnectionManager:
+    """One serialised writer plus a bounded pool of read-only connections to one database file."""
+
+    def __init__(self, path=DB_PATH, readers=DB_READERS, acquire_timeout=DB_ACQUIRE_TIMEOUT_S):
+        self.path, self.readers, self.acquire_timeout = path, readers, acquire_timeout
+        self._writer, _ = init_db(path)  # schema / migrations run once, on the writer
+        self._write_lock = threading.Lock()
+        self._idle = queue.LifoQueue(maxsize=readers)
+        for _ in range(readers):
+            self._idle.put(connect(path, readonly=True))
+        self._lock = threading.Lock()
+        self._waits = {'read': deque(maxlen=DB_WAIT_WINDOW), 'write': deque(maxlen=DB_WAIT_WINDOW)}
+        self._counts = {'reads': 0, 'writes': 0, 'rollbacks': 0, 'timeouts': 0, 'readers_in_use': 0, 'writer_in_use': 0}
+
+    def _record(self, kind, wait_ms):
+        with self._lock:
+            self._waits[kind].append(wait_ms)
+            self._counts[f'{kind}s'] += 1
+            self._counts['readers_in_use' if kind == 'read' else 'writer_in_use'] += 1
+
+    def _release(self, kind):
+        with self._lock:
+            self._counts['readers_in_use' if kind == 'read' else 'writer_in_use'] -= 1
+
+    def _timeout(self, what):
+        with self._lock:
+            self._counts['timeouts'] += 1
+        raise ConnectionPoolTimeout(f"No {what} connection free after {self.acquire_timeout:g}s")
+
+    @contextmanager
+    def read(self):
+        """Borrows a read-only connection for one request; it goes back to the pool on exit."""
+        t0 = time.perf_counter()
+        try:
+            db_conn = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            self._timeout("read")
+        self._record('read', (time.perf_counter() - t0) * 1000)
+        try:
+            yield db_conn
+        finally:
+            if db_conn.in_transaction:
+                db_conn.rollback()
+            self._release('read')
+            self._idle.put(db_conn)
+
+    @contextmanager
+    def write(self):
+        """
+        Exclusive use of the writer for one transaction: commits on a clean exit,
+        rolls back and re-raises on an exception.
+        """
+        t0 = time.perf_counter()
+        if not self._write_lock.acquire(timeout=self.acquire_timeout):
+            self._timeout("write")
+        self._record('write', (time.perf_counter() - t0) * 1000)
+        try:
+            yield self._writer
+            self._writer.commit()
+        except BaseException:
+            self._writer.rollback()
+            with self._lock:
+                self._counts['rollbacks'] += 1
+            raise
+        finally:
+            self._release('write')
+            self._write_lock.release()
+
+    def stats(self):
+        with self._lock:
+            waits = {k: np.array(v) if v else None for k, v in self._waits.items()}
+            stats = {'readers': self.readers, **self._counts}
+        for kind, w in waits.items():
+            stats[f'{kind}_wait_p50_ms'] = round(float(np.percentile(w, 50)), 2) if w is not None else None
+            stats[f'{kind}_wait_p95_ms'] = round(float(np.percentile(w, 95)), 2) if w is not None else None
+            stats[f'{kind}_wait_max_ms'] = round(float(w.max()), 2) if w is not None else None
+        return stats
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+class GroupCommitWriter:
+    """
+    Write-behind queue in front of a ConnectionManager's writer. Jobs queued by
+    any session are applied by one thread. Whatever is pending is committed
+    together, as soon as WRITE_BATCH_SIZE jobs have gathered or WRITE_MAX_DELAY_MS
+    has passed since the first of them. Pages wait for their own commit, so
+    lingering rarely gathers more jobs. By default each batch takes only what
+    queued up during the previous commit. Each job runs inside its own
+    savepoint, so a failing job is rolled back alone and the rest of the batch
+    still commits.
+    """
+
+    def __init__(self, manager, queue_depth=WRITE_QUEUE_DEPTH, batch_size=WRITE_BATCH_SIZE, max_delay_ms=WRITE_MAX_DELAY_MS):
+        self.manager, self.queue_depth, self.batch_size, self.max_delay_ms = manager, queue_depth, batch_size, max_delay_ms
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._submit_lock = threading.Lock()  # orders submits against close(), so nothing lands behind the stop marker
+        self._closed = False
+        self._stop = threading.Event()  # fallback for close() when the stop marker cannot be queued
+        self._lock = threading.Lock()
+        self._history = {'queue_depth': deque(maxlen=DB_WAIT_WINDOW), 'batch_size': deque(maxlen=DB_WAIT_WINDOW),
+                         'commit_ms': deque(maxlen=DB_WAIT_WINDOW), 'ack_ms': deque(maxlen=DB_WAIT_WINDOW)}
+        self._counts = {'submitted': 0, 'committed': 0, 'failed': 0, 'rejected': 0, 'batches': 0}
+        self._thread = threading.Thread(target=self._run, name='sense-group-commit', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args, timeout=None):
+        """
+        Queues fn(db_conn, *args) for the next group commit. The returned Future
+        resolves once the batch holding the job has committed, to fn's return
+        value or to its exception (the job's writes are then rolled back). Jobs
+        must not commit themselves. A queue that stays full for `timeout` seconds
+        (default: the manager's acquire timeout) raises WriteQueueFull.
+        """
+        fut = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("Group-commit writer is closed")
+            try:
+                self._queue.put((fn, args, fut, time.perf_counter()), timeout=self.manager.acquire_timeout if timeout is None else timeout)
+            except queue.Full:
+                with self._lock:
+                    self._counts['rejected'] += 1
+                raise WriteQueueFull(f"Write queue is full ({self.queue_depth} jobs pending)") from None
+        with self._lock:
+            self._counts['submitted'] += 1
+        return fut
+
+    def write(self, fn, *args):
+        """submit() and wait for the commit: fn's return value, or its exception re-raised."""
+        return self.submit(fn, *args).result()
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=WRITE_STOP_POLL_S)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if job is None:
+                return
+            batch, deadline, stop = [job], time.perf_counter() + self.max_delay_ms / 1000, False
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        depth = self._queue.qsize()
+        batch = [job for job in batch if job[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        t0 = time.perf_counter()
+        try:
+            with self.manager.write() as db_conn:
+                db_conn.execute("BEGIN IMMEDIATE")
+                for fn, args, fut, _ in batch:
+                    db_conn.execute("SAVEPOINT job")
+                    try:
+                        outcomes.append((fut, fn(db_conn, *args), None))
+                    except Exception as e:
+                        db_conn.execute("ROLLBACK TO job")
+                        outcomes.append((fut, None, e))
+                    db_conn.execute("RELEASE job")
+        except BaseException as e:  # BEGIN or COMMIT failed: nothing in this batch reached the database
+            with self._lock:
+                self._counts['failed'] += len(batch)
+            for _, _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        done = time.perf_counter()
+        with self._lock:
+            self._history['queue_depth'].append(depth)
+            self._history['batch_size'].append(len(batch))
+            self._history['commit_ms'].append((done - t0) * 1000)
+            self._history['ack_ms'].extend((done - job[3]) * 1000 for job in batch)
+            self._counts['batches'] += 1
+            for _, _, exc in outcomes:
+                self._counts['failed' if exc is not None else 'committed'] += 1
+        for fut, value, exc in outcomes:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(value)
+
+    def stats(self):
+        with self._lock:
+            history = {k: np.array(v) if v else None for k, v in self._history.items()}
+            stats = {'queue_depth': self._queue.qsize(), 'queue_capacity': self.queue_depth, 'batch_limit': self.batch_size,
+                     'max_delay_ms': self.max_delay_ms, **self._counts}
+        for key in ('batch_size', 'commit_ms', 'ack_ms'):
+            h = history[key]
+            stats[f'{key}_p50'] = round(float(np.percentile(h, 50)), 2) if h is not None else None
+            stats[f'{key}_p95'] = round(float(np.percentile(h, 95)), 2) if h is not None else None
+            stats[f'{key}_max'] = round(float(h.max()), 2) if h is not None else None
+        return stats
+
+    def histograms(self, bins=WRITE_HISTOGRAM_BINS):
+        """
+        {'queue_depth' | 'batch_size' | 'commit_ms' | 'ack_ms': (counts, bin_edges)}
+        over the most recent batches (queue depth is sampled as each batch starts,
+        ack_ms is per job, from submit to commit), or None before the first batch.
+        """
+        with self._lock:
+            history = {k: np.array(v) for k, v in self._history.items()}
+        return {k: np.histogram(h, bins=bins) if h.size else None for k, h in history.items()}
+
+    def close(self, timeout=WRITE_CLOSE_TIMEOUT_S):
+        """
+        Stops taking jobs, commits everything already queued and waits up to
+        `timeout` seconds for the thread to finish. If the queue is too full to
+        take the stop marker, the thread stops once it has drained it. Jobs left
+        behind by a dead thread fail instead of hanging their callers.
+        Registered with atexit; safe to call more than once.
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = time.perf_counter() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            self._stop.set()
+        self._thread.join(max(deadline - time.perf_counter(), 0))
+        if self._thread.is_alive():
+            return
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job[2].set_running_or_notify_cancel():
+                job[2].set_exception(RuntimeError("Group-commit writer is closed"))
@@ -0,0 +1,788 @@
+"""
+SQLite schema and the clinical-record queries shared by the dashboard and the
+headless tools. Functions take an explicit cursor; nothing here imports Streamlit.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from sense.calibration import BIOMARKER_KEYS, CALIBRATION_LUT, DEFAULT_CALIBRATION_CURVES, compile_calibration_curves, validate_calibration_curves
+from sense.scoring import CRS_MODEL, CRS_MODEL_ID, crs_scores, validate_scoring_model
+
+DB_PATH = 'sense_health.db'
+DB_BUSY_TIMEOUT_S = 10
+DB_STATEMENT_CACHE = int(os.environ.get('SENSE_DB_STATEMENT_CACHE', 256))  # compiled statements kept per connection
+
+def connect(path=DB_PATH, readonly=False):
+    """
+    Connection with the shared pragmas: WAL (readers never block on the writer
+    and vice versa), synchronous=NORMAL (durable at checkpoints, no fsync per
+    commit), a DB_STATEMENT_CACHE-entry prepared-statement cache and Row
+    results. Read-only connections refuse writes.
+    """
+    db_conn = sqlite3.connect(path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_S, cached_statements=DB_STATEMENT_CACHE)
+    db_conn.row_factory = sqlite3.Row
+    db_conn.execute("PRAGMA journal_mode=WAL")
+    db_conn.execute("PRAGMA synchronous=NORMAL")
+    if readonly:
+        db_conn.execute("PRAGMA query_only=1")
+    return db_conn
+
+def init_db(path=DB_PATH):
+    """Opens the database and brings its schema up to date (see SCHEMA_MIGRATIONS)."""
+    db_conn = connect(path)
+    migrate(db_conn)
+    return db_conn, db_conn.cursor()
+
+def schema_version(cursor):
+    """Highest applied migration (0 for a database that predates schema_version)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'")
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def migrate(db_conn, target=None):
+    """
+    Applies the pending SCHEMA_MIGRATIONS in order (up to `target`), each in its
+    own IMMEDIATE transaction together with its schema_version row, so a failed
+    step leaves the previous version intact and two processes starting at once
+    cannot apply the same step twice. Returns the versions applied.
+    """
+    cursor = db_conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied DATETIME
+        )
+    ''')
+    applied, current = [], schema_version(cursor)
+    for version, description, step in SCHEMA_MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if version > schema_version(cursor):  # another process may have applied it meanwhile
+                step(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description, applied) VALUES (?,?,?)",
+                               (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                applied.append(version)
+            db_conn.commit()
+        except BaseException:
+            db_conn.rollback()
+            raise
+    return applied
+
+def _migrate_baseline(db_cursor):
+    """Version 1: the schema as it stood before versioned migrations (every statement is idempotent)."""
+    # --- 1. USER AUTHENTICATION TABLE ---
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT,
+            role TEXT
+        )
+    ''')
+    
+    # Default Credentials Check
+    db_cursor.execute("SELECT * FROM users")
+    if not db_cursor.fetchone():
+        db_cursor.execute("INSERT INTO users VALUES (?, ?, ?)", ("admin", "admin123", "Doctor"))
+    
+    # --- 2. PATIENT REGISTRY (MASTER DATA) ---
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS patients (
+            pid TEXT PRIMARY KEY, 
+            name TEXT, 
+            phone TEXT,
+            address TEXT,
+            join_date TEXT, 
+            streak INTEGER DEFAULT 0
+        )
+    ''')
+
+    # --- AUTO-MIGRATION LOGIC---
+    db_cursor.execute("PRAGMA table_info(patients)")
+    columns = [column[1] for column in db_cursor.fetchall()]
+    if 'phone' not in columns:
+        db_cursor.execute('ALTER TABLE patients ADD COLUMN phone TEXT')
+    if 'address' not in columns:
+        db_cursor.execute('ALTER TABLE patients ADD COLUMN address TEXT')
+    
+    # --- 3. 5-PLEX DIAGNOSTIC REPOSITORY (READINGS) ---
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS readings (
+            pid TEXT, 
+            name TEXT, 
+            glucose REAL, 
+            hb REAL, 
+            ntprobnp REAL, 
+            lpa REAL, 
+            troponin REAL, 
+            score REAL, 
+            timestamp DATETIME,
+            FOREIGN KEY (pid) REFERENCES patients(pid)
+        )
+    ''')
+
+    # --- 3b. CALIBRATION PROFILE STORE (PER DEVICE / STRIP LOT) ---
+    # Append-only: re-calibrating a device or lot adds a new profile_id, so every
+    # reading keeps pointing at the exact curves that produced it. '*' = any.
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calibration_profiles (
+            profile_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device TEXT NOT NULL DEFAULT '*',
+            strip_lot TEXT NOT NULL DEFAULT '*',
+            curves TEXT NOT NULL,
+            created DATETIME
+        )
+    ''')
+    db_cursor.execute("SELECT 1 FROM calibration_profiles WHERE device='*' AND strip_lot='*'")
+    if not db_cursor.fetchone():
+        db_cursor.execute("INSERT INTO calibration_profiles (device, strip_lot, curves, created) VALUES ('*', '*', ?, ?)",
+                          (json.dumps(DEFAULT_CALIBRATION_CURVES), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    db_cursor.execute("PRAGMA table_info(readings)")
+    reading_columns = [column[1] for column in db_cursor.fetchall()]
+    if 'profile_id' not in reading_columns:
+        db_cursor.execute('ALTER TABLE readings ADD COLUMN profile_id INTEGER REFERENCES calibration_profiles(profile_id)')
+    if 'image_hash' not in reading_columns:
+        db_cursor.execute('ALTER TABLE readings ADD COLUMN image_hash TEXT')
+    if 'tray_slot' not in reading_columns:  # 1-based strip position when the reading came from a tray photo
+        db_cursor.execute('ALTER TABLE readings ADD COLUMN tray_slot INTEGER')
+    # Idempotent scan commits: one reading per (patient, strip image content). Legacy rows have NULL hashes.
+    db_cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_pid_image ON readings (pid, image_hash)')
+
+    # --- 4. CARE PLAN REPOSITORY (PHYSICIAN NOTES) ---
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS care_plans (
+            pid TEXT PRIMARY KEY,
+            nutrition TEXT,
+            activity TEXT,
+            supplements TEXT,
+            last_updated DATETIME,
+            FOREIGN KEY (pid) REFERENCES patients(pid)
+        )
+    ''')
+
+    # --- 5. RESUMABLE BACKFILL CHECKPOINTS ---
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_state (
+            job TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            started DATETIME,
+            updated DATETIME
+        )
+    ''')
+
+    # --- 6. SCORING MODEL REGISTRY ---
+    # Append-only model specs; every reading is scored under every model in the
+    # compact reading_scores side table, so switching the active model is a
+    # one-row pointer update and pages read precomputed scores.
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scoring_models (
+            model_key INTEGER PRIMARY KEY,
+            model_id TEXT UNIQUE NOT NULL,
+            spec TEXT NOT NULL,
+            created DATETIME
+        )
+    ''')
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reading_scores (
+            model_key INTEGER NOT NULL REFERENCES scoring_models(model_key),
+            reading_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (model_key, reading_id)
+        ) WITHOUT ROWID
+    ''')
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scoring_active (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            model_key INTEGER NOT NULL REFERENCES scoring_models(model_key)
+        )
+    ''')
+    db_cursor.execute("SELECT 1 FROM scoring_models WHERE model_id=?", (CRS_MODEL_ID,))
+    if not db_cursor.fetchone():
+        db_cursor.execute("INSERT INTO scoring_models (model_id, spec, created) VALUES (?,?,?)",
+                          (CRS_MODEL_ID, json.dumps(CRS_MODEL), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        # Existing readings were scored by this formula when they were written.
+        db_cursor.execute("INSERT OR IGNORE INTO reading_scores (model_key, reading_id, score) "
+                          "SELECT ?, rowid, score FROM readings WHERE score IS NOT NULL", (db_cursor.lastrowid,))
+    db_cursor.execute("INSERT OR IGNORE INTO scoring_active (id, model_key) "
+                      "SELECT 1, model_key FROM scoring_models WHERE model_id=?", (CRS_MODEL_ID,))
+    db_cursor.execute(ACTIVE_READINGS_VIEW)
+
+    # --- 7. PER-PATIENT RUNNING STATISTICS ---
+    # Updated with every reading write so the history page's metric row is one
+    # keyed lookup. Score statistics are kept per scoring model; the trend slope
+    # comes from running least-squares sums over days since the first reading.
+    db_cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='patient_stats'")
+    stats_missing = db_cursor.fetchone() is None
+    db_cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS patient_stats (
+            pid TEXT PRIMARY KEY,
+            readings INTEGER NOT NULL,
+            first_ts DATETIME,
+            last_ts DATETIME,
+            last_reading_id INTEGER,
+            prev_reading_id INTEGER,
+            {', '.join(f'{k}_min REAL, {k}_max REAL' for k in BIOMARKER_KEYS)}
+        )
+    ''')
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS patient_score_stats (
+            model_key INTEGER NOT NULL,
+            pid TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            last_score REAL,
+            prev_score REAL,
+            ewma REAL,
+            t0 REAL,
+            sum_t REAL, sum_s REAL, sum_tt REAL, sum_ts REAL,
+            PRIMARY KEY (model_key, pid)
+        ) WITHOUT ROWID
+    ''')
+    if stats_missing:
+        rebuild_patient_stats(db_cursor)
+
+# Readings as seen through the active model: same columns as `readings`, score = active model's score.
+ACTIVE_READINGS_VIEW = '''
+    CREATE VIEW IF NOT EXISTS active_readings AS
+    SELECT r.rowid AS reading_id, r.pid, r.name, r.glucose, r.hb, r.ntprobnp, r.lpa, r.troponin,
+           s.score, r.timestamp, r.profile_id, r.image_hash, r.tray_slot
+    FROM readings r
+    JOIN scoring_active a
+    LEFT JOIN reading_scores s ON s.model_key = a.model_key AND s.reading_id = r.rowid
+'''
+
+def _migrate_reading_primary_key(db_cursor):
+    """
+    Version 2: rebuilds `readings` with an explicit `reading_id INTEGER PRIMARY
+    KEY`. It aliases the old implicit rowid (copied over unchanged), so every
+    rowid reference keeps working, but VACUUM can no longer renumber the ids
+    that reading_scores and patient_stats point at.
+    """
+    db_cursor.execute("PRAGMA table_info(readings)")
+    if any(column[5] for column in db_cursor.fetchall()):
+        return
+    columns = "pid, name, glucose, hb, ntprobnp, lpa, troponin, score, timestamp, profile_id, image_hash, tray_slot"
+    db_cursor.execute("DROP VIEW IF EXISTS active_readings")
+    db_cursor.execute('''
+        CREATE TABLE readings_v2 (
+            reading_id INTEGER PRIMARY KEY,
+            pid TEXT,
+            name TEXT,
+            glucose REAL,
+            hb REAL,
+            ntprobnp REAL,
+            lpa REAL,
+            troponin REAL,
+            score REAL,
+            timestamp DATETIME,
+            profile_id INTEGER REFERENCES calibration_profiles(profile_id),
+            image_hash TEXT,
+            tray_slot INTEGER,
+            FOREIGN KEY (pid) REFERENCES patients(pid)
+        )
+    ''')
+    db_cursor.execute(f"INSERT INTO readings_v2 (reading_id, {columns}) SELECT rowid, {columns} FROM readings ORDER BY rowid")
+    db_cursor.execute("DROP TABLE readings")
+    db_cursor.execute("ALTER TABLE readings_v2 RENAME TO readings")
+    db_cursor.execute('CREATE UNIQUE INDEX idx_readings_pid_image ON readings (pid, image_hash)')
+    db_cursor.execute(ACTIVE_READINGS_VIEW)
+
+def _migrate_query_indexes(db_cursor):
+    """
+    Version 3: indexes for the pages' hot queries.
+    - readings (pid, timestamp): history and care plan read one patient in time
+      order without a sort.
+    - readings (image_hash, pid) replaces the (pid, image_hash) unique index:
+      the same duplicate-strip guard, and it also serves the batch flow's
+      lookup by image_hash, which used to scan the table.
+    - reading_scores (model_key, score): triage filters on the active model's
+      score, which lives in reading_scores rather than readings.score.
+    """
+    db_cursor.execute('CREATE INDEX IF NOT EXISTS idx_readings_pid_ts ON readings (pid, timestamp)')
+    db_cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_image_pid ON readings (image_hash, pid)')
+    db_cursor.execute('DROP INDEX IF EXISTS idx_readings_pid_image')
+    db_cursor.execute('CREATE INDEX IF NOT EXISTS idx_reading_scores_model_score ON reading_scores (model_key, score)')
+    db_cursor.execute('ANALYZE')
+
+def _migrate_patient_search(db_cursor):
+    """
+    Version 4: patients_fts, an FTS5 trigram index over pid, name, phone and
+    address for the directory search. It is an external-content table keyed by
+    the patients rowid (the rows are not stored twice) and triggers keep it in
+    step with every insert, update and delete. Patients have no INTEGER PRIMARY
+    KEY, so after a VACUUM run rebuild_patient_search.
+    """
+    db_cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            pid, name, phone, address,
+            content='patients', content_rowid='rowid', tokenize='trigram'
+        )
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts (rowid, pid, name, phone, address) VALUES (new.rowid, new.pid, new.name, new.phone, new.address);
+        END
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, pid, name, phone, address) VALUES ('delete', old.rowid, old.pid, old.name, old.phone, old.address);
+        END
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE OF pid, name, phone, address ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, pid, name, phone, address) VALUES ('delete', old.rowid, old.pid, old.name, old.phone, old.address);
+            INSERT INTO patients_fts (rowid, pid, name, phone, address) VALUES (new.rowid, new.pid, new.name, new.phone, new.address);
+        END
+    ''')
+    rebuild_patient_search(db_cursor)
+
+def rebuild_patient_search(cursor):
+    """Re-indexes patients_fts from the patients table."""
+    cursor.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+
+def _migrate_directory_keyset(db_cursor):
+    """
+    Version 5: (join_date, pid) index for the keyset-paginated directory. A
+    NULL join_date would compare as unknown against the page cursor and drop
+    out of every page after the first, so legacy rows get '' (listed last).
+    """
+    db_cursor.execute("UPDATE patients SET join_date = '' WHERE join_date IS NULL")
+    db_cursor.execute('CREATE INDEX IF NOT EXISTS idx_patients_join_pid ON patients (join_date, pid)')
+
+def _migrate_registry_counters(db_cursor):
+    """
+    Version 6: registry_counters, kept by triggers: 'patients' (registry size)
+    and one 'scans:<YYYY-MM-DD>' bucket per day of reading timestamps. The
+    sliding figures (patients active in the last N days, open critical cases)
+    cannot be trigger counters; they are index range counts over patient_stats
+    and patient_score_stats, which every reading write already maintains.
+    """
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registry_counters (
+            counter TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    db_cursor.execute("INSERT OR REPLACE INTO registry_counters (counter, value) SELECT 'patients', COUNT(*) FROM patients")
+    db_cursor.execute("INSERT OR REPLACE INTO registry_counters (counter, value) "
+                      "SELECT 'scans:' || date(timestamp), COUNT(*) FROM readings WHERE date(timestamp) IS NOT NULL GROUP BY date(timestamp)")
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_counter_insert AFTER INSERT ON patients BEGIN
+            UPDATE registry_counters SET value = value + 1 WHERE counter = 'patients';
+        END
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_counter_delete AFTER DELETE ON patients BEGIN
+            UPDATE registry_counters SET value = value - 1 WHERE counter = 'patients';
+        END
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS readings_counter_insert AFTER INSERT ON readings WHEN date(new.timestamp) IS NOT NULL BEGIN
+            INSERT INTO registry_counters (counter, value) VALUES ('scans:' || date(new.timestamp), 1)
+            ON CONFLICT (counter) DO UPDATE SET value = value + 1;
+        END
+    ''')
+    db_cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS readings_counter_delete AFTER DELETE ON readings WHEN date(old.timestamp) IS NOT NULL BEGIN
+            UPDATE registry_counters SET value = value - 1 WHERE counter = 'scans:' || date(old.timestamp);
+        END
+    ''')
+    db_cursor.execute('CREATE INDEX IF NOT EXISTS idx_patient_stats_last_ts ON patient_stats (last_ts)')
+    db_cursor.execute('CREATE INDEX IF NOT EXISTS idx_patient_score_stats_last ON patient_score_stats (model_key, last_score)')
+
+def _migrate_reading_rollups(db_cursor):
+    """
+    Version 7: per-patient day / week / month rollups of the readings (count,
+    per-biomarker min / max / sum, id of the period's last reading) and of each
+    model's scores, so a long history plots one point per period.
+    """
+    db_cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS reading_rollups (
+            pid TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            first_ts DATETIME,
+            last_ts DATETIME,
+            last_reading_id INTEGER,
+            {', '.join(f'{k}_min REAL, {k}_max REAL, {k}_sum REAL' for k in BIOMARKER_KEYS)},
+            PRIMARY KEY (pid, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS score_rollups (
+            model_key INTEGER NOT NULL,
+            pid TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            score_min REAL, score_max REAL, score_sum REAL,
+            PRIMARY KEY (model_key, pid, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    rebuild_reading_rollups(db_cursor)
+
+# Ordered (version, description, step). Append new steps; never edit or reorder applied ones.
+SCHEMA_MIGRATIONS = [
+    (1, "baseline schema", _migrate_baseline),
+    (2, "readings.reading_id primary key", _migrate_reading_primary_key),
+    (3, "query indexes", _migrate_query_indexes),
+    (4, "patient full-text search", _migrate_patient_search),
+    (5, "patient directory keyset index", _migrate_directory_keyset),
+    (6, "registry counters", _migrate_registry_counters),
+    (7, "reading rollups", _migrate_reading_rollups),
+]
+
+def load_calibration_lut(cursor, profile_id):
+    """Profile curves compiled to a LUT (factory LUT for an unknown profile)."""
+    cursor.execute("SELECT curves FROM calibration_profiles WHERE profile_id=?", (profile_id,))
+    row = cursor.fetchone()
+    return compile_calibration_curves(json.loads(row[0])) if row else CALIBRATION_LUT
+
+def resolve_calibration_profile(cursor, device, strip_lot):
+    """Newest profile for the most specific match: device+lot, device, lot, then the factory default."""
+    device, strip_lot = device or '*', strip_lot or '*'
+    cursor.execute("""
+        SELECT profile_id FROM calibration_profiles
+        WHERE device IN (?, '*') AND strip_lot IN (?, '*')
+        ORDER BY device = ? DESC, strip_lot = ? DESC, profile_id DESC LIMIT 1
+    """, (device, strip_lot, device, strip_lot))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_calibration_profile(cursor, device, strip_lot, curves):
+    validate_calibration_curves(curves)
+    cursor.execute("INSERT INTO calibration_profiles (device, strip_lot, curves, created) VALUES (?,?,?,?)",
+                   (device or '*', strip_lot or '*', json.dumps(curves), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return cursor.lastrowid
+
+def patient_names(cursor, pids):
+    """{pid: name} for the registered subset of `pids`."""
+    pids = sorted(set(pids))
+    if not pids:
+        return {}
+    cursor.execute("SELECT pid, name FROM patients WHERE pid IN (SELECT value FROM json_each(?))", (json.dumps(pids),))
+    return {r[0]: r[1] for r in cursor.fetchall()}
+
+def insert_reading(cursor, pid, name, vals, score, ts, profile_id, image_hash, tray_slot=None):
+    """
+    Writes one reading, scored under every registered model; the caller owns the
+    transaction. Returns False when the (pid, image_hash) unique index says this
+    strip is already on file. `score` is kept on the row as the scan-time score.
+    """
+    cursor.execute("INSERT OR IGNORE INTO readings (pid, name, glucose, hb, ntprobnp, lpa, troponin, score, timestamp, profile_id, image_hash, tray_slot) "
+                   "VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                   (pid, name, *vals, score, ts, profile_id, image_hash, tray_slot))
+    if cursor.rowcount != 1:
+        return False
+    reading_id = cursor.lastrowid
+    scores = {key: float(crs_scores(vals, spec)[0]) for key, (_, spec) in load_scoring_models(cursor).items()}
+    cursor.executemany("INSERT OR REPLACE INTO reading_scores (model_key, reading_id, score) VALUES (?,?,?)",
+                       [(key, reading_id, score) for key, score in scores.items()])
+    record_patient_stats(cursor, pid, reading_id, vals, ts, scores)
+    record_reading_rollups(cursor, pid, reading_id, vals, ts, scores)
+    return True
+
+def iter_archived_readings(cursor, after_rowid=0, limit=1000):
+    """
+    Next page of (rowid, pid, image_hash, profile_id, score, tray_slot, *biomarker values)
+    for readings that link to an archived image, in rowid order (keyset, so it streams).
+    """
+    cursor.execute(f"SELECT rowid, pid, image_hash, profile_id, score, tray_slot, {', '.join(BIOMARKER_KEYS)} FROM readings "
+                   "WHERE image_hash IS NOT NULL AND rowid > ? ORDER BY rowid LIMIT ?", (after_rowid, limit))
+    return cursor.fetchall()
+
+def update_reading_values(cursor, rowid, vals, profile_id):
+    """
+    Replaces a reading's biomarker values and profile, re-scores it under every
+    registered model (reading_scores) and rebuilds its patient's stats and
+    rollups. readings.score stays the scan-time score.
+    """
+    cursor.execute("UPDATE readings SET glucose=?, hb=?, ntprobnp=?, lpa=?, troponin=?, profile_id=? WHERE rowid=?",
+                   (*vals, profile_id, rowid))
+    cursor.executemany("INSERT OR REPLACE INTO reading_scores (model_key, reading_id, score) VALUES (?,?,?)",
+                       [(key, rowid, float(crs_scores(vals, spec)[0])) for key, (_, spec) in load_scoring_models(cursor).items()])
+    cursor.execute("SELECT pid FROM readings WHERE rowid=?", (rowid,))
+    pid = cursor.fetchone()[0]
+    rebuild_patient_stats(cursor, [pid])
+    rebuild_reading_rollups(cursor, [pid])
+
+def iter_reading_values(cursor, model_key, after_rowid=0, limit=1000):
+    """
+    Next page of (rowid, glucose, hb, ntprobnp, lpa, troponin, stored score under
+    `model_key` or NULL) readings in rowid order (keyset).
+    """
+    cursor.execute("SELECT r.rowid, r.glucose, r.hb, r.ntprobnp, r.lpa, r.troponin, s.score FROM readings r "
+                   "LEFT JOIN reading_scores s ON s.model_key = ? AND s.reading_id = r.rowid "
+                   "WHERE r.rowid > ? ORDER BY r.rowid LIMIT ?", (model_key, after_rowid, limit))
+    return cursor.fetchall()
+
+def reading_pids(cursor, rowids):
+    """Distinct patients owning `rowids`."""
+    rowids = list(rowids)
+    if not rowids:
+        return []
+    cursor.execute("SELECT DISTINCT pid FROM readings WHERE rowid IN (SELECT value FROM json_each(?))", (json.dumps(rowids),))
+    return [r[0] for r in cursor.fetchall()]
+
+def store_reading_scores(cursor, model_key, updates):
+    """Batched upsert of (score, rowid) pairs under one model; the caller owns the transaction."""
+    cursor.executemany("INSERT OR REPLACE INTO reading_scores (score, reading_id, model_key) VALUES (?,?,?)",
+                       ((score, rowid, model_key) for score, rowid in updates))
+
+def load_backfill_state(cursor, job):
+    """Checkpoint of a backfill job as a dict, or None if it never ran (or was reset)."""
+    cursor.execute("SELECT last_rowid, processed, changed, started, updated FROM backfill_state WHERE job=?", (job,))
+    row = cursor.fetchone()
+    return dict(zip(('last_rowid', 'processed', 'changed', 'started', 'updated'), row)) if row else None
+
+def save_backfill_state(cursor, job, last_rowid, processed, changed):
+    """
+    Records a backfill checkpoint. Call it in the same transaction as the chunk's
+    updates so a crash resumes exactly after the last committed chunk.
+    """
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("INSERT INTO backfill_state (job, last_rowid, processed, changed, started, updated) VALUES (?,?,?,?,?,?) "
+                   "ON CONFLICT(job) DO UPDATE SET last_rowid=excluded.last_rowid, processed=excluded.processed, "
+                   "changed=excluded.changed, updated=excluded.updated",
+                   (job, last_rowid, processed, changed, ts, ts))
+
+def reset_backfill_state(cursor, job):
+    cursor.execute("DELETE FROM backfill_state WHERE job=?", (job,))
+
+def load_scoring_models(cursor):
+    """{model_key: (model_id, spec)} for every registered scoring model."""
+    cursor.execute("SELECT model_key, model_id, spec FROM scoring_models ORDER BY model_key")
+    return {r[0]: (r[1], json.loads(r[2])) for r in cursor.fetchall()}
+
+def active_scoring_model(cursor):
+    """(model_key, model_id, spec) of the model the pages currently read."""
+    cursor.execute("SELECT m.model_key, m.model_id, m.spec FROM scoring_active a JOIN scoring_models m USING (model_key)")
+    key, model_id, spec = cursor.fetchone()
+    return key, model_id, json.loads(spec)
+
+def register_scoring_model(cursor, model_id, spec):
+    """Adds a model version (specs are immutable: re-registering an id raises sqlite3.IntegrityError)."""
+    validate_scoring_model(spec)
+    cursor.execute("INSERT INTO scoring_models (model_id, spec, created) VALUES (?,?,?)",
+                   (model_id, json.dumps(spec), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return cursor.lastrowid
+
+def scoring_model_coverage(cursor):
+    """{model_key: readings with a stored score} (a model can go active once it covers every reading)."""
+    cursor.execute("SELECT m.model_key, COUNT(s.reading_id) FROM scoring_models m "
+                   "LEFT JOIN reading_scores s USING (model_key) GROUP BY m.model_key")
+    return dict(cursor.fetchall())
+
+def set_active_scoring_model(cursor, model_key):
+    """
+    Points the pages at another model: a single-row update, no rescoring. Raises
+    ValueError if some scorable readings have no precomputed score under it yet.
+    """
+    cursor.execute("SELECT COUNT(*) FROM readings r WHERE r.glucose IS NOT NULL AND r.hb IS NOT NULL "
+                   "AND r.ntprobnp IS NOT NULL AND r.lpa IS NOT NULL AND r.troponin IS NOT NULL AND NOT EXISTS "
+                   "(SELECT 1 FROM reading_scores s WHERE s.model_key = ? AND s.reading_id = r.rowid)", (model_key,))
+    missing = cursor.fetchone()[0]
+    if missing:
+        raise ValueError(f"{missing} readings have no score under this model yet; precompute them first (rescore)")
+    cursor.execute("UPDATE scoring_active SET model_key=? WHERE id=1", (model_key,))
+
+PATIENT_EWMA_ALPHA = 0.3  # weight of the newest score in the running CRS average
+# Rollup resolution -> SQLite expression for the first day of the period holding {ts}.
+ROLLUP_BUCKETS = {
+    'day': "date({ts})",
+    'week': "date({ts}, 'weekday 0', '-6 days')",  # weeks start on Monday
+    'month': "date({ts}, 'start of month')",
+}
+REGISTRY_ACTIVE_DAYS = 30  # window for the sidebar's "active patients" figure
+
+def record_patient_stats(cursor, pid, reading_id, vals, ts, scores):
+    """
+    Folds one new reading into its patient's running statistics: O(1) upserts,
+    no history scan. `scores` is {model_key: score}. Readings are written at scan
+    time, so write order is treated as time order (last / previous / EWMA).
+    """
+    cols = [f'{k}_{agg}' for k in BIOMARKER_KEYS for agg in ('min', 'max')]
+    ranges = [f"{k}_min = min(coalesce({k}_min, excluded.{k}_min), coalesce(excluded.{k}_min, {k}_min)), "
+              f"{k}_max = max(coalesce({k}_max, excluded.{k}_max), coalesce(excluded.{k}_max, {k}_max))" for k in BIOMARKER_KEYS]
+    cursor.execute(f"INSERT INTO patient_stats (pid, readings, first_ts, last_ts, last_reading_id, prev_reading_id, {', '.join(cols)}) "
+                   f"VALUES (?, 1, ?, ?, ?, NULL, {', '.join('?' * len(cols))}) "
+                   f"ON CONFLICT(pid) DO UPDATE SET readings = readings + 1, last_ts = excluded.last_ts, "
+                   f"prev_reading_id = last_reading_id, last_reading_id = excluded.last_reading_id, {', '.join(ranges)}",
+                   (pid, ts, ts, reading_id, *[v for v in vals for _ in range(2)]))
+    cursor.executemany("""
+        INSERT INTO patient_score_stats (model_key, pid, n, last_score, prev_score, ewma, t0, sum_t, sum_s, sum_tt, sum_ts)
+        VALUES (:key, :pid, 1, :s, NULL, :s, julianday(:ts), 0, :s, 0, 0)
+        ON CONFLICT(model_key, pid) DO UPDATE SET
+            n = n + 1, prev_score = last_score, last_score = :s,
+            ewma = :a * :s + (1 - :a) * ewma,
+            sum_t = sum_t + (julianday(:ts) - t0), sum_s = sum_s + :s,
+            sum_tt = sum_tt + (julianday(:ts) - t0) * (julianday(:ts) - t0),
+            sum_ts = sum_ts + (julianday(:ts) - t0) * :s
+    """, [{'key': key, 'pid': pid, 's': score, 'ts': ts, 'a': PATIENT_EWMA_ALPHA} for key, score in scores.items()])
+
+def rebuild_patient_stats(cursor, pids=None, model_key=None):
+    """
+    Recomputes running statistics from the stored history, for `pids` (default:
+    everyone) and `model_key` (default: every model). For bulk rewrites (seeding,
+    re-scoring, re-analysis); normal inserts go through record_patient_stats.
+    """
+    if pids is not None:
+        pids = sorted(set(pids))
+        if not pids:
+            return
+    where = "WHERE r.pid IN (SELECT value FROM json_each(?))" if pids is not None else ""
+    params = [json.dumps(pids)] if pids is not None else []
+
+    if model_key is None:
+        cursor.execute(f"DELETE FROM patient_stats {where.replace('r.pid', 'pid')}", params)
+        cursor.execute(f"SELECT r.pid, COUNT(*), {', '.join(f'MIN(r.{k}), MAX(r.{k})' for k in BIOMARKER_KEYS)} "
+                       f"FROM readings r {where} GROUP BY r.pid", params)
+        ranges = cursor.fetchall()
+        cursor.execute(f"SELECT r.pid, r.rowid, r.timestamp FROM readings r {where} ORDER BY r.pid, r.rowid", params)
+        order = {}  # pid -> [first_ts, last_ts, last_reading_id, prev_reading_id], in write order
+        for pid, rowid, ts in cursor.fetchall():
+            o = order.setdefault(pid, [ts, None, None, None])
+            o[1], o[2], o[3] = ts, rowid, o[2]
+        cursor.executemany(f"INSERT INTO patient_stats (pid, readings, first_ts, last_ts, last_reading_id, prev_reading_id, "
+                           f"{', '.join(f'{k}_min, {k}_max' for k in BIOMARKER_KEYS)}) VALUES ({', '.join('?' * 16)})",
+                           [(r[0], r[1], *order[r[0]], *r[2:]) for r in ranges])
+
+    key_filter = "s.model_key = ?" if model_key is not None else "1"
+    key_params = [model_key] if model_key is not None else []
+    cursor.execute(f"DELETE FROM patient_score_stats WHERE {key_filter.replace('s.', '')}"
+                   + (" AND pid IN (SELECT value FROM json_each(?))" if pids is not None else ""), key_params + params)
+    cursor.execute(f"SELECT s.model_key, r.pid, julianday(r.timestamp), s.score FROM reading_scores s "
+                   f"JOIN readings r ON r.rowid = s.reading_id {where or 'WHERE 1'} AND {key_filter} "
+                   f"ORDER BY s.model_key, r.pid, r.rowid", params + key_params)
+    rows, stats = [], None
+    for key, pid, jd, score in cursor.fetchall():
+        if stats is None or stats[0] != key or stats[1] != pid:
+            if stats is not None:
+                rows.append(stats)
+            stats = [key, pid, 0, None, None, score, jd, 0.0, 0.0, 0.0, 0.0]
+        t = (jd - stats[6]) if jd is not None and stats[6] is not None else 0.0
+        stats[2] += 1
+        stats[3], stats[4] = score, stats[3]
+        if stats[2] > 1:
+            stats[5] = PATIENT_EWMA_ALPHA * score + (1 - PATIENT_EWMA_ALPHA) * stats[5]
+        stats[7] += t
+        stats[8] += score
+        stats[9] += t * t
+        stats[10] += t * score
+    if stats is not None:
+        rows.append(stats)
+    cursor.executemany("INSERT INTO patient_score_stats (model_key, pid, n, last_score, prev_score, ewma, t0, "
+                       "sum_t, sum_s, sum_tt, sum_ts) VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+
+def rollup_bucket(day, resolution):
+    """First day ('YYYY-MM-DD') of the `resolution` period holding the date `day`, as ROLLUP_BUCKETS computes it."""
+    if resolution == 'week':
+        day -= timedelta(days=day.weekday())
+    elif resolution == 'month':
+        day = day.replace(day=1)
+    return day.isoformat()
+
+def record_reading_rollups(cursor, pid, reading_id, vals, ts, scores):
+    """
+    Folds one new reading into its patient's day / week / month rollups: one
+    upsert per resolution, plus one per resolution and model for `scores`
+    ({model_key: score}). Like record_patient_stats, write order is time order.
+    """
+    if ts is None:
+        return
+    cols = ', '.join(f'{k}_min, {k}_max, {k}_sum' for k in BIOMARKER_KEYS)
+    sets = ', '.join(f"{k}_min = min(coalesce({k}_min, excluded.{k}_min), coalesce(excluded.{k}_min, {k}_min)), "
+                     f"{k}_max = max(coalesce({k}_max, excluded.{k}_max), coalesce(excluded.{k}_max, {k}_max)), "
+                     f"{k}_sum = coalesce({k}_sum + excluded.{k}_sum, {k}_sum, excluded.{k}_sum)" for k in BIOMARKER_KEYS)
+    params = {'pid': pid, 'rid': reading_id, 'ts': ts, **dict(zip(BIOMARKER_KEYS, vals))}
+    for resolution, bucket in ROLLUP_BUCKETS.items():
+        bucket = bucket.format(ts=':ts')
+        cursor.execute(f"INSERT INTO reading_rollups (pid, resolution, bucket, n, first_ts, last_ts, last_reading_id, {cols}) "
+                       f"VALUES (:pid, '{resolution}', {bucket}, 1, :ts, :ts, :rid, {', '.join(f':{k}, :{k}, :{k}' for k in BIOMARKER_KEYS)}) "
+                       f"ON CONFLICT(pid, resolution, bucket) DO UPDATE SET n = n + 1, first_ts = min(first_ts, excluded.first_ts), "
+                       f"last_ts = max(last_ts, excluded.last_ts), last_reading_id = excluded.last_reading_id, {sets}", params)
+        cursor.executemany(f"INSERT INTO score_rollups (model_key, pid, resolution, bucket, n, score_min, score_max, score_sum) "
+                           f"VALUES (:key, :pid, '{resolution}', {bucket}, 1, :s, :s, :s) "
+                           f"ON CONFLICT(model_key, pid, resolution, bucket) DO UPDATE SET n = n + 1, "
+                           f"score_min = min(score_min, excluded.score_min), score_max = max(score_max, excluded.score_max), "
+                           f"score_sum = score_sum + excluded.score_sum",
+                           [{'key': key, 'pid': pid, 'ts': ts, 's': score} for key, score in scores.items()])
+
+def rebuild_reading_rollups(cursor, pids=None, model_key=None):
+    """
+    Recomputes rollups from the stored history, for `pids` (default: everyone)
+    and `model_key` (default: every model; given a model, only its score
+    rollups are rebuilt). Bulk counterpart of record_reading_rollups, called
+    wherever rebuild_patient_stats is.
+    """
+    if pids is not None:
+        pids = sorted(set(pids))
+        if not pids:
+            return
+    where = "AND r.pid IN (SELECT value FROM json_each(?))" if pids is not None else ""
+    params = [json.dumps(pids)] if pids is not None else []
+    key_filter = "AND s.model_key = ?" if model_key is not None else ""
+    key_params = [model_key] if model_key is not None else []
+
+    if model_key is None:
+        cursor.execute(f"DELETE FROM reading_rollups WHERE 1 {where.replace('r.pid', 'pid')}", params)
+    cursor.execute(f"DELETE FROM score_rollups WHERE 1 {key_filter.replace('s.', '')} {where.replace('r.pid', 'pid')}", key_params + params)
+    for resolution, bucket in ROLLUP_BUCKETS.items():
+        bucket = bucket.format(ts='r.timestamp')
+        if model_key is None:
+            cursor.execute(f"INSERT INTO reading_rollups (pid, resolution, bucket, n, first_ts, last_ts, last_reading_id, "
+                           f"{', '.join(f'{k}_min, {k}_max, {k}_sum' for k in BIOMARKER_KEYS)}) "
+                           f"SELECT r.pid, ?, {bucket}, COUNT(*), MIN(r.timestamp), MAX(r.timestamp), MAX(r.rowid), "
+                           f"{', '.join(f'MIN(r.{k}), MAX(r.{k}), SUM(r.{k})' for k in BIOMARKER_KEYS)} "
+                           f"FROM readings r WHERE {bucket} IS NOT NULL {where} GROUP BY r.pid, {bucket}", [resolution] + params)
+        cursor.execute(f"INSERT INTO score_rollups (model_key, pid, resolution, bucket, n, score_min, score_max, score_sum) "
+                       f"SELECT s.model_key, r.pid, ?, {bucket}, COUNT(*), MIN(s.score), MAX(s.score), SUM(s.score) "
+                       f"FROM reading_scores s JOIN readings r ON r.rowid = s.reading_id "
+                       f"WHERE {bucket} IS NOT NULL AND s.score IS NOT NULL {key_filter} {where} "
+                       f"GROUP BY s.model_key, r.pid, {bucket}", [resolution] + key_params + params)
+
+def registry_counters(cursor, model_key, critical_cutoff, active_days=REGISTRY_ACTIVE_DAYS):
+    """
+    Sidebar figures without scanning a table: registry size and today's scans
+    from registry_counters, patients with a reading in the last `active_days`
+    and patients whose latest score under `model_key` is critical from index
+    range counts on the running per-patient statistics.
+    """
+    now = datetime.now()
+    today = f"scans:{now.strftime('%Y-%m-%d')}"
+    cursor.execute("SELECT counter, value FROM registry_counters WHERE counter IN ('patients', ?)", (today,))
+    counters = {counter: value for counter, value in cursor.fetchall()}
+    cursor.execute("SELECT COUNT(*) FROM patient_stats WHERE last_ts >= ?",
+                   ((now - timedelta(days=active_days)).strftime('%Y-%m-%d %H:%M:%S'),))
+    active = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM patient_score_stats WHERE model_key = ? AND last_score >= ?", (model_key, critical_cutoff))
+    critical = cursor.fetchone()[0]
+    return {'patients': counters.get('patients', 0), 'active': active, 'active_days': active_days,
+            'scans_today': counters.get(today, 0), 'critical': critical}
+
+def patient_trend(cursor, pid, model_key):
+    """
+    One keyed lookup for the history page's metric row: reading count, last /
+    previous score, EWMA and trend slope (CRS per day) under `model_key`, plus
+    per-biomarker min / max. None if the patient has no readings.
+    """
+    cursor.execute("SELECT p.*, s.n, s.last_score, s.prev_score, s.ewma, s.sum_t, s.sum_s, s.sum_tt, s.sum_ts "
+                   "FROM patient_stats p LEFT JOIN patient_score_stats s ON s.pid = p.pid AND s.model_key = ? "
+                   "WHERE p.pid = ?", (model_key, pid))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    trend = dict(zip([d[0] for d in cursor.description], row))
+    n, st, ss, stt, sts = (trend.pop(k) for k in ('n', 'sum_t', 'sum_s', 'sum_tt', 'sum_ts'))
+    denom = (n * stt - st * st) if n else 0
+    trend['slope_per_day'] = (n * sts - st * ss) / denom if denom > 1e-12 else 0.0
+    return trend
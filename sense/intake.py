@@ -0,0 +1,50 @@
+"""Strip image sources: browser upload sets, field folders and CSV manifests."""
+import csv
+import os
+import zipfile
+
+STRIP_IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+def pid_from_filename(name):
+    """
+    Camp naming convention: the PID is the file stem up to the first underscore
+    (SENSE-84A5FB.jpg, SENSE-84A5FB_visit2.png -> SENSE-84A5FB).
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem.split('_')[0].strip().upper()
+
+def iter_strip_uploads(files):
+    """Yields (filename, raw bytes) for every strip image in an upload set, expanding .zip archives."""
+    for f in files:
+        if f.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(f) as zf:
+                for info in zf.infolist():
+                    base = os.path.basename(info.filename)
+                    if info.is_dir() or base.startswith('.') or '__MACOSX' in info.filename:
+                        continue
+                    if base.lower().endswith(STRIP_IMAGE_EXTS):
+                        yield base, zf.read(info)
+        else:
+            yield f.name, f.getvalue()
+
+def iter_strip_folder(root):
+    """Yields (path, pid, strip_lot) for every strip image under `root`, in a stable order; PIDs come from file names."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and d != '__MACOSX')
+        for f in sorted(filenames):
+            if not f.startswith('.') and f.lower().endswith(STRIP_IMAGE_EXTS):
+                yield os.path.join(dirpath, f), pid_from_filename(f), None
+
+def iter_strip_manifest(manifest):
+    """
+    Yields (path, pid, strip_lot) rows from a CSV manifest with a `path` column and
+    optional `pid` / `strip_lot` columns. Relative paths resolve against the manifest's folder.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline='', encoding='utf-8-sig') as fh:
+        for row in csv.DictReader(fh):
+            path = (row.get('path') or '').strip()
+            if not path:
+                continue
+            pid = (row.get('pid') or '').strip().upper() or pid_from_filename(path)
+            yield os.path.join(base, path), pid, (row.get('strip_lot') or '').strip() or None
@@ -0,0 +1,117 @@
+"""
+Image-quality gate: rejects blurry, glare-washed or badly exposed strip photos
+before full colorimetry, so an unusable capture can never produce a
+confident-looking CRS (or an emergency dispatch).
+
+Every check runs on a ~320 px thumbnail taken from a reduced decode, so the
+whole gate costs a few milliseconds. Thresholds are tuned at thumbnail scale.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from sense.vision import decode_strip, locate_strip, pad_boxes, warp_strip
+
+QUALITY_GATE = True
+QUALITY_THUMB_LONG_SIDE = 320
+QUALITY_MIN_FOCUS = 100.0        # variance of the Laplacian
+QUALITY_GLARE_MIN_V = 245        # specular highlight: near-white...
+QUALITY_GLARE_MAX_S = 40         # ...and washed-out colour
+QUALITY_MAX_GLARE_FRAC = 0.2     # of the pad area
+QUALITY_BACKING_COLUMN_FRAC = 0.9   # a pad-window column this washed out top to bottom is strip backing...
+QUALITY_MAX_BACKING_SHARE = 0.5     # ...unless most of the window is, which is a washed-out pad
+QUALITY_MIN_BRIGHTNESS = 50
+QUALITY_MAX_BRIGHTNESS = 230
+QUALITY_CLIP_LOW = 10
+QUALITY_CLIP_HIGH = 250
+QUALITY_MAX_DARK_FRAC = 0.25
+QUALITY_MAX_BLOWN_FRAC = 0.5     # white strip bodies legitimately clip, so allow more
+
+def quality_thumbnail(data, long_side=QUALITY_THUMB_LONG_SIDE):
+    """Thumbnail from the cheapest reduced decode that still covers `long_side`; None if undecodable."""
+    img, _ = decode_strip(data, long_side)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    f = min(1.0, long_side / max(h, w))
+    return cv2.resize(img, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA) if f < 1 else img
+
+def pad_glare_fractions(strips):
+    """
+    Share of glare pixels over the pads of each canonical strip in an (N, h, w, 3)
+    stack. A highlight is a washed-out patch on the pad; near-white columns that
+    run the full height of a pad window are white strip backing showing beside a
+    slightly offset pad, and are not counted unless they fill most of the window.
+    """
+    n, h, w, _ = strips.shape
+    hsv = cv2.cvtColor(strips.reshape(n * h, w, 3), cv2.COLOR_BGR2HSV).reshape(n, h, w, 3)
+    glare, area = np.zeros(n), 0
+    for x, y, x2, y2 in filter(None, pad_boxes(w, h)):
+        pad = hsv[:, y:y2, x:x2]
+        washed = (pad[..., 2] >= QUALITY_GLARE_MIN_V) & (pad[..., 1] <= QUALITY_GLARE_MAX_S)
+        backing = washed.mean(axis=1, keepdims=True) >= QUALITY_BACKING_COLUMN_FRAC
+        backing &= backing.mean(axis=2, keepdims=True) < QUALITY_MAX_BACKING_SHARE
+        glare += (washed & ~backing).sum(axis=(1, 2))
+        area += washed[0].size
+    return glare / area if area else glare
+
+def glare_reason(glare):
+    return f"Glare on the test pads ({glare:.0%} washed out): tilt the strip or move it out of direct light."
+
+def assess_thumbnail(thumb, glare=True):
+    """
+    Runs the exposure, focus and pad-glare checks on a BGR thumbnail. Returns
+    (reasons, metrics, timings_ms). With glare=False the pad check is skipped
+    (tray photos are checked strip by strip instead).
+    """
+    reasons, metrics, timings = [], {}, {}
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+
+    t0 = time.perf_counter()
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    brightness = float(np.dot(hist, np.arange(256)))
+    dark, bright = float(hist[:QUALITY_CLIP_LOW + 1].sum()), float(hist[QUALITY_CLIP_HIGH:].sum())
+    metrics.update({'brightness': round(brightness, 1), 'clipped_dark': round(dark, 3), 'clipped_bright': round(bright, 3)})
+    if brightness < QUALITY_MIN_BRIGHTNESS or dark > QUALITY_MAX_DARK_FRAC:
+        reasons.append(f"Underexposed (mean brightness {brightness:.0f}, {dark:.0%} black): move to better light or switch on the lamp.")
+    elif brightness > QUALITY_MAX_BRIGHTNESS or bright > QUALITY_MAX_BLOWN_FRAC:
+        reasons.append(f"Overexposed (mean brightness {brightness:.0f}, {bright:.0%} blown out): avoid direct sunlight or flash.")
+    timings['exposure'] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    focus = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    metrics['focus'] = round(focus, 1)
+    if focus < QUALITY_MIN_FOCUS and not reasons:  # a dark frame also reads as soft; report the cause
+        reasons.append(f"Out of focus (sharpness {focus:.0f} < {QUALITY_MIN_FOCUS:.0f}): hold the camera steady and tap to focus on the strip.")
+    timings['focus'] = (time.perf_counter() - t0) * 1000
+
+    if not glare:
+        return reasons, metrics, timings
+    t0 = time.perf_counter()
+    quad = locate_strip(thumb)
+    strip = warp_strip(thumb, quad)[0] if quad is not None else thumb
+    frac = float(pad_glare_fractions(strip[None])[0])
+    metrics['glare'] = round(frac, 3)
+    if frac > QUALITY_MAX_GLARE_FRAC:
+        reasons.append(glare_reason(frac))
+    timings['glare'] = (time.perf_counter() - t0) * 1000
+
+    return reasons, metrics, timings
+
+def assess_quality(data, glare=True, long_side=QUALITY_THUMB_LONG_SIDE):
+    """
+    Quality gate for encoded strip bytes. Returns {'ok', 'reasons', 'metrics', 'timings_ms'}
+    where reasons are actionable, user-facing strings (empty when ok).
+    """
+    t0 = time.perf_counter()
+    thumb = quality_thumbnail(data, long_side)
+    timings = {'thumbnail': (time.perf_counter() - t0) * 1000}
+    if thumb is None:
+        reasons, metrics = ["Unreadable image: the file could not be decoded as a photo."], {}
+    else:
+        reasons, metrics, check_timings = assess_thumbnail(thumb, glare)
+        timings.update(check_timings)
+    timings = {k: round(v, 2) for k, v in timings.items()}
+    timings['total'] = round(sum(timings.values()), 2)
+    return {'ok': not reasons, 'reasons': reasons, 'metrics': metrics, 'timings_ms': timings}
@@ -0,0 +1,166 @@
+"""
+Named, parameterised queries for the dashboard pages.
+
+Each statement's text is a constant and its values are bound as parameters. This
+lets sqlite3's per-connection statement cache reuse the compiled statement for
+every patient instead of parsing new SQL each time (the cache size is
+DB_STATEMENT_CACHE, see sense.db.connect). Lists are bound as one JSON array
+through json_each, so the statement text stays the same whatever the list
+length. Single-row lookups return a sqlite3.Row: a tuple that can also be
+indexed by column name. Only set-returning page queries build DataFrames.
+"""
+import json
+import os
+from datetime import timedelta
+
+import pandas as pd
+
+from sense.calibration import BIOMARKER_KEYS
+from sense.db import rollup_bucket
+
+DIRECTORY_PAGE_SIZE = int(os.environ.get('SENSE_DIRECTORY_PAGE_SIZE', 25))
+PATIENT_SEARCH_LIMIT = 50
+PATIENT_SEARCH_FUZZY_MIN = 0.5  # share of the query's trigrams a close match must contain
+PATIENT_SEARCH_FUZZY_POOL = 4   # bm25 candidates fetched per result slot before the similarity filter
+HISTORY_MAX_POINTS = int(os.environ.get('SENSE_HISTORY_MAX_POINTS', 500))  # points per trace on the history page
+ROLLUP_PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 30.44}  # finest first
+
+QUERIES = {
+    # --- access ---
+    'user_login': "SELECT * FROM users WHERE username=? AND password=?",
+    # --- patient registry ---
+    'patient_name': "SELECT name FROM patients WHERE pid=?",
+    # Keyset pages, newest first: the cursor is the (join_date, pid) of the previous page's last row.
+    'patient_directory_first': "SELECT * FROM patients ORDER BY join_date DESC, pid DESC LIMIT ?",
+    'patient_directory_after': "SELECT * FROM patients WHERE (join_date, pid) < (?, ?) ORDER BY join_date DESC, pid DESC LIMIT ?",
+    # Exact registry size, kept by the registry_counters triggers (schema version 6), so no rows are counted.
+    'patient_count': "SELECT COALESCE((SELECT value FROM registry_counters WHERE counter = 'patients'), 0)",
+    # :q is a _like_pattern(); backslash escapes a literal % or _ typed into the search box.
+    'patient_search': "SELECT * FROM patients WHERE name LIKE :q ESCAPE '\\' OR pid LIKE :q ESCAPE '\\' "
+                      "OR phone LIKE :q ESCAPE '\\' OR address LIKE :q ESCAPE '\\' ORDER BY join_date DESC LIMIT :limit",
+    # bm25 column weights follow the patients_fts column order: pid, name, phone, address.
+    'patient_search_fts': "SELECT p.*, bm25(patients_fts, 10.0, 5.0, 2.0, 1.0) AS rank FROM patients_fts "
+                          "JOIN patients p ON p.rowid = patients_fts.rowid WHERE patients_fts MATCH ? ORDER BY rank LIMIT ?",
+    'insert_patient': "INSERT INTO patients (pid, name, phone, address, join_date, streak) VALUES (?,?,?,?,?,0)",
+    # --- readings ---
+    'readings_on_file': "SELECT pid, image_hash FROM readings WHERE image_hash IN (SELECT value FROM json_each(?))",
+    'latest_reading': "SELECT * FROM active_readings WHERE pid=? ORDER BY timestamp DESC LIMIT 1",
+    'triage_readings': "SELECT * FROM active_readings WHERE score >= ? ORDER BY timestamp DESC",
+    'patient_history_window': "SELECT * FROM active_readings WHERE pid=? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp ASC",
+    # --- history rollups (dates are 'YYYY-MM-DD'; a period's 'last' values come from its last reading) ---
+    'patient_history_span': "SELECT MIN(bucket), MAX(bucket) FROM reading_rollups WHERE pid=? AND resolution='day'",
+    'patient_window_readings': "SELECT COALESCE(SUM(n), 0) FROM reading_rollups WHERE pid=? AND resolution='day' AND bucket >= ? AND bucket < ?",
+    'patient_rollups': "SELECT r.bucket AS timestamp, r.n AS readings, "
+                       + ", ".join(f"r.{k}_min, r.{k}_max, r.{k}_sum / r.n AS {k}_mean, l.{k} AS {k}_last" for k in BIOMARKER_KEYS)
+                       + ", s.score_min, s.score_max, s.score_sum / s.n AS score_mean, ls.score AS score_last "
+                       "FROM reading_rollups r "
+                       "LEFT JOIN score_rollups s ON s.model_key = :model AND s.pid = r.pid AND s.resolution = r.resolution AND s.bucket = r.bucket "
+                       "LEFT JOIN readings l ON l.rowid = r.last_reading_id "
+                       "LEFT JOIN reading_scores ls ON ls.model_key = :model AND ls.reading_id = r.last_reading_id "
+                       "WHERE r.pid = :pid AND r.resolution = :resolution AND r.bucket >= :start AND r.bucket < :end ORDER BY r.bucket",
+    # --- calibration ---
+    'calibration_profiles': "SELECT profile_id, device, strip_lot, created FROM calibration_profiles ORDER BY profile_id DESC",
+    # --- care plans ---
+    'care_plan': "SELECT * FROM care_plans WHERE pid=?",
+    'save_care_plan': "INSERT OR REPLACE INTO care_plans (pid, nutrition, activity, supplements, last_updated) VALUES (?,?,?,?,?)",
+}
+
+def json_list(values):
+    """Binds a list as one parameter, for queries that read it through json_each."""
+    return json.dumps(list(values))
+
+def fetch_one(db_conn, name, params=()):
+    """First row of a named query as a sqlite3.Row, or None."""
+    return db_conn.execute(QUERIES[name], params).fetchone()
+
+def fetch_value(db_conn, name, params=()):
+    """First column of the first row, or None."""
+    row = db_conn.execute(QUERIES[name], params).fetchone()
+    return row[0] if row else None
+
+def fetch_all(db_conn, name, params=()):
+    return db_conn.execute(QUERIES[name], params).fetchall()
+
+def fetch_frame(db_conn, name, params=()):
+    """A set-returning named query as a DataFrame, built straight from plain tuples."""
+    cursor = db_conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(QUERIES[name], params)
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description], coerce_float=True)
+
+def execute(db_conn, name, params=()):
+    """Runs a named write statement; the caller owns the transaction. Returns the rowcount."""
+    return db_conn.execute(QUERIES[name], params).rowcount
+
+def _trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def _like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def directory_page(db_conn, after=None, page_size=DIRECTORY_PAGE_SIZE):
+    """
+    One page of the patient directory, newest first, starting after the
+    `after` = (join_date, pid) cursor (None for the first page). Returns
+    (DataFrame, cursor for the next page or None on the last page).
+    """
+    if after is None:
+        page = fetch_frame(db_conn, 'patient_directory_first', (page_size + 1,))
+    else:
+        page = fetch_frame(db_conn, 'patient_directory_after', (*after, page_size + 1))
+    if len(page) <= page_size:
+        return page, None
+    page = page.iloc[:page_size]
+    return page, (page['join_date'].iloc[-1], page['pid'].iloc[-1])
+
+def search_patients(db_conn, text, limit=PATIENT_SEARCH_LIMIT):
+    """
+    Ranked directory search over pid, name, phone and address; returns a
+    DataFrame with a 'match' column ('exact' or 'fuzzy'). Queries of three or
+    more characters use the patients_fts trigram index. Rows containing the
+    text anywhere (so prefixes too) are ranked by bm25 with the pid weighted
+    highest. When no row contains it verbatim, a fuzzy pass ORs the query's
+    trigrams and keeps rows sharing at least PATIENT_SEARCH_FUZZY_MIN of them,
+    which catches typos and transpositions. Shorter queries fall back to LIKE.
+    """
+    text = text.strip()
+    if len(text) < 3:
+        return fetch_frame(db_conn, 'patient_search', {'q': _like_pattern(text), 'limit': limit}).assign(match='exact')
+    exact = fetch_frame(db_conn, 'patient_search_fts', (_fts_phrase(text), limit))
+    if not exact.empty:
+        return exact.assign(match='exact')
+
+    grams = _trigrams(text)
+    candidates = fetch_frame(db_conn, 'patient_search_fts',
+                             (" OR ".join(_fts_phrase(g) for g in sorted(grams)), limit * PATIENT_SEARCH_FUZZY_POOL))
+    if candidates.empty:
+        return candidates.assign(match='fuzzy')
+    fields = candidates[['pid', 'name', 'phone', 'address']].fillna('').astype(str).to_numpy()
+    similarity = [max(len(grams & _trigrams(v)) for v in row) / len(grams) for row in fields]
+    fuzzy = candidates.assign(similarity=similarity, match='fuzzy')
+    fuzzy = fuzzy[fuzzy['similarity'] >= PATIENT_SEARCH_FUZZY_MIN]
+    return fuzzy.sort_values(['similarity', 'rank'], ascending=[False, True], kind='stable').head(limit).drop(columns='similarity')
+
+def history_window(db_conn, pid, model_key, start, end):
+    """
+    A patient's history between the dates `start` and `end` (inclusive) under
+    `model_key`, at the finest resolution that keeps each trace within
+    HISTORY_MAX_POINTS. If the window holds that many readings or fewer, they
+    come back raw. Otherwise the result is day, week or month rollups, with
+    min / max / mean / last columns per biomarker and score, and the means
+    also under the plain column names. Returns (DataFrame, resolution,
+    readings in the window).
+    """
+    lo, hi = start.isoformat(), (end + timedelta(days=1)).isoformat()
+    readings = fetch_value(db_conn, 'patient_window_readings', (pid, lo, hi))
+    if readings <= HISTORY_MAX_POINTS:
+        return fetch_frame(db_conn, 'patient_history_window', (pid, lo, hi)), 'raw', readings
+    days = (end - start).days + 1
+    resolution = next((r for r, d in ROLLUP_PERIOD_DAYS.items() if days / d <= HISTORY_MAX_POINTS), 'month')
+    frame = fetch_frame(db_conn, 'patient_rollups', {'pid': pid, 'model': model_key, 'resolution': resolution,
+                                                     'start': rollup_bucket(start, resolution), 'end': hi})
+    return frame.assign(**{k: frame[f'{k}_mean'] for k in (*BIOMARKER_KEYS, 'score')}), resolution, readings
@@ -0,0 +1,75 @@
+"""
+SENSE-CRS: weighted fusion of the five biomarkers into one Cardiac Risk Score.
+
+The scorer works on whole (N, 5) arrays in biomarker order, so bulk paths
+(batch scans, trays, the rescore backfill) score every reading in one pass;
+the single-reading helpers are thin wrappers around the same code.
+"""
+import numpy as np
+
+CRS_SCORE_DECIMALS = 5
+# A scoring model is a JSON-serialisable spec: one weight and one normaliser per
+# biomarker (glucose, hb, ntprobnp, lpa, troponin) plus risk bands, highest
+# lower bound first. Normalisers: ['linear', offset, scale] -> (v - offset) / scale,
+# ['log1p', offset, scale] -> log(1 + max(v - offset, 0)) / scale. Indices are clipped to [0, 1].
+CRS_MODEL_ID = 'crs-v1'
+CRS_MODEL = {
+    'weights': [0.3, 0.25, 0.2, 0.15, 0.1],
+    'normalizers': [
+        ['linear', 70, 150],    # Glucose
+        ['linear', 14, -6],     # Hemoglobin (low is risk)
+        ['log1p', 0, 6],        # NT-proBNP
+        ['linear', 0, 200],     # Total Serum Cholesterol
+        ['linear', 0, 0.04],    # Troponin
+    ],
+    'bands': [
+        [0.7, "CRITICAL ALERT", "#FF3131"],     # High-intensity red
+        [0.4, "ELEVATED RISK", "#FF9100"],      # Clinical orange
+        [0.25, "INCIPIENT", "#00D1FF"],         # Warning/Early detection blue
+        [0.0, "STABLE / OPTIMAL", "#00FF80"],   # Healthy green
+    ],
+}
+
+def validate_scoring_model(model):
+    """Raises ValueError unless `model` is a usable scoring spec."""
+    if not isinstance(model, dict) or not {'weights', 'normalizers', 'bands'} <= model.keys():
+        raise ValueError("Model needs 'weights', 'normalizers' and 'bands'")
+    if len(model['weights']) != 5 or len(model['normalizers']) != 5:
+        raise ValueError("Model needs exactly five weights and five normalizers")
+    for norm in model['normalizers']:
+        if len(norm) != 3 or norm[0] not in ('linear', 'log1p') or not norm[2]:
+            raise ValueError(f"Bad normalizer {norm!r}: expected ['linear'|'log1p', offset, non-zero scale]")
+    bounds = [b[0] for b in model['bands']]
+    if not bounds or any(len(b) != 3 for b in model['bands']) or bounds != sorted(bounds, reverse=True) or bounds[-1] != 0:
+        raise ValueError("Bands must be [lower_bound, label, colour] in descending order, ending at 0")
+
+def crs_indices_batch(values, model=CRS_MODEL):
+    """(N, 5) biomarker values -> (N, 5) risk indices, each normalised and clipped to [0, 1]."""
+    v = np.asarray(values, dtype=np.float64).reshape(-1, 5)
+    normalized = np.empty_like(v)
+    for i, (kind, offset, scale) in enumerate(model['normalizers']):
+        x = v[:, i] - offset
+        normalized[:, i] = (np.log1p(np.maximum(x, 0)) if kind == 'log1p' else x) / scale
+    return np.clip(normalized, 0, 1)
+
+def crs_scores(values, model=CRS_MODEL):
+    """(N, 5) biomarker values (array or DataFrame columns in biomarker order) -> (N,) CRS."""
+    return np.round(crs_indices_batch(values, model) @ np.asarray(model['weights'], dtype=np.float64), CRS_SCORE_DECIMALS)
+
+def crs_indices(vals, model=CRS_MODEL):
+    """Per-biomarker risk indices of one reading."""
+    return crs_indices_batch(vals, model)[0].tolist()
+
+def crs_score(vals, model=CRS_MODEL):
+    return float(crs_scores(vals, model)[0])
+
+def risk_cutoffs(model=CRS_MODEL):
+    """(critical, elevated) lower bounds: the two highest bands."""
+    return model['bands'][0][0], model['bands'][1][0]
+
+def get_risk_label(score, model=CRS_MODEL):
+    """(label, colour) of the highest band whose lower bound `score` reaches."""
+    for bound, label, colour in model['bands']:
+        if score >= bound:
+            return label, colour
+    return model['bands'][-1][1], model['bands'][-1][2]
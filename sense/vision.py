@@ -0,0 +1,410 @@
+"""
+Strip colorimetry pipeline: reduced-resolution decode, strip registration and
+ROI-first pad extraction. Pure OpenCV/NumPy, no Streamlit or database access.
+"""
+import io
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from sense.calibration import BIOMARKER_KEYS, CALIBRATION_LUT, THRESHOLDS, calibrate, color_to_value
+
+REFERENCE_STRIPS = ['normal.png', 'abnormal.png']
+
+# ROI-first extraction: blur + HSV only the five pad crops (plus the kernel
+# margin) instead of the whole photo. Interior pixels see the exact same 5x5
+# neighbourhood as in the full-frame path, so HSV means agree to within
+# ROI_PARITY_TOLERANCE (float summation order only).
+ROI_FIRST_EXTRACTION = True
+ROI_BLUR_KSIZE = (5, 5)
+ROI_BLUR_MARGIN = ROI_BLUR_KSIZE[0] // 2
+ROI_PARITY_TOLERANCE = 1e-6
+
+# Reduced-resolution decode: pad geometry is proportional to the frame, so a
+# libjpeg DCT-domain 1/2, 1/4 or 1/8 decode reads the same pads at a fraction
+# of the memory. The largest reduction that keeps the long side at or above
+# DECODE_TARGET_LONG_SIDE is chosen from the encoded header (None = always full).
+DECODE_TARGET_LONG_SIDE = 1600
+DECODE_SCALE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                      4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def probe_image_size(data):
+    """Reads (width, height) from a PNG IHDR or JPEG SOF header without decoding pixels; None if unknown."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if data[:2] != b'\xff\xd8':
+        return None
+    i, n = 2, len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        seg_len = int.from_bytes(data[i + 2:i + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(data[i + 7:i + 9], 'big'), int.from_bytes(data[i + 5:i + 7], 'big')
+        i += 2 + seg_len
+    return None
+
+def pick_decode_scale(size, target=DECODE_TARGET_LONG_SIDE):
+    """Largest supported reduction factor that keeps the long side >= target."""
+    if not size or not target:
+        return 1
+    long_side = max(size)
+    for f in (8, 4, 2):
+        if long_side / f >= target:
+            return f
+    return 1
+
+def strip_template_key(device, data, decode_target=DECODE_TARGET_LONG_SIDE):
+    """Template cache key, read from the encoded header so it is known before the worker decodes."""
+    size = probe_image_size(data)
+    return device, size, pick_decode_scale(size, decode_target)
+
+def decode_strip(data, target=DECODE_TARGET_LONG_SIDE, scale=None):
+    """Decodes strip bytes at the policy-selected (or forced) scale. Returns (BGR image or None, scale)."""
+    if scale is None:
+        scale = pick_decode_scale(probe_image_size(data), target)
+    return cv2.imdecode(np.frombuffer(data, np.uint8), DECODE_SCALE_FLAGS[scale]), scale
+
+def decode_scale_report(data, roi_first=ROI_FIRST_EXTRACTION):
+    """Per-biomarker drift of every reduced decode against the full-resolution decode of the same bytes."""
+    rows, ref = [], None
+    for scale in DECODE_SCALE_FLAGS:
+        t0 = time.perf_counter()
+        img, _ = decode_strip(data, scale=scale)
+        decode_ms = (time.perf_counter() - t0) * 1000
+        if img is None:
+            continue
+        vals, _ = analyze_strip(img, roi_first)
+        ref = ref or vals
+        row = {'Scale': f"1/{scale}", 'Decoded': f"{img.shape[1]}x{img.shape[0]}",
+               'Memory (MB)': round(img.nbytes / 1e6, 2), 'Decode (ms)': round(decode_ms, 1)}
+        for k, v, r in zip(BIOMARKER_KEYS, vals, ref):
+            row[f"Δ {THRESHOLDS[k]['label']}"] = round(v - r, 4)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def pad_boxes(w, h):
+    """Fixed strip geometry: one (x, y, x2, y2) rectangle per biomarker pad, or None if it falls off-frame."""
+    start_x, spacing, pad_w, pad_h, y_pos = int(w*0.05), int(w*0.18), int(w*0.12), int(h*0.40), int(h*0.30)
+    boxes = []
+    for i in range(len(BIOMARKER_KEYS)):
+        x = start_x + (i * spacing)
+        x2, y2 = min(x + pad_w, w), min(y_pos + pad_h, h)
+        boxes.append((x, y_pos, x2, y2) if x2 > x and y2 > y_pos else None)
+    return boxes
+
+def pad_hsv_means(img, boxes, roi_first=ROI_FIRST_EXTRACTION):
+    """
+    Mean HSV of each pad rectangle (None for off-frame pads).
+    roi_first=False is the original full-frame reference path.
+    """
+    h, w, _ = img.shape
+    if not roi_first:
+        hsv = cv2.cvtColor(cv2.GaussianBlur(img, ROI_BLUR_KSIZE, 0), cv2.COLOR_BGR2HSV)
+        return [np.mean(hsv[b[1]:b[3], b[0]:b[2]], axis=(0,1)) if b else None for b in boxes]
+
+    m = ROI_BLUR_MARGIN
+    means = []
+    for b in boxes:
+        if b is None:
+            means.append(None)
+            continue
+        x, y, x2, y2 = b
+        cx, cy = max(x - m, 0), max(y - m, 0)
+        crop = img[cy:min(y2 + m, h), cx:min(x2 + m, w)]
+        blur = cv2.GaussianBlur(crop, ROI_BLUR_KSIZE, 0)[y - cy:y2 - cy, x - cx:x2 - cx]
+        means.append(np.mean(cv2.cvtColor(blur, cv2.COLOR_BGR2HSV), axis=(0,1)))
+    return means
+
+def strip_hsv_means(img, roi_first=ROI_FIRST_EXTRACTION):
+    """
+    (5, 3) HSV pad means for a decoded BGR strip image (NaN rows for off-frame pads)
+    plus the pad rectangles that were actually sampled.
+    """
+    h, w, _ = img.shape
+    all_boxes = pad_boxes(w, h)
+    means = pad_hsv_means(img, all_boxes, roi_first)
+    hsv = np.array([m if m is not None else (np.nan, np.nan, np.nan) for m in means], dtype=np.float64)
+    return hsv, [b for b, m in zip(all_boxes, means) if m is not None]
+
+def analyze_strip(img, roi_first=ROI_FIRST_EXTRACTION, lut=None):
+    """
+    Runs the 5-pad ROI colorimetry chain on a decoded BGR strip image.
+    Returns the clinical values and the pad rectangles that were sampled.
+    """
+    hsv, boxes = strip_hsv_means(img, roi_first)
+    return calibrate(hsv[None], CALIBRATION_LUT if lut is None else lut)[0].tolist(), boxes
+
+# --- STRIP LOCALISATION & PERSPECTIVE REGISTRATION ---
+# The strip outline is searched for on a downscaled edge map, and only the
+# strip quad is warped into the canonical axis-aligned layout that the fixed
+# pad fractions above describe. Per-device quads are cached; a repeat capture
+# re-verifies the cached quad by probing edge contrast along its border and
+# skips the contour search when it still fits.
+STRIP_REGISTRATION = True
+STRIP_MIN_AREA_FRAC = 0.15
+STRIP_SEARCH_LONG_SIDE = 640
+STRIP_CANONICAL_MAX_W = 1200
+STRIP_EDGE_PROBES = 32
+STRIP_EDGE_PROBE_FRAC = 0.005
+STRIP_EDGE_MIN_CONTRAST = 30
+STRIP_EDGE_MIN_SUPPORT = 0.6
+
+def capture_device_id(data):
+    """Camera make/model from EXIF (header-only read); 'unknown' when the photo carries no EXIF."""
+    try:
+        exif = Image.open(io.BytesIO(data)).getexif()
+        device = f"{exif.get(0x010F, '')} {exif.get(0x0110, '')}".replace('\x00', '').strip()
+    except Exception:
+        device = ""
+    return device or "unknown"
+
+def order_quad(pts):
+    """Orders four corner points as top-left, top-right, bottom-right, bottom-left."""
+    pts = np.asarray(pts, dtype=np.float32).reshape(4, 2)
+    s, d = pts.sum(axis=1), np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+def locate_strip(img):
+    """Full search: largest convex quadrilateral outline in the frame, or None if no strip-sized quad exists."""
+    h, w = img.shape[:2]
+    f = min(1.0, STRIP_SEARCH_LONG_SIDE / max(h, w))
+    small = cv2.resize(img, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA) if f < 1 else img
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = STRIP_MIN_AREA_FRAC * small.shape[0] * small.shape[1]
+    for cnt in sorted(contours, key=cv2.contourArea, reverse=True):
+        if cv2.contourArea(cnt) < min_area:
+            break
+        approx = cv2.approxPolyDP(cnt, 0.02 * cv2.arcLength(cnt, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return order_quad(approx / f)
+    return None
+
+def template_matches(img, quad):
+    """Cheap re-verification of a cached quad: fraction of border probes that still sit on a strong edge."""
+    h, w = img.shape[:2]
+    t = np.linspace(0, 1, STRIP_EDGE_PROBES, endpoint=False)[:, None]
+    pts = np.concatenate([a + (b - a) * t for a, b in zip(quad, np.roll(quad, -1, axis=0))])
+    r = max(2, int(round(max(h, w) * STRIP_EDGE_PROBE_FRAC)))
+    off = np.arange(-r, r + 1)
+    ys = np.clip(np.rint(pts[:, 1])[:, None, None].astype(int) + off[None, :, None], 0, h - 1)
+    xs = np.clip(np.rint(pts[:, 0])[:, None, None].astype(int) + off[None, None, :], 0, w - 1)
+    gray = img[ys, xs].astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    contrast = np.ptp(gray.reshape(len(pts), -1), axis=1)
+    return float(np.mean(contrast > STRIP_EDGE_MIN_CONTRAST)) >= STRIP_EDGE_MIN_SUPPORT
+
+def warp_strip(img, quad):
+    """Warps only the strip quad into the canonical layout. Returns (strip image, homography)."""
+    tl, tr, br, bl = quad
+    sw = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    sh = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+    f = min(1.0, STRIP_CANONICAL_MAX_W / max(sw, 1))
+    cw, ch = max(int(sw * f), 1), max(int(sh * f), 1)
+    dst = np.array([(0, 0), (cw - 1, 0), (cw - 1, ch - 1), (0, ch - 1)], dtype=np.float32)
+    M = cv2.getPerspectiveTransform(quad, dst)
+    return cv2.warpPerspective(img, M, (cw, ch), flags=cv2.INTER_LINEAR), M
+
+def register_strip(img, template=None):
+    """
+    Locates the strip, reusing a cached device template when it still fits.
+    Returns (quad, reused) with quad None when no strip outline could be found.
+    """
+    if template is not None and template_matches(img, template):
+        return template, True
+    return locate_strip(img), False
+
+def scan_strip(img, template=None, roi_first=ROI_FIRST_EXTRACTION, registration=STRIP_REGISTRATION, lut=None):
+    """
+    Registration + ROI colorimetry for one decoded strip photo, trying the cached
+    device `template` quad first. Pads are returned as 4-point polygons in the
+    coordinates of `img` for the overlay.
+    """
+    quad, reused = register_strip(img, template) if registration else (None, False)
+
+    if quad is None:
+        hsv, boxes = strip_hsv_means(img, roi_first)
+        pads = [np.array([(x, y), (x2, y), (x2, y2), (x, y2)], dtype=np.float32) for x, y, x2, y2 in boxes]
+    else:
+        strip, M = warp_strip(img, quad)
+        hsv, boxes = strip_hsv_means(strip, roi_first)
+        corners = np.array([[(x, y), (x2, y), (x2, y2), (x, y2)] for x, y, x2, y2 in boxes], dtype=np.float32)
+        pads = list(cv2.perspectiveTransform(corners.reshape(-1, 1, 2), np.linalg.inv(M)).reshape(-1, 4, 2)) if boxes else []
+
+    vals = calibrate(hsv[None], CALIBRATION_LUT if lut is None else lut)[0].tolist()
+    return {'vals': vals, 'hsv': hsv, 'pads': pads, 'quad': quad, 'reused': reused}
+
+def draw_scan_overlay(img, scan, scale=1.0):
+    """Annotates the strip outline and sampled pads onto `img` in place (geometry multiplied by `scale`)."""
+    if scan['quad'] is not None:
+        cv2.polylines(img, [np.rint(scan['quad'] * scale).astype(np.int32)], True, (255, 209, 0), 2)
+    for pad in scan['pads']:
+        cv2.polylines(img, [np.rint(pad * scale).astype(np.int32)], True, (0, 255, 0), 3)
+    return img
+
+# --- MULTI-STRIP TRAY SCANNING ---
+# A camp tray holds 10-20 strips in one photo. Every strip-shaped quad is
+# found on one edge map, warped to the same canonical size and stacked, so the
+# blur / HSV conversion and all five pad means run once over the whole stack.
+TRAY_DECODE_TARGET = 3200
+TRAY_SEARCH_LONG_SIDE = 1600
+TRAY_LABEL_LONG_SIDE = 1600  # QR search cost grows steeply with resolution; labels stay readable here
+TRAY_MIN_STRIP_AREA_FRAC = 0.003
+TRAY_MAX_STRIP_AREA_FRAC = 0.5
+TRAY_MIN_ASPECT = 2.5
+TRAY_MAX_STRIPS = 24
+TRAY_STRIP_SIZE = (600, 120)  # canonical (w, h) of every warped strip
+
+def strip_quad_aspect(quad):
+    tl, tr, br, bl = quad
+    a = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+    b = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+    return max(a, b) / max(min(a, b), 1e-6), a >= b
+
+def locate_strips(img, max_strips=TRAY_MAX_STRIPS):
+    """
+    Every strip-shaped quad in a tray photo, in reading order (row by row, left to right).
+    Quads are rotated so their first edge runs along the strip: a vertical strip is
+    read top-to-bottom as if it lay left-to-right.
+    """
+    h, w = img.shape[:2]
+    f = min(1.0, TRAY_SEARCH_LONG_SIDE / max(h, w))
+    small = cv2.resize(img, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA) if f < 1 else img
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    frame_area = small.shape[0] * small.shape[1]
+    candidates = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if not TRAY_MIN_STRIP_AREA_FRAC * frame_area <= area <= TRAY_MAX_STRIP_AREA_FRAC * frame_area:
+            continue
+        approx = cv2.approxPolyDP(cnt, 0.02 * cv2.arcLength(cnt, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        quad = order_quad(approx / f)
+        aspect, horizontal = strip_quad_aspect(quad)
+        if aspect >= TRAY_MIN_ASPECT:
+            candidates.append((area, quad if horizontal else np.roll(quad, -1, axis=0)))
+
+    # The dilated outline of one strip yields nested contours; keep the outermost.
+    quads = []
+    for _, quad in sorted(candidates, key=lambda c: c[0], reverse=True):
+        centre = tuple(float(v) for v in quad.mean(axis=0))
+        if not any(cv2.pointPolygonTest(q.reshape(-1, 1, 2), centre, False) >= 0 for q in quads):
+            quads.append(quad)
+
+    if not quads:
+        return []
+    centres = np.array([q.mean(axis=0) for q in quads])
+    row_tol = 0.5 * np.median([np.ptp(q[:, 1]) for q in quads])
+    order, rows = np.argsort(centres[:, 1]), []
+    for i in order:
+        if rows and centres[i, 1] - centres[rows[-1][0], 1] <= row_tol:
+            rows[-1].append(i)
+        else:
+            rows.append([i])
+    return [quads[i] for row in rows for i in sorted(row, key=lambda j: centres[j, 0])][:max_strips]
+
+def warp_strips(img, quads, size=TRAY_STRIP_SIZE):
+    """(N, h, w, 3) stack of strips warped to the canonical size."""
+    w, h = size
+    dst = np.array([(0, 0), (w - 1, 0), (w - 1, h - 1), (0, h - 1)], dtype=np.float32)
+    return np.stack([cv2.warpPerspective(img, cv2.getPerspectiveTransform(q, dst), (w, h), flags=cv2.INTER_LINEAR) for q in quads])
+
+def tray_hsv_means(strips):
+    """
+    (N, 5, 3) pad HSV means for a canonical strip stack in one pass: the stack is
+    blurred and converted as a single mosaic (pads sit well clear of the seams)
+    and each pad is averaged across every strip at once.
+    """
+    n, h, w, _ = strips.shape
+    hsv = cv2.cvtColor(cv2.GaussianBlur(strips.reshape(n * h, w, 3), ROI_BLUR_KSIZE, 0), cv2.COLOR_BGR2HSV).reshape(n, h, w, 3)
+    return np.stack([hsv[:, y:y2, x:x2].reshape(n, -1, 3).mean(axis=1) for x, y, x2, y2 in pad_boxes(w, h)], axis=1)
+
+def read_tray_labels(img, quads):
+    """
+    PIDs printed as QR codes on or beside each strip. Each decoded code goes to
+    the strip whose outline is nearest its centre; strips without one get None.
+    """
+    labels = [None] * len(quads)
+    if not quads:
+        return labels
+    h, w = img.shape[:2]
+    f = min(1.0, TRAY_LABEL_LONG_SIDE / max(h, w))
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if f < 1:
+        gray = cv2.resize(gray, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA)
+    ok, texts, points, _ = cv2.QRCodeDetector().detectAndDecodeMulti(gray)
+    if not ok:
+        return labels
+    for text, pts in zip(texts, points):
+        if not text:
+            continue
+        centre = tuple(float(v) for v in pts.mean(axis=0) / f)
+        dist = [max(0.0, -cv2.pointPolygonTest(q.reshape(-1, 1, 2), centre, True)) for q in quads]
+        labels[int(np.argmin(dist))] = text.strip().upper()
+    return labels
+
+def draw_tray_overlay(img, quads, scale=1.0):
+    """Outlines and numbers every detected strip (slot numbers are 1-based) in place."""
+    for i, q in enumerate(quads, start=1):
+        pts = np.rint(q * scale).astype(np.int32)
+        cv2.polylines(img, [pts], True, (255, 209, 0), 2)
+        cv2.putText(img, str(i), tuple(int(v) for v in pts[0] + (4, 22)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    return img
+
+# Annotated result preview: the frame is downscaled first and annotated at
+# preview size, then encoded once, so the browser gets a few tens of KB instead
+# of a full-resolution RGB array re-encoded on every rerun.
+PREVIEW_MAX_SIDE = 960
+PREVIEW_FORMAT = '.jpg'
+PREVIEW_QUALITY = 80
+PREVIEW_QUALITY_FLAGS = {'.jpg': cv2.IMWRITE_JPEG_QUALITY, '.webp': cv2.IMWRITE_WEBP_QUALITY}
+
+def render_preview(img, scan=None, max_side=PREVIEW_MAX_SIDE, ext=PREVIEW_FORMAT, quality=PREVIEW_QUALITY, draw=None):
+    """
+    Encoded (JPEG/WebP) annotated preview, long side bounded by `max_side`.
+    Annotates a single-strip `scan`, or calls draw(preview, scale) for other layouts.
+    """
+    h, w = img.shape[:2]
+    f = min(1.0, max_side / max(h, w))
+    preview = cv2.resize(img, (max(int(w * f), 1), max(int(h * f), 1)), interpolation=cv2.INTER_AREA) if f < 1 else img.copy()
+    draw_scan_overlay(preview, scan, f) if draw is None else draw(preview, f)
+    ok, buf = cv2.imencode(ext, preview, [PREVIEW_QUALITY_FLAGS[ext], quality])
+    return buf.tobytes() if ok else None
+
+def compare_extraction_paths(paths=REFERENCE_STRIPS):
+    """Scores each reference strip through both extraction paths and reports per-pad drift and timing."""
+    rows = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        h, w, _ = img.shape
+        boxes = pad_boxes(w, h)
+        t0 = time.perf_counter()
+        full = pad_hsv_means(img, boxes, roi_first=False)
+        t1 = time.perf_counter()
+        roi = pad_hsv_means(img, boxes, roi_first=True)
+        t2 = time.perf_counter()
+        for k, a, b in zip(BIOMARKER_KEYS, full, roi):
+            if a is None or b is None:
+                continue
+            drift = float(np.max(np.abs(a - b)))
+            rows.append({'Strip': path, 'Marker': THRESHOLDS[k]['label'],
+                         'Full-Frame': color_to_value(a, k), 'ROI-First': color_to_value(b, k),
+                         'Max HSV Drift': drift, 'Within Tolerance': drift <= ROI_PARITY_TOLERANCE,
+                         'Full-Frame (ms)': round((t1 - t0) * 1000, 3), 'ROI-First (ms)': round((t2 - t1) * 1000, 3)})
+    return pd.DataFrame(rows)
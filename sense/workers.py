@@ -0,0 +1,307 @@
+"""
+Bounded process pool for strip analysis.
+
+Decode, registration, ROI extraction, calibration and CRS scoring are CPU
+bound and hold the GIL between OpenCV calls, so they run in separate worker
+processes instead of on the Streamlit script thread. Each worker pins OpenCV
+to one thread (the pool itself is the parallelism), submissions beyond the
+queue depth are refused or made to wait, and end-to-end job latency is kept
+for the telemetry panel.
+
+Workers are spawned by a small host process started as `python -m
+sense.workers`, not by the process that owns the pool. Spawn re-runs the
+parent's __main__ in every child, and under Streamlit that is the dashboard
+script itself; with the host as parent, workers only import this module.
+"""
+import itertools
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from sense.archive import StripArchive
+from sense.quality import QUALITY_GATE, QUALITY_MAX_GLARE_FRAC, assess_quality, glare_reason, pad_glare_fractions
+from sense.vision import (DECODE_TARGET_LONG_SIDE, ROI_FIRST_EXTRACTION, STRIP_REGISTRATION, TRAY_DECODE_TARGET, decode_strip,
+                          draw_tray_overlay, locate_strips, read_tray_labels, render_preview, scan_strip, tray_hsv_means,
+                          warp_strips)
+
+POOL_WORKERS = int(os.environ.get('SENSE_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+POOL_QUEUE_DEPTH = int(os.environ.get('SENSE_POOL_QUEUE_DEPTH', 4 * POOL_WORKERS))
+POOL_JOB_TIMEOUT_S = float(os.environ.get('SENSE_POOL_JOB_TIMEOUT_S', 30))
+POOL_LATENCY_WINDOW = 512
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when a non-blocking submit finds every queue slot taken."""
+
+def _init_worker():
+    cv2.setNumThreads(1)
+
+def analyze_job(data, decode_target=DECODE_TARGET_LONG_SIDE, roi_first=ROI_FIRST_EXTRACTION,
+                registration=STRIP_REGISTRATION, template=None, lut=None, quality_gate=QUALITY_GATE):
+    """
+    Worker task for the scan page: quality gate, then a full scan of one upload
+    plus the encoded annotated preview. A gated-out image returns only
+    {'rejected': True, 'quality': ...}. Returns None if the bytes cannot be decoded.
+    """
+    t0 = time.perf_counter()
+    quality = assess_quality(data) if quality_gate else None
+    if quality is not None and not quality['ok']:
+        return {'rejected': True, 'quality': quality}
+    img, decode_scale = decode_strip(data, decode_target)
+    if img is None:
+        return None
+    scan = scan_strip(img, template, roi_first, registration, lut)
+
+    return {'vals': scan['vals'], 'preview': render_preview(img, scan),
+            'decode_scale': decode_scale, 'registered': scan['quad'] is not None, 'reused': scan['reused'],
+            'quad': scan['quad'], 'quality': quality, 'rejected': False, 'worker_ms': (time.perf_counter() - t0) * 1000}
+
+def extract_job(data, decode_target=DECODE_TARGET_LONG_SIDE, template=None, quality_gate=QUALITY_GATE):
+    """
+    Worker task for batch uploads: quality gate, then decode + registration + ROI
+    extraction only. Calibration is left to the caller, which runs it once per
+    profile group. A gated-out image returns only {'rejected': True, 'quality': ...}.
+    """
+    t0 = time.perf_counter()
+    quality = assess_quality(data) if quality_gate else None
+    if quality is not None and not quality['ok']:
+        return {'rejected': True, 'quality': quality}
+    img, _ = decode_strip(data, decode_target)
+    if img is None:
+        raise ValueError("Unreadable image data")
+    scan = scan_strip(img, template)
+    return {'hsv': scan['hsv'], 'quad': scan['quad'], 'reused': scan['reused'], 'quality': quality, 'rejected': False,
+            'worker_ms': (time.perf_counter() - t0) * 1000}
+
+def tray_job(data, decode_target=TRAY_DECODE_TARGET, read_labels=False, quality_gate=QUALITY_GATE):
+    """
+    Worker task for tray photos: every strip is located, warped into one stack and
+    extracted in a single vectorised pass. Exposure and focus gate the whole photo;
+    glare is judged per strip, so one washed-out strip does not sink the tray.
+    Calibration is left to the caller (one calibrate() call for the whole tray).
+    """
+    t0 = time.perf_counter()
+    quality = assess_quality(data, glare=False) if quality_gate else None
+    if quality is not None and not quality['ok']:
+        return {'rejected': True, 'quality': quality}
+    img, decode_scale = decode_strip(data, decode_target)
+    if img is None:
+        raise ValueError("Unreadable image data")
+    quads = locate_strips(img)
+    if not quads:
+        return {'rejected': True, 'quality': {'ok': False, 'metrics': {}, 'timings_ms': {},
+                                              'reasons': ["No strips found: lay the tray flat on a plain background and fill the frame."]}}
+    strips = warp_strips(img, quads)
+    glare = pad_glare_fractions(strips).tolist() if quality_gate else [0.0] * len(quads)
+    return {'hsv': tray_hsv_means(strips), 'quads': [q * decode_scale for q in quads],
+            'labels': read_tray_labels(img, quads) if read_labels else [None] * len(quads),
+            'slot_reasons': [glare_reason(g) if g > QUALITY_MAX_GLARE_FRAC else None for g in glare],
+            'preview': render_preview(img, draw=lambda p, f: draw_tray_overlay(p, quads, f)),
+            'decode_scale': decode_scale, 'quality': quality, 'rejected': False, 'worker_ms': (time.perf_counter() - t0) * 1000}
+
+def rescan_job(archive_root, image_hash, decode_target=DECODE_TARGET_LONG_SIDE, tray_slot=None):
+    """
+    Worker task for re-analysis: extraction straight from the archive's memory
+    map, so only the hash crosses the process boundary. Tray readings re-locate
+    the tray and take their own 1-based slot.
+    """
+    t0 = time.perf_counter()
+    img, _ = StripArchive(archive_root).decode(image_hash, TRAY_DECODE_TARGET if tray_slot else decode_target)
+    if img is None:
+        raise ValueError("Unreadable archived image")
+    if not tray_slot:
+        return {'hsv': scan_strip(img)['hsv'], 'worker_ms': (time.perf_counter() - t0) * 1000}
+    quads = locate_strips(img)
+    if len(quads) < tray_slot:
+        raise ValueError(f"Tray slot {tray_slot} not found ({len(quads)} strips located)")
+    return {'hsv': tray_hsv_means(warp_strips(img, quads[tray_slot - 1:tray_slot]))[0],
+            'worker_ms': (time.perf_counter() - t0) * 1000}
+
+class ScanPool:
+    """
+    Analysis workers behind a bounded submission queue, with latency telemetry.
+    Jobs are pickled to the host process over its stdin and results come back
+    on its stdout; a reader thread settles the matching futures. A job holds
+    its queue slot until the host answers for it, so cancelling a future whose
+    job is already running on a worker does not free the slot early.
+    """
+
+    def __init__(self, max_workers=POOL_WORKERS, queue_depth=POOL_QUEUE_DEPTH):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')]))}
+        self._host = subprocess.Popen([sys.executable, '-m', 'sense.workers', str(max_workers)],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._lock = threading.Lock()
+        self._latency_ms = deque(maxlen=POOL_LATENCY_WINDOW)
+        self._counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'in_flight': 0}
+        self._reader = threading.Thread(target=self._read_results, name='scan-pool-results', daemon=True)
+        self._reader.start()
+
+    def submit(self, fn, *args, block=False, timeout=None):
+        """
+        Queues fn(*args) on a worker. With block=False a full queue raises
+        PoolSaturatedError immediately; with block=True the caller waits for a
+        slot (up to `timeout` seconds) instead.
+        """
+        acquired = self._slots.acquire(timeout=timeout) if block else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise PoolSaturatedError(f"Analysis queue is full ({self.queue_depth} jobs in flight)")
+
+        t0 = time.perf_counter()
+        fut, job_id = Future(), next(self._job_ids)
+        with self._lock:
+            self._jobs[job_id] = (fut, t0)
+        try:
+            self._send((job_id, fn, args))
+        except BaseException:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._slots.release()
+            raise
+        with self._lock:
+            self._counts['submitted'] += 1
+            self._counts['in_flight'] += 1
+        fut.add_done_callback(lambda f: self._on_done(f, job_id))
+        return fut
+
+    def _send(self, message):
+        with self._send_lock:
+            try:
+                pickle.dump(message, self._host.stdin, pickle.HIGHEST_PROTOCOL)
+                self._host.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                raise BrokenProcessPool("Analysis host process is not running") from None
+
+    def _read_results(self):
+        while True:
+            try:
+                job_id, ok, payload = pickle.load(self._host.stdout)
+            except (EOFError, OSError, pickle.UnpicklingError):
+                break
+            with self._lock:
+                fut, t0 = self._jobs.pop(job_id, (None, None))
+            if fut is None:
+                continue
+            if isinstance(payload, CancelledError):
+                fut.cancel()
+            elif fut.set_running_or_notify_cancel():
+                if ok:
+                    fut.set_result(payload)
+                else:
+                    fut.set_exception(payload)
+            self._release(fut, ok and not fut.cancelled(), t0)
+        with self._lock:
+            orphans, self._jobs = list(self._jobs.values()), {}
+        for fut, t0 in orphans:
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(BrokenProcessPool("Analysis host process exited"))
+            self._release(fut, False, t0)
+
+    def _on_done(self, fut, job_id):
+        # A cancel only reaches the host; the slot is freed once the host answers for the job.
+        if fut.cancelled():
+            try:
+                self._send((job_id, None, None))
+            except BrokenProcessPool:
+                pass
+
+    def _release(self, fut, ok, t0):
+        self._slots.release()
+        with self._lock:
+            self._counts['in_flight'] -= 1
+            if ok:
+                self._counts['completed'] += 1
+                self._latency_ms.append((time.perf_counter() - t0) * 1000)
+            else:
+                self._counts['failed'] += 1
+
+    def expected_latency_ms(self):
+        """Median of recent job latencies, or None before the first job completes."""
+        with self._lock:
+            return float(np.median(self._latency_ms)) if self._latency_ms else None
+
+    def stats(self):
+        with self._lock:
+            lat = np.array(self._latency_ms) if self._latency_ms else None
+            stats = {'workers': self.max_workers, 'queue_depth': self.queue_depth, **self._counts}
+        for label, q in (('p50_ms', 50), ('p95_ms', 95), ('p99_ms', 99)):
+            stats[label] = round(float(np.percentile(lat, q)), 1) if lat is not None else None
+        return stats
+
+    def shutdown(self, wait=True):
+        """Closes the host's stdin: queued jobs are cancelled and running ones finish first."""
+        with self._send_lock:
+            if not self._host.stdin.closed:
+                try:
+                    self._host.stdin.close()
+                except BrokenPipeError:
+                    pass
+        if wait:
+            self._host.wait()
+            self._reader.join()
+
+def _serve(max_workers):
+    """
+    Host process loop. Each (job_id, fn, args) read from stdin is queued on a
+    spawn-context ProcessPoolExecutor and answered with (job_id, ok, result or
+    exception) on stdout. fn None cancels job_id if it has not started; every
+    job is answered exactly once, a cancelled one with CancelledError. Stdout
+    is kept for results only, so workers' stray prints go to stderr.
+    """
+    requests, results = sys.stdin.buffer, os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker)
+    futures, lock = {}, threading.Lock()
+
+    def reply(job_id, fut):
+        with lock:
+            futures.pop(job_id, None)
+        exc = CancelledError() if fut.cancelled() else fut.exception()
+        try:
+            message = pickle.dumps((job_id, exc is None, fut.result() if exc is None else exc), pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            message = pickle.dumps((job_id, False, RuntimeError(f"Unpicklable job outcome: {exc or e!r}")))
+        with lock:
+            try:
+                results.write(message)
+                results.flush()
+            except OSError:
+                pass
+
+    while True:
+        try:
+            job_id, fn, args = pickle.load(requests)
+        except EOFError:
+            break
+        if fn is None:
+            with lock:
+                fut = futures.get(job_id)
+            if fut is not None:
+                fut.cancel()
+            continue
+        fut = executor.submit(fn, *args)
+        with lock:
+            futures[job_id] = fut
+        fut.add_done_callback(lambda f, job_id=job_id: reply(job_id, f))
+    executor.shutdown(wait=True, cancel_futures=True)
+
+if __name__ == '__main__':
+    _serve(int(sys.argv[1]))